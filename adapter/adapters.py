@@ -3,76 +3,288 @@ This module provides an APIManager class to handle
 different service types and fetch data accordingly.
 """
 
+import asyncio
+import contextlib
+import contextvars
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import requests
-from .tebt_services import TokenUrl, AppLogin, TebtPanValidate, TebtQuote, TebtPayment
-from .web_services import (
-    CscWebUrl, GetTokenUrl, GoogleRecaptcha, CloudFlare,
-    GoogleAuth, FacebookAuth, SsoToken, AppleAuth
-)
-from .crm_services import MsTokenGen, CrmLeadUrl, MobileCrmLeadUrl
-from .policy_services import (
-    ReceiptAccessToken, ReceiptDetails, ReceiptDetailsPdf,
-    AnnualPremiumStatement, UnitStatement
-)
-from .credit_score import CrifScore, ExperianScore, BankCloudUrl
-from .dedupe import DedupeService
+from asgiref.sync import sync_to_async
+from . import constants as config
+from . import circuit_breaker
+from . import latency
+from . import responses
+from . import sessions
+from .base import BatchResult
+from .concurrency import PRIORITY_BULK, PRIORITY_INTERACTIVE, priority_scope
+
+# Service type -> (module, adapter class, whether one instance can be shared by all calls).
+# Modules are imported on first use, so integrations that are never called are never loaded.
+ADAPTER_REGISTRY = {
+    'CRM_MS_TOKEN_GEN_URL': ('crm_services', 'MsTokenGen', True),
+    'CRM_LEADS_API_URL': ('crm_services', 'CrmLeadUrl', True),
+    'MOBILE_CRM_LEADS_API_URL': ('crm_services', 'MobileCrmLeadUrl', True),
+    'CRM_LEADS_QUEUE': ('crm_services', 'CrmLeadQueue', True),
+    'MOBILE_CRM_LEADS_QUEUE': ('crm_services', 'MobileCrmLeadQueue', True),
+    'CSC_WEB_SERVICE_URL': ('web_services', 'CscWebUrl', True),
+    'GENERATE_TOKEN_URL': ('tebt_services', 'TokenUrl', True),
+    'CP_APP_LOGIN_URL': ('tebt_services', 'AppLogin', True),
+    'RECEIPT_ACCESS_TOKEN_URL': ('policy_services', 'ReceiptAccessToken', True),
+    'RECIEPT_DETAILS_URL': ('policy_services', 'ReceiptDetails', True),
+    'RECIEPT_PDF_URL': ('policy_services', 'ReceiptDetailsPdf', True),
+    'ANNUAL_PREMIUM_STATEMENT_URL': ('policy_services', 'AnnualPremiumStatement', True),
+    'UNIT_STATEMENT_URL': ('policy_services', 'UnitStatement', True),
+    'CRIF_URL': ('credit_score', 'CrifScore', True),
+    'TEBT_PAN_VALIDATION': ('tebt_services', 'TebtPanValidate', True),
+    'GET_TOKEN_URL': ('web_services', 'GetTokenUrl', True),
+    'GOOGLE_RECAPTCHA_VERIFY_URL': ('web_services', 'GoogleRecaptcha', True),
+    'SSO_VALIDATE_TOKEN_URL': ('web_services', 'SsoToken', True),
+    'EXPERIAN_URL': ('credit_score', 'ExperianScore', True),
+    'CF_BASE_URL': ('web_services', 'CloudFlare', True),
+    'CF_PURGE_QUEUE': ('web_services', 'CloudFlarePurge', True),
+    'GOOGLE_AUTH_ENDPOINT': ('web_services', 'GoogleAuth', True),
+    'FACEBOOK_AUTH_ENDPOINT': ('web_services', 'FacebookAuth', True),
+    'APPLE_KEY_ENDPOINT': ('web_services', 'AppleAuth', True),
+    'TEBT_GET_QUOTE_URL': ('tebt_services', 'TebtQuote', True),
+    'TEBT_PAYMENT_RECEPT_POSTING_URL': ('tebt_services', 'TebtPayment', True),
+    'BANKCLOUD_FETCH_URL': ('credit_score', 'BankCloudUrl', True),
+    # DedupeService memoizes responses per request through dedupe.memo_scope.
+    'DedupeService': ('dedupe', 'DedupeService', True),
+}
+
+_adapter_instances = {}
+_adapter_lock = threading.Lock()
+
+def register_adapter(service_type, module, class_name, shared=True):
+    """
+    Register an adapter class, given by module path and class name, for a service type.
+
+    Module paths without a dot are taken relative to this package.
+    """
+    with _adapter_lock:
+        ADAPTER_REGISTRY[service_type] = (module, class_name, shared)
+        _adapter_instances.pop(service_type, None)
+
+def load_adapter_class(module, class_name):
+    """
+    Import the adapter module on first use and return the adapter class.
+    """
+    if '.' not in module:
+        module = f"{__package__}.{module}"
+    return getattr(importlib.import_module(module), class_name)
+
+def __getattr__(name):
+    """
+    Resolve adapter class names lazily, so ``from adapter.adapters import DedupeService`` works.
+    """
+    for module, class_name, _ in ADAPTER_REGISTRY.values():
+        if class_name == name:
+            return load_adapter_class(module, class_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """
+    Get the thread pool shared by all batch calls, creating it on first use.
+    """
+    global _batch_executor  # pylint: disable=global-statement
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=config.BATCH_MAX_WORKERS,
+                                                     thread_name_prefix='api-batch')
+    return _batch_executor
+
+def _batch_results(futures, done, deadline):
+    """
+    Collect the outcome of each batch job in order, cancelling those past the deadline.
+    """
+    results = []
+    for future in futures:
+        if future not in done:
+            future.cancel()
+            error = TimeoutError(f"Batch deadline of {deadline}s exceeded")
+            results.append(BatchResult(None, error))
+            continue
+        error = future.exception()
+        results.append(BatchResult(None if error else future.result(), error))
+    return results
 
 class APIManager:
     """
     APIManager class to handle different service types and fetch data.
     """
-    def __init__(self, service_type, payload=None, headers=None):
+    INTERACTIVE = PRIORITY_INTERACTIVE
+    BULK = PRIORITY_BULK
+
+    def __init__(self, service_type, payload=None, headers=None, priority=None):
         """
         Initialize APIManager with the given service type, payload, and headers.
+
+        ``priority`` is ``APIManager.INTERACTIVE`` for live customer requests or
+        ``APIManager.BULK`` for background jobs, whose upstream calls only use the
+        capacity left over by interactive traffic. It defaults to the priority of
+        the enclosing ``priority_scope``, interactive if none.
         """
         self.payload = payload
         self.headers = headers
+        self.priority = priority
         self.adapter = self.get_adapter(service_type)
 
     def get_adapter(self, service_type):
         """
         Get the appropriate adapter for the given service type.
+
+        Stateless adapters are created once and shared by all calls.
         """
-        adapters = {
-            'CRM_MS_TOKEN_GEN_URL': MsTokenGen,
-            'CRM_LEADS_API_URL': CrmLeadUrl,
-            'MOBILE_CRM_LEADS_API_URL': MobileCrmLeadUrl,
-            'CSC_WEB_SERVICE_URL': CscWebUrl,
-            'GENERATE_TOKEN_URL': TokenUrl,
-            'CP_APP_LOGIN_URL': AppLogin,
-            'RECEIPT_ACCESS_TOKEN_URL': ReceiptAccessToken,
-            'RECIEPT_DETAILS_URL': ReceiptDetails,
-            'RECIEPT_PDF_URL': ReceiptDetailsPdf,
-            'ANNUAL_PREMIUM_STATEMENT_URL': AnnualPremiumStatement,
-            'UNIT_STATEMENT_URL': UnitStatement,
-            'CRIF_URL': CrifScore,
-            'TEBT_PAN_VALIDATION': TebtPanValidate,
-            'GET_TOKEN_URL': GetTokenUrl,
-            'GOOGLE_RECAPTCHA_VERIFY_URL': GoogleRecaptcha,
-            'SSO_VALIDATE_TOKEN_URL': SsoToken,
-            'EXPERIAN_URL': ExperianScore,
-            'CF_BASE_URL': CloudFlare,
-            'GOOGLE_AUTH_ENDPOINT': GoogleAuth,
-            'FACEBOOK_AUTH_ENDPOINT': FacebookAuth,
-            'APPLE_KEY_ENDPOINT': AppleAuth,
-            'TEBT_GET_QUOTE_URL': TebtQuote,
-            'TEBT_PAYMENT_RECEPT_POSTING_URL': TebtPayment,
-            'BANKCLOUD_FETCH_URL': BankCloudUrl,
-            'DedupeService': DedupeService
-        }
-        if service_type in adapters:
-            return adapters[service_type]()
-        raise ValueError(f"Unsupported service type: {service_type}")
+        adapter = _adapter_instances.get(service_type)
+        if adapter is not None:
+            return adapter
+        if service_type not in ADAPTER_REGISTRY:
+            raise ValueError(f"Unsupported service type: {service_type}")
+        module, class_name, shared = ADAPTER_REGISTRY[service_type]
+        adapter_class = load_adapter_class(module, class_name)
+        if not shared:
+            return adapter_class()
+        with _adapter_lock:
+            adapter = _adapter_instances.get(service_type)
+            if adapter is None:
+                adapter = adapter_class()
+                _adapter_instances[service_type] = adapter
+        return adapter
+
+    def get_fetch_args(self):
+        """
+        Get the positional arguments passed to the adapter's fetch method.
+        """
+        if self.payload and self.headers:
+            return (self.payload, self.headers)
+        if self.payload:
+            return (self.payload,)
+        return ()
 
     def get_data(self):
         """
         Fetch data using the appropriate adapter.
         """
         try:
-            if self.payload and self.headers:
-                return self.adapter.fetch_data(self.payload, self.headers)
-            if self.payload:
-                return self.adapter.fetch_data(self.payload)
-            return self.adapter.fetch_data()
+            with self.priority_scope():
+                return self.adapter.fetch_data(*self.get_fetch_args())
+        except requests.RequestException as e:
+            return {"error": str(e)}
+
+    async def aget_data(self):
+        """
+        Fetch data using the appropriate adapter without blocking the event loop.
+
+        Adapters providing ``afetch_data`` send their request through the pooled
+        async client; the others run their blocking ``fetch_data`` in a worker thread.
+        Either way the result is the one ``get_data`` returns: the ``httpx.Response``
+        of the async client is converted into a ``requests.Response``.
+        """
+        args = self.get_fetch_args()
+        try:
+            with self.priority_scope():
+                if hasattr(self.adapter, 'afetch_data'):
+                    return responses.as_requests(await self.adapter.afetch_data(*args))
+                return await sync_to_async(self.adapter.fetch_data,
+                                           thread_sensitive=False)(*args)
         except requests.RequestException as e:
             return {"error": str(e)}
+
+    def priority_scope(self):
+        """
+        Return a context applying this call's priority to the upstream calls made inside it.
+        """
+        if self.priority is None:
+            return contextlib.nullcontext()
+        return priority_scope(self.priority)
+
+    @staticmethod
+    def pool_stats():
+        """
+        Return connection pool statistics for every upstream host.
+        """
+        return sessions.pool_stats()
+
+    @staticmethod
+    def circuit_stats():
+        """
+        Return the circuit breaker state of every upstream host.
+        """
+        return circuit_breaker.breaker_stats()
+
+    @staticmethod
+    def latency_stats():
+        """
+        Return observed latency percentiles for every upstream service.
+        """
+        return latency.latency_stats()
+
+    @staticmethod
+    def concurrency_stats():
+        """
+        Return the adaptive concurrency limit, queue depth and per-priority wait
+        times for every upstream host.
+        """
+        return sessions.concurrency_stats()
+
+    @classmethod
+    def run_job(cls, job):
+        """
+        Run a single batch job, either a callable or a
+        (service_type, payload, headers, priority) tuple.
+        """
+        if callable(job):
+            return job()
+        return cls(*job).get_data()
+
+    @classmethod
+    async def arun_job(cls, job):
+        """
+        Run a single batch job without blocking the event loop.
+        """
+        if callable(job):
+            if asyncio.iscoroutinefunction(job):
+                return await job()
+            return await sync_to_async(job, thread_sensitive=False)()
+        return await cls(*job).aget_data()
+
+    @classmethod
+    def get_batch_data(cls, jobs, deadline=None):
+        """
+        Fetch data for several jobs concurrently on the shared, bounded thread pool.
+
+        Each job is a ``(service_type, payload, headers, priority)`` tuple, where
+        payload, headers and priority are optional, or a callable taking no
+        arguments such as ``functools.partial(DedupeService().get_exide_life_policy, user)``.
+        Jobs run with the caller's ``priority_scope`` unless they set their own.
+
+        Returns a list of ``BatchResult(result, error)`` in the order of the jobs once
+        every job finished or ``deadline`` seconds passed; jobs still running at the
+        deadline get a ``TimeoutError``.
+        """
+        deadline = config.BATCH_DEADLINE if deadline is None else deadline
+        executor = get_batch_executor()
+        futures = [executor.submit(contextvars.copy_context().run, cls.run_job, job)
+                   for job in jobs]
+        done, _ = wait(futures, timeout=deadline)
+        return _batch_results(futures, done, deadline)
+
+    @classmethod
+    async def aget_batch_data(cls, jobs, deadline=None):
+        """
+        Fetch data for several jobs concurrently on the running event loop.
+
+        Takes the same jobs and returns the same results as ``get_batch_data``;
+        coroutine functions are awaited directly.
+        """
+        deadline = config.BATCH_DEADLINE if deadline is None else deadline
+        tasks = [asyncio.ensure_future(cls.arun_job(job)) for job in jobs]
+        if not tasks:
+            return []
+        done, _ = await asyncio.wait(tasks, timeout=deadline)
+        return _batch_results(tasks, done, deadline)
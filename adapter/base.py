@@ -0,0 +1,52 @@
+"""
+Module defining the base class shared by adapters that make a single HTTP call.
+
+Such adapters only describe their request in ``build_request``; the blocking
+``fetch_data`` and the asyncio ``afetch_data`` both send that same request,
+through the pooled session or the pooled async client respectively.
+Requests are tagged with the adapter's class name, so each adapter gets a
+timeout adapted to its own observed latency.
+"""
+
+from collections import namedtuple
+from . import sessions
+
+BatchResult = namedtuple('BatchResult', ['result', 'error'])
+
+
+class RequestAdapter:
+    """
+    Base class for adapters whose call is a single HTTP request.
+
+    Subclasses implement ``build_request`` taking the same arguments as
+    ``fetch_data`` and returning the keyword arguments of
+    ``sessions.request``: ``method``, ``url`` and any of ``data``, ``json``,
+    ``headers``, ``timeout`` and ``verify``. The ``timeout`` is the ceiling of
+    the adaptive timeout.
+    """
+
+    def build_request(self, *args):
+        """
+        Builds the request for the given arguments.
+        """
+        raise NotImplementedError
+
+    def prepare_request(self, *args):
+        """
+        Builds the request and names the service its latency is tracked under.
+        """
+        request = self.build_request(*args)
+        request.setdefault('service', type(self).__name__)
+        return request
+
+    def fetch_data(self, *args):
+        """
+        Sends the request and returns the ``requests.Response``.
+        """
+        return sessions.request(**self.prepare_request(*args))
+
+    async def afetch_data(self, *args):
+        """
+        Sends the request without blocking the event loop and returns the ``httpx.Response``.
+        """
+        return await sessions.arequest(**self.prepare_request(*args))
@@ -0,0 +1,274 @@
+"""
+Module providing a coalescer for Cloudflare cache purges.
+
+Purges are collected for ``CF_PURGE_WINDOW`` seconds after the first one
+arrives, deduplicated, and sent as purge requests of up to
+``CF_PURGE_MAX_BATCH`` files, tags, hosts or prefixes each. A batch is sent
+before the window ends once ``CF_PURGE_MAX_BATCH`` items of one type are
+waiting. A ``purge_everything`` request supersedes every other pending
+purge. When ``CF_PURGE_CALL`` is off, collected purges are logged and
+dropped instead of being sent.
+
+Purges rejected with a 429 or 5xx status, or lost to a transport error,
+are sent again with the next batch, up to ``CF_PURGE_MAX_ATTEMPTS`` times.
+The requests of a flush that were not sent yet are queued again as well,
+without using an attempt, and no batch is sent before the ``Retry-After``
+delay Cloudflare gives, even when a full batch is waiting. A request
+rejected as invalid (``CF_PURGE_SPLIT_STATUSES``) is split in halves and
+each half sent on its own, so one invalid item fails alone; any other
+rejection, such as a bad API token, fails the whole request.
+
+Classes:
+- PurgeCoalescer: Collects purges and sends them in batches.
+"""
+
+import json
+import threading
+import time
+from shared_config.logging import custom_log
+from . import constants as config
+
+PURGE_TYPES = ('files', 'tags', 'hosts', 'prefixes')
+
+
+def _item_key(item):
+    """
+    Returns the dedupe key of a purge item; files may be URLs or dicts with headers.
+    """
+    if isinstance(item, dict):
+        return json.dumps(item, sort_keys=True)
+    return item
+
+
+class PurgeCoalescer:
+    """
+    Collects Cloudflare purges over a short window and sends them in batches.
+
+    ``send`` posts one purge request body and returns the response.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self._pending = {purge_type: {} for purge_type in PURGE_TYPES}
+        self._purge_everything = False
+        self._attempts = {}
+        self._timer = None
+        self._due_at = None
+        self._hold_until = 0.0
+        self._lock = threading.Lock()
+        self.stats_counts = {'received': 0, 'duplicates': 0, 'requests': 0,
+                             'skipped': 0, 'failed': 0}
+
+    def add(self, files=None, tags=None, hosts=None, prefixes=None, purge_everything=False):
+        """
+        Queues items to purge; accepts the fields of a Cloudflare purge request body.
+        """
+        items = {'files': files, 'tags': tags, 'hosts': hosts, 'prefixes': prefixes}
+        with self._lock:
+            full = False
+            for purge_type, values in items.items():
+                pending = self._pending[purge_type]
+                for item in values or ():
+                    self.stats_counts['received'] += 1
+                    key = _item_key(item)
+                    if key in pending:
+                        self.stats_counts['duplicates'] += 1
+                    pending[key] = item
+                full = full or len(pending) >= config.CF_PURGE_MAX_BATCH
+            self._purge_everything = self._purge_everything or purge_everything
+            self._schedule(0 if full else config.CF_PURGE_WINDOW)
+
+    def add_paths(self, paths, domains=None):
+        """
+        Queues the given URL paths for purging on every domain in ``domains``.
+        """
+        domains = domains or config.CF_PURGE_DOMAINS
+        self.add(files=[f"https://{domain}{path}" for path in paths for domain in domains])
+
+    def _schedule(self, delay, hold=False):
+        """
+        Schedules a flush in ``delay`` seconds unless one is due sooner. Must hold the lock.
+
+        With ``hold`` no flush is scheduled before the delay ends, delaying one
+        that is due sooner.
+        """
+        now = time.monotonic()
+        if hold:
+            self._hold_until = max(self._hold_until, now + delay)
+        due_at = max(now + delay, self._hold_until)
+        if self._timer is not None:
+            if self._hold_until <= self._due_at <= due_at:
+                return
+            self._timer.cancel()
+        self._timer = threading.Timer(due_at - now, self._on_timer)
+        self._timer.daemon = True
+        self._due_at = due_at
+        self._timer.start()
+
+    def _on_timer(self):
+        """
+        Sends every pending purge unless the timer was replaced since it started.
+        """
+        with self._lock:
+            if self._timer is not threading.current_thread():
+                return
+            batches = self._take_batches()
+        self._send_batches(batches)
+
+    def flush(self):
+        """
+        Sends every pending purge now, from the calling thread.
+        """
+        with self._lock:
+            batches = self._take_batches()
+        self._send_batches(batches)
+
+    def _take_batches(self):
+        """
+        Empties the pending purges and cancels the timer. Must hold the lock.
+
+        Returns the (purge type, items) of every non-empty purge type.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._due_at = None
+        pending = self._pending
+        purge_everything = self._purge_everything
+        self._pending = {purge_type: {} for purge_type in PURGE_TYPES}
+        self._purge_everything = False
+        if purge_everything:
+            return [('purge_everything', [])]
+        return [(purge_type, list(items.items()))
+                for purge_type, items in pending.items() if items]
+
+    def _send_batches(self, batches):
+        """
+        Sends the items of each purge type in requests of up to ``CF_PURGE_MAX_BATCH``.
+
+        Stops at the first request that may succeed later, queueing the
+        unsent items again, and returns False; returns True otherwise.
+        """
+        step = config.CF_PURGE_MAX_BATCH
+        for index, (purge_type, items) in enumerate(batches):
+            for start in range(0, max(len(items), 1), step):
+                if not self._send_batch(purge_type, items[start:start + step]):
+                    unsent = [(purge_type, items[start + step:])] + batches[index + 1:]
+                    self._restore([(kind, rest) for kind, rest in unsent if rest])
+                    return False
+        return True
+
+    def _send_batch(self, purge_type, items):
+        """
+        Sends one purge request, queueing its items again or splitting it if it fails.
+
+        Returns False when the request failed in a way that may succeed later.
+        """
+        if purge_type == 'purge_everything':
+            body = {'purge_everything': True}
+        else:
+            body = {purge_type: [item for _, item in items]}
+        if not config.CF_PURGE_CALL:
+            self._count('skipped')
+            custom_log(level='info', request=None,
+                       params={'detail': 'Cloudflare purge skipped, CF_PURGE_CALL is off.',
+                               'body': body})
+            return True
+        retry_after = None
+        try:
+            self._count('requests')
+            response = self.send(body)
+            if response.status_code < 300:
+                self._forget(items)
+                return True
+            error = f'Purge rejected with {response.status_code}'
+            retryable = response.status_code == 429 or response.status_code >= 500
+            splittable = response.status_code in config.CF_PURGE_SPLIT_STATUSES
+            retry_after = response.headers.get('Retry-After')
+        except Exception as e:  # pylint: disable=broad-except
+            error = repr(e)
+            retryable = True
+            splittable = False
+        custom_log(level='error', request=None,
+                   params={'detail': 'Cloudflare purge failed.',
+                           'body': {'error_msg': error, 'request': body}})
+        if purge_type == 'purge_everything':
+            items = [(purge_type, None)]
+        if retryable:
+            self._requeue(purge_type, items, retry_after)
+            return False
+        if splittable and len(items) > 1:
+            middle = len(items) // 2
+            return self._send_batches([(purge_type, items[:middle]),
+                                       (purge_type, items[middle:])])
+        self._forget(items)
+        self._count('failed', len(items))
+        return True
+
+    def _count(self, counter, amount=1):
+        """
+        Adds to one of the request counters.
+        """
+        with self._lock:
+            self.stats_counts[counter] += amount
+
+    def _forget(self, items):
+        """
+        Drops the attempt counts of items that were sent or given up on.
+        """
+        with self._lock:
+            for key, _ in items:
+                self._attempts.pop(key, None)
+
+    def _restore(self, batches):
+        """
+        Queues items that were not sent again, without counting an attempt.
+        """
+        with self._lock:
+            for purge_type, items in batches:
+                if purge_type == 'purge_everything':
+                    self._purge_everything = True
+                    continue
+                for key, item in items:
+                    self._pending[purge_type].setdefault(key, item)
+            if self._has_pending():
+                self._schedule(config.CF_PURGE_WINDOW)
+
+    def _requeue(self, purge_type, items, retry_after):
+        """
+        Queues the items of a failed request again until they run out of attempts.
+        """
+        with self._lock:
+            for key, item in items:
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= config.CF_PURGE_MAX_ATTEMPTS:
+                    self._attempts.pop(key, None)
+                    self.stats_counts['failed'] += 1
+                    continue
+                self._attempts[key] = attempts
+                if purge_type == 'purge_everything':
+                    self._purge_everything = True
+                else:
+                    self._pending[purge_type][key] = item
+            if not self._has_pending():
+                return
+            try:
+                self._schedule(max(float(retry_after), config.CF_PURGE_WINDOW), hold=True)
+            except (TypeError, ValueError):
+                self._schedule(config.CF_PURGE_WINDOW)
+
+    def _has_pending(self):
+        """
+        Returns whether any purge is waiting. Must hold the lock.
+        """
+        return self._purge_everything or any(self._pending.values())
+
+    def stats(self):
+        """
+        Returns the number of purges pending per type and the request counters.
+        """
+        with self._lock:
+            stats = {purge_type: len(items) for purge_type, items in self._pending.items()}
+            stats['purge_everything'] = self._purge_everything
+            stats.update(self.stats_counts)
+        return stats
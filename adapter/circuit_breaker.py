@@ -0,0 +1,200 @@
+"""
+Module providing per-upstream circuit breakers.
+
+Each upstream host has a breaker that counts failed calls (transport errors,
+5xx replies and calls slower than ``CIRCUIT_SLOW_CALL_SECONDS``) over the
+last ``CIRCUIT_WINDOW`` seconds. Once at least ``CIRCUIT_MIN_CALLS`` calls
+were made and ``CIRCUIT_FAILURE_RATIO`` of them failed, the circuit opens:
+calls to the host fail immediately with a ``GenericException`` carrying
+``RETRYABLE_CODE['API_UNREACHABLE']`` instead of waiting for a timeout.
+After ``CIRCUIT_OPEN_SECONDS`` the circuit is half-open and lets
+``CIRCUIT_HALF_OPEN_PROBES`` calls through; a successful probe closes it, a
+failed one opens it again.
+
+Opening is published in the Django cache so every worker fast-fails the
+host; workers check the shared state at most every ``CIRCUIT_SYNC_INTERVAL``.
+
+Classes:
+- CircuitBreaker: Tracks the health of one upstream host.
+
+Functions:
+- get_breaker(host): Returns the breaker of a host.
+- breaker_stats(): Returns the state of every breaker for monitoring.
+"""
+
+import threading
+import time
+from collections import deque
+from django.core.cache import caches
+from shared_config.exceptions import GenericException
+from shared_config.exception_constants import RETRYABLE_CODE, STATUS_TYPE
+from shared_config.logging import custom_log
+from . import constants as config
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of one upstream host and fast-fails calls while it is down.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.state = CLOSED
+        self.open_until = 0
+        self.probes = 0
+        self._outcomes = deque()
+        self._synced_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self):
+        """
+        Returns the Django cache key of the shared open state.
+        """
+        return "CIRCUIT_OPEN_" + self.host
+
+    def before_call(self, url=None):
+        """
+        Raises GenericException while the circuit is open.
+
+        Returns True when the call is a half-open probe, which must be reported to
+        ``record`` like any other call.
+        """
+        now = time.time()
+        with self._lock:
+            self._sync_shared(now)
+            if self.state == OPEN:
+                if now < self.open_until:
+                    raise self._open_error(url)
+                self.state = HALF_OPEN
+                self.probes = 0
+            if self.state == HALF_OPEN:
+                if self.probes >= config.CIRCUIT_HALF_OPEN_PROBES:
+                    raise self._open_error(url)
+                self.probes += 1
+                return True
+        return False
+
+    def record(self, success, probe=False):
+        """
+        Records the outcome of a call, opening or closing the circuit as needed.
+        """
+        now = time.time()
+        with self._lock:
+            if probe:
+                self.probes = max(self.probes - 1, 0)
+                if success:
+                    self._close()
+                else:
+                    self._open(now)
+                return
+            if self.state != CLOSED:
+                return
+            outcomes = self._outcomes
+            outcomes.append((now, success))
+            while outcomes and outcomes[0][0] < now - config.CIRCUIT_WINDOW:
+                outcomes.popleft()
+            failures = sum(1 for _, succeeded in outcomes if not succeeded)
+            if len(outcomes) >= config.CIRCUIT_MIN_CALLS and \
+                    failures / len(outcomes) >= config.CIRCUIT_FAILURE_RATIO:
+                self._open(now)
+
+    def cancel_probe(self):
+        """
+        Gives back the slot of a probe call that was abandoned before it completed.
+        """
+        with self._lock:
+            self.probes = max(self.probes - 1, 0)
+
+    def stats(self):
+        """
+        Returns the state of the breaker and the calls in its window.
+        """
+        with self._lock:
+            failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+            return {'state': self.state, 'open_until': self.open_until,
+                    'calls': len(self._outcomes), 'failures': failures}
+
+    def _open(self, now):
+        """
+        Opens the circuit and publishes it to the other workers.
+        """
+        self.state = OPEN
+        self.open_until = now + config.CIRCUIT_OPEN_SECONDS
+        self._outcomes.clear()
+        custom_log(level='error', request=None,
+                   params={'detail': f'Circuit opened for {self.host}.', 'body': {}})
+        self._shared_call('set', self.cache_key, self.open_until,
+                          timeout=config.CIRCUIT_OPEN_SECONDS)
+
+    def _close(self):
+        """
+        Closes the circuit and clears the shared open state.
+        """
+        self.state = CLOSED
+        self.open_until = 0
+        self._outcomes.clear()
+        self._shared_call('delete', self.cache_key)
+
+    def _sync_shared(self, now):
+        """
+        Adopts an open state published by another worker.
+        """
+        if self.state != CLOSED or now - self._synced_at < config.CIRCUIT_SYNC_INTERVAL:
+            return
+        self._synced_at = now
+        open_until = self._shared_call('get', self.cache_key)
+        if open_until and open_until > now:
+            self.state = OPEN
+            self.open_until = open_until
+            self._outcomes.clear()
+
+    @staticmethod
+    def _shared_call(method, *args, **kwargs):
+        """
+        Calls the shared cache, never letting a cache failure break the upstream call.
+        """
+        try:
+            return getattr(caches[config.CIRCUIT_CACHE_ALIAS], method)(*args, **kwargs)
+        except Exception as e:  # pylint: disable=broad-except
+            custom_log(level='error', request=None,
+                       params={'detail': 'Circuit breaker cache call failed.',
+                               'body': {'error_msg': repr(e)}})
+            return None
+
+    def _open_error(self, url):
+        """
+        Builds the exception raised for calls made while the circuit is open.
+
+        The query string is dropped from the URL, as some carry access tokens.
+        """
+        return GenericException(status_type=STATUS_TYPE['APP'],
+                                exception_code=RETRYABLE_CODE['API_UNREACHABLE'],
+                                detail=f'Circuit open for {self.host}, call not attempted.',
+                                response_msg=config.WEBSITE_ERROR,
+                                request=None, url=url and url.split('?', 1)[0])
+
+
+def get_breaker(host):
+    """
+    Returns the circuit breaker of the host, creating it on first use.
+    """
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host))
+    return breaker
+
+
+def breaker_stats():
+    """
+    Returns the state of every circuit breaker keyed by host.
+    """
+    return {host: breaker.stats() for host, breaker in list(_breakers.items())}
@@ -0,0 +1,286 @@
+"""
+Module providing per-upstream adaptive concurrency limits and priority scheduling.
+
+Each upstream host has a limiter bounding the calls in flight to it. The
+limit follows additive-increase/multiplicative-decrease: every healthy call
+raises it by ``1 / limit`` (about one per round of calls), while a failed
+call, or one slower than ``CONCURRENCY_LATENCY_TOLERANCE`` times the
+service's baseline latency, multiplies it by ``CONCURRENCY_BACKOFF``. Only
+calls started after the last decrease can decrease it again, so one burst
+of slow replies backs off once rather than collapsing the limit.
+
+The baseline is the ``CONCURRENCY_BASELINE_PERCENTILE`` latency of the
+service's 2xx replies over the rolling latency window. Fast rejections such
+as 4xx replies are not fed to it, and a single fast reply cannot drag it
+down. Until the window holds ``LATENCY_MIN_SAMPLES`` replies only failures
+decrease the limit.
+
+Calls are either interactive (live customer requests, the default) or bulk
+(nightly jobs and back-fills). ``CONCURRENCY_INTERACTIVE_RESERVE`` of each
+host's limit is kept for interactive calls, bulk calls share the rest and
+never take a slot while an interactive call is waiting. The priority of the
+calls made by the current thread or task is set with ``priority_scope``.
+
+Callers beyond the limit wait up to ``CONCURRENCY_QUEUE_TIMEOUT`` (bulk:
+``CONCURRENCY_BULK_QUEUE_TIMEOUT``) for a slot; when ``CONCURRENCY_MAX_QUEUE``
+callers of their priority are already waiting, or the wait times out, a
+GenericException with ``RETRYABLE_CODE['API_UNREACHABLE']`` is raised.
+
+Classes:
+- ConcurrencyLimiter: Adaptive concurrency limit of one upstream host.
+
+Functions:
+- priority_scope(priority): Sets the priority of the calls made inside the block.
+- current_priority(): Returns the priority of calls made now.
+- get_limiter(host): Returns the limiter of a host.
+- limiter_stats(): Returns the limit, queue depth and wait times of every host.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from shared_config.exceptions import GenericException
+from shared_config.exception_constants import RETRYABLE_CODE, STATUS_TYPE
+from . import constants as config
+from .latency import LatencyTracker
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BULK = 'bulk'
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+_priority = contextvars.ContextVar('adapter_call_priority', default=PRIORITY_INTERACTIVE)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+@contextmanager
+def priority_scope(priority):
+    """
+    Sets the priority of the upstream calls made inside the block.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unsupported priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    """
+    Returns the priority of upstream calls made by the current thread or task.
+    """
+    return _priority.get()
+
+
+def _queue_timeout(priority):
+    """
+    Returns the longest wait for a slot of the priority.
+    """
+    if priority == PRIORITY_BULK:
+        return config.CONCURRENCY_BULK_QUEUE_TIMEOUT
+    return config.CONCURRENCY_QUEUE_TIMEOUT
+
+
+class ConcurrencyLimiter:
+    """
+    Adaptive concurrency limit of one upstream host, shared by interactive and bulk calls.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.limit = float(config.CONCURRENCY_INITIAL_LIMIT)
+        self.in_flight = 0
+        self.rejected = 0
+        self.waiting = dict.fromkeys(PRIORITIES, 0)
+        self._waits = {priority: {'calls': 0, 'total': 0.0, 'max': 0.0}
+                       for priority in PRIORITIES}
+        self._baselines = {}
+        self._decreased_at = 0
+        self._cond = threading.Condition()
+
+    def _has_room(self, priority):
+        """
+        Returns whether a call of the priority may start. Must hold the condition.
+        """
+        limit = int(self.limit)
+        if priority == PRIORITY_INTERACTIVE:
+            return self.in_flight < limit
+        if self.waiting[PRIORITY_INTERACTIVE]:
+            return False
+        reserve = int(limit * config.CONCURRENCY_INTERACTIVE_RESERVE)
+        return self.in_flight < max(limit - reserve, 1)
+
+    def _take(self, priority, arrived):
+        """
+        Takes a slot and records the caller's wait. Must hold the condition.
+        """
+        self.in_flight += 1
+        now = time.monotonic()
+        waits = self._waits[priority]
+        waits['calls'] += 1
+        waits['total'] += now - arrived
+        waits['max'] = max(waits['max'], now - arrived)
+        return now
+
+    def try_acquire(self, priority=None, arrived=None):
+        """
+        Takes a slot if one is free for the priority, returning its ticket, or None.
+        """
+        priority = priority or current_priority()
+        with self._cond:
+            if self._has_room(priority):
+                return self._take(priority, arrived or time.monotonic())
+        return None
+
+    def acquire(self, url=None, priority=None):
+        """
+        Takes a slot, waiting up to the priority's queue timeout for one.
+
+        Returns the ticket to hand back to ``release``.
+        """
+        priority = priority or current_priority()
+        arrived = time.monotonic()
+        deadline = arrived + _queue_timeout(priority)
+        with self._cond:
+            if not self._has_room(priority):
+                self._enqueue(url, priority)
+                try:
+                    while not self._has_room(priority):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            raise self._rejected_error(url)
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting[priority] -= 1
+                    self._cond.notify_all()
+            return self._take(priority, arrived)
+
+    async def aacquire(self, url=None, priority=None):
+        """
+        Takes a slot without blocking the event loop, polling while the host is saturated.
+        """
+        priority = priority or current_priority()
+        arrived = time.monotonic()
+        ticket = self.try_acquire(priority, arrived)
+        if ticket is not None:
+            return ticket
+        deadline = arrived + _queue_timeout(priority)
+        with self._cond:
+            self._enqueue(url, priority)
+        try:
+            while True:
+                await asyncio.sleep(config.CONCURRENCY_POLL_INTERVAL)
+                with self._cond:
+                    if self._has_room(priority):
+                        return self._take(priority, arrived)
+                if time.monotonic() >= deadline:
+                    with self._cond:
+                        self.rejected += 1
+                    raise self._rejected_error(url)
+        finally:
+            with self._cond:
+                self.waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def _enqueue(self, url, priority):
+        """
+        Counts a waiting caller, rejecting it when its queue is full. Must hold the condition.
+        """
+        if self.waiting[priority] >= config.CONCURRENCY_MAX_QUEUE:
+            self.rejected += 1
+            raise self._rejected_error(url)
+        self.waiting[priority] += 1
+
+    def release(self, ticket, success=None, service=None, status_code=None):
+        """
+        Frees the slot of a ticket and adapts the limit to the call's outcome.
+
+        ``success`` is None for calls that were never sent, which leave the limit
+        unchanged. Only replies with a 2xx ``status_code`` update the baseline.
+        """
+        now = time.monotonic()
+        baseline = None
+        if success is not None:
+            baseline = self._baseline(service, now - ticket, status_code)
+        with self._cond:
+            self.in_flight -= 1
+            if success is not None:
+                self._adjust(now - ticket, success, baseline, ticket, now)
+            self._cond.notify_all()
+
+    def _baseline(self, service, latency, status_code):
+        """
+        Records the latency of a 2xx reply and returns the service's baseline latency.
+        """
+        tracker = self._baselines.get(service)
+        if tracker is None:
+            tracker = self._baselines.setdefault(service, LatencyTracker(service))
+        if status_code is not None and 200 <= status_code < 300:
+            tracker.record(latency)
+        return tracker.percentile(config.CONCURRENCY_BASELINE_PERCENTILE)
+
+    def _adjust(self, latency, success, baseline, started, now):
+        """
+        Applies additive increase or multiplicative decrease. Must hold the condition.
+        """
+        congested = not success or (
+            baseline is not None and latency > baseline * config.CONCURRENCY_LATENCY_TOLERANCE)
+        if congested:
+            if started > self._decreased_at:
+                self.limit = max(self.limit * config.CONCURRENCY_BACKOFF,
+                                 config.CONCURRENCY_MIN_LIMIT)
+                self._decreased_at = now
+        elif self.in_flight + 1 >= int(self.limit) / 2:
+            self.limit = min(self.limit + 1 / self.limit, config.CONCURRENCY_MAX_LIMIT)
+
+    def stats(self):
+        """
+        Returns the current limit, calls in flight, queue depth, rejections and
+        the wait times of each priority.
+        """
+        with self._cond:
+            priorities = {}
+            for priority, waits in self._waits.items():
+                calls = waits['calls']
+                priorities[priority] = {
+                    'queue_depth': self.waiting[priority], 'calls': calls,
+                    'avg_wait': waits['total'] / calls if calls else 0.0,
+                    'max_wait': waits['max']}
+            return {'limit': int(self.limit), 'in_flight': self.in_flight,
+                    'queue_depth': sum(self.waiting.values()), 'rejected': self.rejected,
+                    'priorities': priorities}
+
+    def _rejected_error(self, url):
+        """
+        Builds the exception raised when no slot frees up in time.
+
+        The query string is dropped from the URL, as some carry access tokens.
+        """
+        return GenericException(status_type=STATUS_TYPE['APP'],
+                                exception_code=RETRYABLE_CODE['API_UNREACHABLE'],
+                                detail=f'Too many concurrent calls to {self.host}, call not attempted.',
+                                response_msg=config.WEBSITE_ERROR,
+                                request=None, url=url and url.split('?', 1)[0])
+
+
+def get_limiter(host):
+    """
+    Returns the concurrency limiter of the host, creating it on first use.
+    """
+    limiter = _limiters.get(host)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(host, ConcurrencyLimiter(host))
+    return limiter
+
+
+def limiter_stats():
+    """
+    Returns the state of every concurrency limiter keyed by host.
+    """
+    return {host: limiter.stats() for host, limiter in list(_limiters.items())}
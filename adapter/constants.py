@@ -74,7 +74,28 @@ EXPERIAN_URL = "https://connectuat.experian.in:8443/ngwsconnect/ngws"
 EXPERIAN_USER = "cpu2hdfclife_uat05"
 EXPERIAN_PASSWORD = os.getenv("EXPERIAN_PASSWORD")
 EXPERIAN_PROCEED_AT_EXACT_MATCH = True
-EXPERIAN_REPORT_VALIDITY = 60
+EXPERIAN_REPORT_VALIDITY = 60  # in days, how long a stored bureau report is reused
+CREDIT_REPORT_CACHE_ALIAS = "api_v1"
+EXPERIAN_REQUEST_XML = (
+    '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" '
+    'xmlns:urn="http://nextgenws.ngwsconnect.experian.com">\n<soapenv:Header/>\n'
+    '<soapenv:Body>\n<urn:process>\n'
+    '<urn:cbv2String>><![CDATA['
+    '<INProfileRequest>\n<Identification>\n'
+    '<XMLUser>{user}</XMLUser>\n'
+    '<XMLPassword>{password}</XMLPassword>\n'
+    '</Identification>\n'
+    '<Application>\n'
+    '<ScoreFlag>1</ScoreFlag>\n'
+    '<PSVFlag>12</PSVFlag>\n'
+    '</Application>\n'
+    '<Applicant>\n<Surname></Surname>\n'
+    '<FirstName>{name}</FirstName>\n'
+    '<MobilePhone>{mobile}</MobilePhone>\n'
+    '</Applicant>\n\n'
+    '</INProfileRequest>\n]]>\n'
+    '</urn:cbv2String>\n</urn:process>\n</soapenv:Body>\n</soapenv:Envelope>'
+)
 
 #==============================Dedupe api urls=======================================
 DEDUPE_GENERATE_TOKEN_URL = "https://customer-uat-public.api-hdfclife.com/v1/external/login"
@@ -82,6 +103,7 @@ DEDUPE_REFRESH_TOKEN_URL = "https://customer-uat-public.api-hdfclife.com/v1/exte
 DEDUPE_API_URL = "https://customer-uat-public.api-hdfclife.com/v1/customers/dedupes"
 DEDUPE_USERID="hdfc_capp"
 DEDUPE_PASSWORD=os.getenv("DEDUPE_PASSWORD")
+DEDUPE_RESPONSE_CACHE_TTL = 300  # in seconds, 0 disables the shared dedupe response cache
 
 # Google Recaptcha Settings
 GOOGLE_RECAPTCHA_SECRET_KEY = os.getenv("GOOGLE_RECAPTCHA_SECRET_KEY")
@@ -100,9 +122,16 @@ CF_BASE_URL = "https://api.cloudflare.com/client/v4/zones/%s/purge_cache" % (ZON
 CF_WEBSITE_DOMAIN = 'www.hdfclife.com'
 CF_API_DOMIAN = "api.hdfclife.com"
 CF_MOBILE_DOMIAN = "mobapp.hdfclife.com"
+CF_PURGE_DOMAINS = (CF_WEBSITE_DOMAIN, CF_API_DOMIAN, CF_MOBILE_DOMIAN)
+CF_PURGE_WINDOW = 2  # in seconds, purges collected before a batch is sent
+CF_PURGE_MAX_BATCH = 30  # files, tags, hosts or prefixes per purge request
+CF_PURGE_MAX_ATTEMPTS = 3  # sends of an item before a failed purge is dropped
+CF_PURGE_SPLIT_STATUSES = (400, 422)  # rejections of invalid items, split to isolate them
 
 TEBT_BASE_URL = os.getenv("TEBT_BASE_URL")
 TEBT_PAN_VALIDATION = TEBT_BASE_URL + 'TEBT_CommonValidationsWeb/TEBT_CommonValidationsExport/validatepan'
+TEBT_PAN_BATCH_SIZE = 50  # PANs sent per validatepan request
+TEBT_PAN_BATCH_CONCURRENCY = 4  # validatepan requests in flight per batch call
 TEBT_GET_QUOTE_URL = TEBT_BASE_URL + 'TEBT_QuoteGenerationWeb/sca/QuoteGeneration_ThirdPartyExport?wsdl'
 
 GOOGLE_AUTH_ENDPOINT = "https://www.googleapis.com/oauth2/v3/userinfo"
@@ -113,7 +142,7 @@ APPLE_AUDIENCE = "com.hdfc.comwithAppleSignIn"
 TEBT_PAYMENT_RECEPT_POSTING_URL = "https://soauat2.hdfclife.com/TEBT_TPSL_ExternalInteraction_ModuleWeb/sca/BillJunctionWebServiceSoapWSDLExport"
 
 WSDL_SUCCESS_STATUS_CODE = 200
-REQUEST_TIMEOUT = 60
+REQUEST_TIMEOUT = 60  # ceiling of the adaptive timeout, see latency.py
 WSDL_CACHE_POLICY_VALUE = 1
 CACHE_DURATION = 3600
 
@@ -124,7 +153,114 @@ BANKCLOUD_USER_SECRET = "04fd0e09-f8a0-4bf2-bf13-33dd63b2a16d"
 ULIP_ROUTE_ID = 265
 CONVENTIONAL_ROUTE_ID = 264
 BANKCLOUD_FETCH_URL = "https://cvh05ghrzc.execute-api.ap-south-1.amazonaws.com/uat/fetch"
+BANKCLOUD_REQUEST_TIMEOUT = 10
 ERROR_FETCH = "Error Fetching data"
 WEBSITE_ERROR="The website encountered an unexpected error. Please try again later."
 BEARER_VALUE="Bearer %s"
-SOAP_URL_START="<soapenv:Envelope"
\ No newline at end of file
+SOAP_URL_START="<soapenv:Envelope"
+
+#=================================HTTP connection pooling===================================
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 20
+HTTP_POOL_BLOCK = False
+HTTP_MAX_RETRIES = 0
+
+#=================================Token management===================================
+TOKEN_DEFAULT_TTL = 300  # in seconds, used when the auth response carries no expiry
+TOKEN_EXPIRY_SKEW = 30  # in seconds, a token is treated as expired this long before it lapses
+TOKEN_REFRESH_RATIO = 0.75  # fraction of the lifetime after which a background refresh starts
+TOKEN_CACHE_ALIAS = "api_v1"  # Django cache shared by all workers for upstream tokens
+TOKEN_LOCK_TIMEOUT = 90  # in seconds, token fetch lock of one worker; above the 60 s call timeout
+TOKEN_LOCK_POLL_INTERVAL = 0.1  # in seconds, how often waiting workers look for the new token
+TOKEN_WAIT_TIMEOUT = 20  # in seconds, longest wait for a token another worker fetches
+
+#=================================Batch calls===================================
+BATCH_MAX_WORKERS = 16  # threads shared by all APIManager batch calls in a process
+BATCH_DEADLINE = 30  # in seconds, overall deadline of one batch call
+
+#=================================JWKS cache===================================
+JWKS_DEFAULT_TTL = 3600  # in seconds, used when the key endpoint sends no max-age
+JWKS_MIN_REFRESH_INTERVAL = 60  # in seconds, minimum gap between refetches on an unknown kid
+JWKS_RETRY_INTERVAL = 10  # in seconds, minimum gap between fetches after a failed one
+JWKS_STALE_TTL = 86400  # in seconds, expired keys are still served this long while fetches fail
+
+#=================================Verified identity cache===================================
+IDENTITY_CACHE_TTL = 300  # in seconds
+IDENTITY_CACHE_MAXSIZE = 10000  # entries kept per process before the least recently used is evicted
+
+#=================================Background log writer===================================
+LOG_WRITER_BATCH_SIZE = 100  # rows written per bulk_create
+LOG_WRITER_FLUSH_INTERVAL = 2  # in seconds, longest time a row waits before being written
+LOG_WRITER_MAX_QUEUE = 10000  # rows buffered before the overflow policy applies
+LOG_WRITER_OVERFLOW = "drop"  # "drop" discards new rows when full, "block" waits for room
+LOG_WRITER_BLOCK_TIMEOUT = 1  # in seconds, longest wait for room with the "block" policy
+LOG_WRITER_SHUTDOWN_TIMEOUT = 10  # in seconds, wait at exit for the batch being written
+
+#=================================Response cache===================================
+RESPONSE_CACHE_ALIAS = "api_v1"
+RESPONSE_CACHE_TTLS = {  # in seconds a cached response is served as fresh, per service type
+    'RECIEPT_DETAILS_URL': 300,
+    'ANNUAL_PREMIUM_STATEMENT_URL': 3600,
+    'UNIT_STATEMENT_URL': 3600,
+    'CSC_WEB_SERVICE_URL': 300,
+}
+RESPONSE_CACHE_STALE_TTL = 600  # in seconds a stale response is still served while it is refetched
+RESPONSE_CACHE_REVALIDATE_LOCK = 60  # in seconds, how long one worker owns a background refetch
+
+#=================================Streaming downloads===================================
+STREAM_CHUNK_SIZE = 64 * 1024  # bytes read from the upstream per chunk
+
+#=================================SOAP response fields===================================
+CSC_RESPONSE_FIELDS = ('GetPolicyPremiumDetails_HealthResult', 'faultcode', 'faultstring')
+TEBT_PAYMENT_RESPONSE_FIELDS = ('faultcode', 'faultstring')
+
+#=================================Circuit breaker===================================
+CIRCUIT_BREAKER_ENABLED = True
+CIRCUIT_WINDOW = 30  # in seconds, calls considered when deciding to open
+CIRCUIT_MIN_CALLS = 10  # calls needed in the window before the circuit may open
+CIRCUIT_FAILURE_RATIO = 0.5  # share of failed or slow calls that opens the circuit
+CIRCUIT_SLOW_CALL_SECONDS = 15  # calls slower than this count as failures
+CIRCUIT_OPEN_SECONDS = 30  # how long an open circuit fast-fails before probing
+CIRCUIT_HALF_OPEN_PROBES = 1  # concurrent probe calls allowed while half-open
+CIRCUIT_CACHE_ALIAS = "api_v1"  # Django cache used to share open circuits across workers
+CIRCUIT_SYNC_INTERVAL = 1  # in seconds, how often a worker checks the shared state
+
+#=================================Adaptive timeouts=================================
+ADAPTIVE_TIMEOUTS_ENABLED = True
+LATENCY_WINDOW = 300  # in seconds, lifetime of one latency histogram generation
+LATENCY_MIN_SAMPLES = 50  # samples needed before a service's timeout adapts
+LATENCY_PERCENTILE = 99  # percentile of call latency, timeouts included, the timeout derives from
+LATENCY_TIMEOUT_FACTOR = 3  # read timeout = percentile latency x factor
+LATENCY_READ_TIMEOUT_MIN = 2  # in seconds, lower bound of an adapted read timeout
+LATENCY_CONNECT_TIMEOUT = 5  # in seconds, upper bound of the connect timeout
+LATENCY_BUCKET_RATIO = 1.1  # growth factor between histogram buckets (about 5% error)
+LATENCY_MAX_SECONDS = 600  # latencies above this land in the last bucket
+
+#=================================Concurrency limits================================
+CONCURRENCY_LIMIT_ENABLED = True
+CONCURRENCY_INITIAL_LIMIT = 10  # concurrent calls allowed per host at start
+CONCURRENCY_MIN_LIMIT = 1
+CONCURRENCY_MAX_LIMIT = 40
+CONCURRENCY_BACKOFF = 0.7  # multiplicative decrease on errors or congestion
+CONCURRENCY_LATENCY_TOLERANCE = 2.0  # latency above baseline x tolerance counts as congestion
+CONCURRENCY_BASELINE_PERCENTILE = 10  # percentile of 2xx latency used as a service's baseline
+CONCURRENCY_MAX_QUEUE = 100  # callers allowed to wait per host and priority, others are rejected
+CONCURRENCY_QUEUE_TIMEOUT = 5  # in seconds, longest wait for a slot of an interactive call
+CONCURRENCY_POLL_INTERVAL = 0.01  # in seconds, slot polling interval of async callers
+CONCURRENCY_INTERACTIVE_RESERVE = 0.25  # share of each host's limit kept free for interactive calls
+CONCURRENCY_BULK_QUEUE_TIMEOUT = 60  # in seconds, longest wait for a slot of a bulk call
+
+#=================================CRM lead queue====================================
+# Absolute, so every worker shares one spool whatever its working directory; must be a local disk.
+CRM_LEAD_SPOOL_DIR = os.path.abspath(os.getenv("CRM_LEAD_SPOOL_DIR", "/var/spool/external_services"))
+CRM_LEAD_SPOOL_PATH = os.path.join(CRM_LEAD_SPOOL_DIR, 'crm_lead_spool.sqlite3')
+CRM_LEAD_BATCH_SIZE = 100  # leads per OData $batch request (Dynamics allows up to 1000)
+CRM_LEAD_POLL_INTERVAL = 2  # in seconds, worker sleep while the spool is empty
+CRM_LEAD_MAX_ATTEMPTS = 8  # submissions before a lead is marked failed
+CRM_LEAD_RETRY_BASE = 5  # in seconds, first retry delay, doubled on every attempt
+CRM_LEAD_RETRY_MAX = 900  # in seconds, longest retry delay
+CRM_LEAD_CLAIM_TIMEOUT = 300  # in seconds, after which leads claimed by a dead worker are retried; above token lock + bulk slot wait + batch timeout
+CRM_LEAD_DEDUPE_WINDOW = 86400  # in seconds, how long submitted leads are kept to drop duplicates
+CRM_LEAD_FAILED_RETENTION = 604800  # in seconds, how long failed leads are kept for inspection
+CRM_LEAD_BATCH_TIMEOUT = 60  # in seconds, ceiling of the $batch request timeout
+CRM_LEAD_SPOOL_BUSY_TIMEOUT = 10  # in seconds, wait for the spool lock held by another worker
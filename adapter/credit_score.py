@@ -12,7 +12,9 @@ import json
 import base64
 import hashlib
 import hmac
+import html
 import math
+import re
 from datetime import datetime
 import uuid
 import requests
@@ -20,7 +22,47 @@ from shared_config.exceptions import GenericException
 from shared_config.exception_constants import NONRETRYABLE_CODE, STATUS_TYPE
 from shared_config.logging import custom_log
 from .models import ApiExternalLog
+from .log_writer import log_writer
+from .report_store import report_store
+from .xml_templates import XmlTemplate
 from . import constants as config
+from . import responses
+from . import sessions
+from .base import RequestAdapter
+
+CRIF_ERROR_PATTERN = re.compile(r'<ERRORS?[\s>]')
+CRIF_SCORE_PATTERN = re.compile(r'<SCORE-VALUE>\s*\d+\s*</SCORE-VALUE>')
+EXPERIAN_ERROR_PATTERN = re.compile(r'<(?:ErrorString|soapenv:Fault)[\s/>]', re.I)
+EXPERIAN_SYSTEM_CODE_PATTERN = re.compile(r'<SystemCode>\s*(\d+)\s*</SystemCode>')
+EXPERIAN_SCORE_PATTERN = re.compile(r'<BureauScore>\s*\d+\s*</BureauScore>')
+
+def crif_report_is_valid(body):
+    """
+    Returns whether a CRIF reply carries a scored report and no error segment.
+    """
+    return not CRIF_ERROR_PATTERN.search(body) and bool(CRIF_SCORE_PATTERN.search(body))
+
+def experian_report_is_valid(body):
+    """
+    Returns whether an Experian reply carries a scored report with a zero system code.
+
+    The report may be sent entity-escaped inside the SOAP reply, so it is unescaped first.
+    """
+    body = html.unescape(body)
+    if EXPERIAN_ERROR_PATTERN.search(body):
+        return False
+    system_code = EXPERIAN_SYSTEM_CODE_PATTERN.search(body)
+    if system_code is not None and int(system_code.group(1)) != 0:
+        return False
+    return bool(EXPERIAN_SCORE_PATTERN.search(body))
+
+def stored_report_response(report):
+    """
+    Returns a new ``requests.Response`` carrying a stored report body.
+    """
+    return responses.to_requests({'status_code': 200,
+                                  'headers': {'Content-Type': 'text/xml; charset=utf-8'},
+                                  'content': report.encode('utf-8')})
 
 class CrifScore:
     """
@@ -34,6 +76,10 @@ class CrifScore:
         Sends the request to the CRIF API and logs the request and response.
     """
 
+    REQUEST_TEMPLATE = XmlTemplate(
+        '<REQUEST-REQUEST-FILE><HEADER-SEGMENT><PRODUCT-TYP>FUSION</PRODUCT-TYP><PRODUCT-VER>2.0</PRODUCT-VER><REQ-MBR>{customer_id}</REQ-MBR><SUB-MBR-ID>{sub_mbr_id}</SUB-MBR-ID><INQ-DT-TM>03-02-2022</INQ-DT-TM><REQ-VOL-TYP>C01</REQ-VOL-TYP><REQ-ACTN-TYP>AT01</REQ-ACTN-TYP><TEST-FLG>HMTEST</TEST-FLG><AUTH-FLG>Y</AUTH-FLG><RES-FRMT>XML</RES-FRMT><LOS-NAME>INHOUSE</LOS-NAME><REQ-SERVICE-TYPE>CB SCORE|INCOME SEGMENT|DEMOG</REQ-SERVICE-TYPE></HEADER-SEGMENT><INQUIRY><APPLICANT-SEGMENT><NAME>{name}</NAME><DOB-DATE></DOB-DATE><PAN></PAN><UID></UID><VOTER-ID></VOTER-ID><ADDRESSES><ADDRESS><TYPE></TYPE><ADDRESS-1></ADDRESS-1><CITY></CITY><STATE></STATE><PIN></PIN></ADDRESS></ADDRESSES><PHONE>{mobile}</PHONE><EMAIL></EMAIL><RELATION-TYPE></RELATION-TYPE><RELATION-VALUE></RELATION-VALUE><NOMINEE-TYPE></NOMINEE-TYPE><NOMINEE-VALUE></NOMINEE-VALUE><GENDER-TYPE>G02</GENDER-TYPE></APPLICANT-SEGMENT><APPLICATION-SEGMENT><INQUIRY-UNIQUE-REF-NO></INQUIRY-UNIQUE-REF-NO><CREDT-RPT-ID></CREDT-RPT-ID><CREDT-REQ-TYP>INDV</CREDT-REQ-TYP><CREDT-INQ-PURPS-TYP>CP12</CREDT-INQ-PURPS-TYP><CREDT-INQ-PURPS-TYP-DESC>ACCT-ORIG</CREDT-INQ-PURPS-TYP-DESC><CLIENT-CUSTOMER-ID></CLIENT-CUSTOMER-ID><BRANCH-ID></BRANCH-ID><APP-ID></APP-ID><AMOUNT></AMOUNT></APPLICATION-SEGMENT></INQUIRY></REQUEST-REQUEST-FILE>'
+    ).bind(sub_mbr_id=config.SUB_MBR_ID, customer_id=config.CUSTOMER_ID)
+
     def prepare_request_data(self, name, mobile):
         """
         Prepares the request XML payload with the provided user details.
@@ -48,16 +94,18 @@ class CrifScore:
         Returns
         -------
         str
-            The formatted XML payload.
+            The XML payload, with the user details escaped.
         """
-        payload = '<REQUEST-REQUEST-FILE><HEADER-SEGMENT><PRODUCT-TYP>FUSION</PRODUCT-TYP><PRODUCT-VER>2.0</PRODUCT-VER><REQ-MBR>{customer_id}</REQ-MBR><SUB-MBR-ID>{sub_mbr_id}</SUB-MBR-ID><INQ-DT-TM>03-02-2022</INQ-DT-TM><REQ-VOL-TYP>C01</REQ-VOL-TYP><REQ-ACTN-TYP>AT01</REQ-ACTN-TYP><TEST-FLG>HMTEST</TEST-FLG><AUTH-FLG>Y</AUTH-FLG><RES-FRMT>XML</RES-FRMT><LOS-NAME>INHOUSE</LOS-NAME><REQ-SERVICE-TYPE>CB SCORE|INCOME SEGMENT|DEMOG</REQ-SERVICE-TYPE></HEADER-SEGMENT><INQUIRY><APPLICANT-SEGMENT><NAME>{name}</NAME><DOB-DATE></DOB-DATE><PAN></PAN><UID></UID><VOTER-ID></VOTER-ID><ADDRESSES><ADDRESS><TYPE></TYPE><ADDRESS-1></ADDRESS-1><CITY></CITY><STATE></STATE><PIN></PIN></ADDRESS></ADDRESSES><PHONE>{mobile}</PHONE><EMAIL></EMAIL><RELATION-TYPE></RELATION-TYPE><RELATION-VALUE></RELATION-VALUE><NOMINEE-TYPE></NOMINEE-TYPE><NOMINEE-VALUE></NOMINEE-VALUE><GENDER-TYPE>G02</GENDER-TYPE></APPLICANT-SEGMENT><APPLICATION-SEGMENT><INQUIRY-UNIQUE-REF-NO></INQUIRY-UNIQUE-REF-NO><CREDT-RPT-ID></CREDT-RPT-ID><CREDT-REQ-TYP>INDV</CREDT-REQ-TYP><CREDT-INQ-PURPS-TYP>CP12</CREDT-INQ-PURPS-TYP><CREDT-INQ-PURPS-TYP-DESC>ACCT-ORIG</CREDT-INQ-PURPS-TYP-DESC><CLIENT-CUSTOMER-ID></CLIENT-CUSTOMER-ID><BRANCH-ID></BRANCH-ID><APP-ID></APP-ID><AMOUNT></AMOUNT></APPLICATION-SEGMENT></INQUIRY></REQUEST-REQUEST-FILE>'
-        return payload.format(name=name, mobile=mobile, sub_mbr_id=config.SUB_MBR_ID,
-                              customer_id=config.CUSTOMER_ID)
+        return self.REQUEST_TEMPLATE.render_text(name=name, mobile=mobile)
 
     def fetch_data(self, payload):
         """
         Sends the request to the CRIF API and logs the request and response.
 
+        A report stored within EXPERIAN_REPORT_VALIDITY days is returned without
+        calling CRIF unless the payload sets ``force_refresh``. Only reports that
+        CRIF scored without an error segment are stored.
+
         Parameters
         ----------
         payload : dict
@@ -66,7 +114,8 @@ class CrifScore:
         Returns
         -------
         dict
-            The response from the CRIF API.
+            The response from the CRIF API, with ``cached`` and ``age`` (in
+            seconds) telling whether it came from the report store.
         """
         url = config.CRIF_URL
         name = payload["name"]
@@ -82,25 +131,37 @@ class CrifScore:
             'productVersion': '2.0',
             'reqVolType': 'INDV'
         }
+        if not payload.get("force_refresh"):
+            stored = report_store.get('CRIF', name, mobile)
+            if stored is not None:
+                report, age = stored
+                return {"response": stored_report_response(report), "headers": headers,
+                        "cached": True, "age": age}
+        external_log = ApiExternalLog(
+            request_log=payload["log_obj"],  # need to check this while integrating the api
+            service_name='CRIF',
+            service_url=url,
+            request_body=request_xml,
+        )
         try:
             custom_log(level="info", params={"message": "Logging request body", "body": payload})
-            external_log = ApiExternalLog.objects.create(
-                request_log=payload["log_obj"],  # need to check this while integrating the api
-                service_name='CRIF',
-                service_url=url,
-                request_body=request_xml,
-            )
-            response = requests.request("POST", url, headers=headers, data=payload,
-                                        timeout=config.REQUEST_TIMEOUT)
+            response = sessions.request("POST", url, headers=headers, data=payload,
+                                        timeout=config.REQUEST_TIMEOUT, service='CrifScore')
             external_log.response = response.text
             external_log.status_code = response.status_code
-            external_log.save()
         except requests.exceptions.RequestException:
             error_msg = "Unable to fetch data from crif"
             raise GenericException(status_type=STATUS_TYPE["APP"],
                                    exception_code=NONRETRYABLE_CODE["BAD_REQUEST"],
                                    detail=error_msg, response_msg=error_msg)
-        response = {"response": response, "headers": headers}
+        else:
+            external_log.is_valid_response = (response.status_code == 200
+                                              and crif_report_is_valid(response.text))
+        finally:
+            log_writer.enqueue(external_log)
+        if external_log.is_valid_response:
+            report_store.put('CRIF', name, mobile, response.text)
+        response = {"response": response, "headers": headers, "cached": False, "age": 0}
         return response
 
 class ExperianScore:
@@ -111,10 +172,13 @@ class ExperianScore:
     -------
     prepare_request_data(name, mobile)
         Prepares the request XML payload with the provided user details.
-    fetch_data()
+    fetch_data(payload)
         Sends the request to the Experian API and logs the request and response.
     """
 
+    REQUEST_TEMPLATE = XmlTemplate(config.EXPERIAN_REQUEST_XML).bind(
+        user=config.EXPERIAN_USER, password=config.EXPERIAN_PASSWORD)
+
     def prepare_request_data(self, name, mobile):
         """
         Prepares the request XML payload with the provided user details.
@@ -129,33 +193,18 @@ class ExperianScore:
         Returns
         -------
         str
-            The formatted XML payload.
+            The XML payload, with the user details escaped.
         """
-        payload = '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" ' \
-                  'xmlns:urn="http://nextgenws.ngwsconnect.experian.com">\n<soapenv:Header/>\n' \
-                  '<soapenv:Body>\n<urn:process>\n' \
-                  '<urn:cbv2String>><![CDATA[' \
-                  '<INProfileRequest>\n<Identification>\n' \
-                  '<XMLUser>{user}</XMLUser>\n' \
-                  '<XMLPassword>{password}</XMLPassword>\n' \
-                  '</Identification>\n' \
-                  '<Application>\n' \
-                  '<ScoreFlag>1</ScoreFlag>\n' \
-                  '<PSVFlag>12</PSVFlag>\n' \
-                  '</Application>\n' \
-                  '<Applicant>\n<Surname></Surname>\n' \
-                  '<FirstName>{name}</FirstName>\n' \
-                  '<MobilePhone>{mobile}</MobilePhone>\n' \
-                  '</Applicant>\n\n' \
-                  '</INProfileRequest>\n]]>\n' \
-                  '</urn:cbv2String>\n</urn:process>\n</soapenv:Body>\n</soapenv:Envelope>'
-        return payload.format(name=name, mobile=mobile, user=config.EXPERIAN_USER,
-                              password=config.EXPERIAN_PASSWORD)
+        return self.REQUEST_TEMPLATE.render_text(name=name, mobile=mobile)
 
-    def fetch_data(self):
+    def fetch_data(self, payload):
         """
         Sends the request to the Experian API and logs the request and response.
 
+        A report stored within EXPERIAN_REPORT_VALIDITY days is returned without
+        calling Experian unless the payload sets ``force_refresh``. Only reports
+        that Experian scored with a zero system code are stored.
+
         Parameters
         ----------
         payload : dict
@@ -164,50 +213,70 @@ class ExperianScore:
         Returns
         -------
         dict
-            The response from the Experian API.
+            The response from the Experian API, with ``cached`` and ``age`` (in
+            seconds) telling whether it came from the report store. Its
+            ``external_log`` is a saved row, with ``is_valid_response`` set; for
+            stored reports it records the report served from the store.
         """
-        payload = {}
         url = config.EXPERIAN_URL
         name = payload["name"]
         mobile = payload["mobile"]
-        payload = self.prepare_request_data(name, mobile)
+        if not payload.get("force_refresh"):
+            stored = report_store.get('Experian', name, mobile)
+            if stored is not None:
+                report, age = stored
+                # Callers update the returned row, so it is saved now rather than by the log writer.
+                external_log = ApiExternalLog.objects.create(
+                    request_log=payload["log_obj"], service_name='Experian', service_url=url,
+                    response=report, status_code=200, is_valid_response=True)
+                return {"response": stored_report_response(report), "external_log": external_log,
+                        "cached": True, "age": age}
+        request_xml = self.prepare_request_data(name, mobile)
         headers = {
             'Content-Type': 'application/xml'
         }
+        external_log = ApiExternalLog(
+            request_log=payload["log_obj"],
+            service_name='Experian',
+            service_url=url,
+            request_body=request_xml,
+        )
         try:
-            custom_log(level="info", params={"message": "Logging request body", "body": payload})
-            external_log = ApiExternalLog.objects.create(
-                request_log=payload["log_obj"],
-                service_name='Experian',
-                service_url=url,
-                request_body=payload,
-            )
-            response = requests.request("POST", url, headers=headers, data=payload,
-                                        timeout=config.REQUEST_TIMEOUT)
+            custom_log(level="info", params={"message": "Logging request body", "body": request_xml})
+            response = sessions.request("POST", url, headers=headers, data=request_xml,
+                                        timeout=config.REQUEST_TIMEOUT, service='ExperianScore')
             external_log.response = response.text
             external_log.status_code = response.status_code
-            external_log.save()
         except requests.exceptions.RequestException:
             error_msg = "Unable to fetch data from experian"
             raise GenericException(status_type=STATUS_TYPE["APP"],
                                    exception_code=NONRETRYABLE_CODE["BAD_REQUEST"],
                                    detail=error_msg, response_msg=error_msg)
-        response = {"response": response, "external_log": external_log}
+        else:
+            external_log.is_valid_response = (response.status_code == 200
+                                              and experian_report_is_valid(response.text))
+        finally:
+            external_log.save()
+        if external_log.is_valid_response:
+            report_store.put('Experian', name, mobile, response.text)
+        response = {"response": response, "external_log": external_log, "cached": False, "age": 0}
         return response
 
-class BankCloudUrl:
+class BankCloudUrl(RequestAdapter):
     """
     A class to interact with the BankCloud API for fetching data.
 
     Methods
     -------
+    build_request(payload)
+        Builds the signed request for the BankCloud API.
     fetch_data(payload)
         Sends the request to the BankCloud API and returns the response.
     """
 
-    def fetch_data(self, payload):
+    def build_request(self, payload):
         """
-        Sends the request to the BankCloud API and returns the response.
+        Builds the signed request for the BankCloud API.
 
         Parameters
         ----------
@@ -217,7 +286,7 @@ class BankCloudUrl:
         Returns
         -------
         dict
-            The response from the BankCloud API.
+            The request passed to the pooled session.
         """
         url = config.BANKCLOUD_FETCH_URL
         payload_str = json.dumps(payload, separators=(',', ':'))
@@ -225,8 +294,24 @@ class BankCloudUrl:
             'Authorization': generate_hash(self, payload_str, url),
             'Content-Type': 'application/json'
         }
-        response = requests.post(url, data=payload_str.encode('utf-8'), headers=headers,
-                                 timeout=config.REQUEST_TIMEOUT)
+        return {'method': 'POST', 'url': url, 'data': payload_str.encode('utf-8'),
+                'headers': headers, 'timeout': config.REQUEST_TIMEOUT}
+
+    def fetch_data(self, payload):
+        """
+        Sends the request to the BankCloud API and returns the response.
+
+        Parameters
+        ----------
+        payload : dict
+            The payload containing the data to be sent to the API.
+
+        Returns
+        -------
+        dict
+            The response from the BankCloud API.
+        """
+        response = super().fetch_data(payload)
         print(response.text)
         return response
 
@@ -316,7 +401,6 @@ class BankCloudToken:
         Response
             The response from the BankCloud API.
         """
-        request_timeout = 10
         payload_str = self.request_paylaod()
         request_url = config.BANKCLOUD_GENERATE_ORDER_URL
         hash_request = generate_hash(self, payload_str, request_url)
@@ -325,8 +409,9 @@ class BankCloudToken:
             'Content-Type': 'application/json'
         }
         payload = self.request_paylaod()
-        response = requests.post(request_url, data=payload.encode('utf-8'), headers=headers,
-                                 timeout=request_timeout)
+        response = sessions.post(request_url, data=payload.encode('utf-8'), headers=headers,
+                                 timeout=config.BANKCLOUD_REQUEST_TIMEOUT,
+                                 service='BankCloudToken')
         return response        
 
     def request_paylaod(self):
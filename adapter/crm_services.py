@@ -5,12 +5,35 @@ Classes:
     MsTokenGen: Handles the token generation for CRM services.
     CrmLeadUrl: Posts lead data to the CRM leads API.
     MobileCrmLeadUrl: Posts lead data to the mobile CRM leads API.
+    CrmLeadQueue: Spools lead data for batched submission to the CRM leads API.
+    MobileCrmLeadQueue: Spools lead data for batched submission to the mobile CRM leads API.
 """
 
 import json
-import requests
 from shared_config import constants
 from . import constants as config
+from . import sessions
+from . import tokens
+from .base import RequestAdapter
+from .lead_queue import LeadQueue
+
+def _request_ms_token(params):
+    """
+    Requests a new token from the CRM token generation URL.
+    """
+    return sessions.post(config.CRM_MS_TOKEN_GEN_URL, data=params,
+                         timeout=constants.DEFAULT_TIMEOUT, service='MsTokenGen')
+
+CRM_MS_TOKEN = tokens.TokenSource(
+    'CRM_MS_TOKEN', lambda: _request_ms_token(config.CRM_MS_TOKEN_GEN_PARAMS),
+    expires_in=tokens.response_expires_in, is_valid=tokens.response_is_valid,
+    serialize=tokens.response_json, restore=tokens.json_response,
+    cache_alias=config.TOKEN_CACHE_ALIAS)
+MOBILE_CRM_MS_TOKEN = tokens.TokenSource(
+    'MOBILE_CRM_MS_TOKEN', lambda: _request_ms_token(config.MOBILE_CRM_MS_TOKEN_GEN_PARAMS),
+    expires_in=tokens.response_expires_in, is_valid=tokens.response_is_valid,
+    serialize=tokens.response_json, restore=tokens.json_response,
+    cache_alias=config.TOKEN_CACHE_ALIAS)
 
 class MsTokenGen:
     """
@@ -19,58 +42,87 @@ class MsTokenGen:
     def fetch_data(self, payload):
         """
         Fetches the token from the CRM token generation URL.
+        The JSON body of the response is cached by the token manager until shortly
+        before it expires; every call returns a new response rebuilt from it.
         Args:
             payload (str): The type of CRM service requesting the token.
         Returns:
             requests.Response: The response from the token generation API.
         """
-        url = config.CRM_MS_TOKEN_GEN_URL
-        updated_payload = config.CRM_MS_TOKEN_GEN_PARAMS
+        source = CRM_MS_TOKEN
         if payload == "MobileCRMLead":
-            updated_payload = config.MOBILE_CRM_MS_TOKEN_GEN_PARAMS
-        response = requests.post(url, data=updated_payload, timeout=constants.DEFAULT_TIMEOUT)
-        return response
+            source = MOBILE_CRM_MS_TOKEN
+        return tokens.token_manager.get_token(source)
 
-class CrmLeadUrl:
+class CrmLeadUrl(RequestAdapter):
     """
     Posts lead data to the CRM leads API.
     """
-    def fetch_data(self, payload, headers):
+    def build_request(self, payload, headers):
         """
-        Posts the lead data to the CRM leads API.
+        Builds the request posting the lead data to the CRM leads API.
         Args:
             payload (dict): The lead data to be posted.
             headers (dict): The headers for the API request.
         Returns:
-            requests.Response: The response from the CRM leads API.
+            dict: The request passed to the pooled session.
         """
-        url = config.CRM_LEADS_API_URL
-        response = requests.post(
-            url=url,
-            data=json.dumps(payload),
-            headers=headers,
-            timeout=constants.DEFAULT_TIMEOUT
-        )
-        return response
+        return {
+            'method': 'POST',
+            'url': config.CRM_LEADS_API_URL,
+            'data': json.dumps(payload),
+            'headers': headers,
+            'timeout': constants.DEFAULT_TIMEOUT
+        }
 
-class MobileCrmLeadUrl:
+class MobileCrmLeadUrl(RequestAdapter):
     """
     Posts lead data to the mobile CRM leads API.
     """
-    def fetch_data(self, payload, headers):
+    def build_request(self, payload, headers):
         """
-        Posts the lead data to the mobile CRM leads API.
+        Builds the request posting the lead data to the mobile CRM leads API.
         Args:
             payload (dict): The lead data to be posted.
             headers (dict): The headers for the API request.
         Returns:
-            requests.Response: The response from the mobile CRM leads API.
+            dict: The request passed to the pooled session.
         """
-        url = config.MOBILE_CRM_LEADS_API_URL
-        response = requests.post(
-            url=url,
-            data=json.dumps(payload),
-            headers=headers,
-            timeout=constants.DEFAULT_TIMEOUT
-        )
-        return response
+        return {
+            'method': 'POST',
+            'url': config.MOBILE_CRM_LEADS_API_URL,
+            'data': json.dumps(payload),
+            'headers': headers,
+            'timeout': constants.DEFAULT_TIMEOUT
+        }
+
+lead_queue = LeadQueue({
+    'CRM': (config.CRM_LEADS_API_URL, CRM_MS_TOKEN),
+    'MOBILE': (config.MOBILE_CRM_LEADS_API_URL, MOBILE_CRM_MS_TOKEN),
+})
+
+class CrmLeadQueue:
+    """
+    Spools lead data for submission to the CRM leads API in batches.
+    """
+    kind = 'CRM'
+
+    def fetch_data(self, payload, headers=None):
+        """
+        Spools the lead and returns without waiting for the CRM.
+        The worker authenticates on its own, so ``headers`` are ignored.
+        Args:
+            payload (dict): The lead data to be posted.
+            headers (dict): Accepted for parity with ``CrmLeadUrl``.
+        Returns:
+            dict: ``queued`` is True, ``duplicate`` is True when an identical
+            lead is pending or was recently submitted.
+        """
+        stored = lead_queue.enqueue(self.kind, payload)
+        return {'queued': True, 'duplicate': not stored}
+
+class MobileCrmLeadQueue(CrmLeadQueue):
+    """
+    Spools lead data for submission to the mobile CRM leads API in batches.
+    """
+    kind = 'MOBILE'
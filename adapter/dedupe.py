@@ -1,14 +1,37 @@
 """
 Module for interacting with Dedupe API to fetch customer data and policy details.
+
+Customer responses fetched inside a ``memo_scope`` block, such as one login
+flow calling both ``get_customer_client_ids`` and ``get_exide_life_policy``,
+are fetched once and shared by every DedupeService call in that block.
 """
 
+import contextvars
+import hashlib
+from contextlib import contextmanager
 from datetime import datetime
-import requests
 from django.core.cache import caches
 from rest_framework import status
 from rest_framework.exceptions import APIException
+from shared_config.exceptions import GenericException
 from shared_config import utils as api_utils
 from . import constants as settings
+from . import sessions
+from . import tokens
+
+_response_memo = contextvars.ContextVar('dedupe_response_memo', default=None)
+
+@contextmanager
+def memo_scope():
+    """
+    Shares the Dedupe customer responses fetched inside the block, nested blocks included.
+    """
+    memo = _response_memo.get()
+    token = _response_memo.set({} if memo is None else memo)
+    try:
+        yield
+    finally:
+        _response_memo.reset(token)
 
 class DedupeService:
     """
@@ -18,41 +41,55 @@ class DedupeService:
     GENERATE_TOKEN_URL = settings.DEDUPE_GENERATE_TOKEN_URL
     REFRESH_TOKEN_URL = settings.DEDUPE_REFRESH_TOKEN_URL
     DEDUPE_API_URL = settings.DEDUPE_API_URL
-    TOKEN_CACHE_KEY = "DEDUPE_API_TOKEN"
+    # Versioned: the token manager stores an entry dict, while workers of earlier
+    # releases read a bare token string under "DEDUPE_API_TOKEN".
+    TOKEN_CACHE_KEY = "DEDUPE_API_TOKEN:v2"
     TOKEN_CACHE_TIMEOUT = 500
-    REQUEST_TIMEOUT = 20
+    RESPONSE_CACHE_TIMEOUT = settings.DEDUPE_RESPONSE_CACHE_TTL
+    CUSTOMER_FIELDS = "policy,profile"
+    REQUEST_TIMEOUT = 20  # ceiling of the adaptive timeout
+    SERVICE_NAME = 'DedupeService'
+    TOKEN_SERVICE_NAME = 'DedupeToken'
 
     def __init__(self):
         self.cache = caches["api_v1"]
         self.proxy = api_utils.get_proxy()
+        self.token_source = tokens.TokenSource(self.TOKEN_CACHE_KEY, self._request_token,
+                                               ttl=self.TOKEN_CACHE_TIMEOUT,
+                                               cache_alias=settings.TOKEN_CACHE_ALIAS,
+                                               wait_timeout=self.REQUEST_TIMEOUT)
 
     def _generate_token(self):
         """
-        Generates a token for accessing the Dedupe API.
+        Generates a token for accessing the Dedupe API and stores it.
+        """
+        return tokens.token_manager.fetch_token(self.token_source)
+
+    def _request_token(self):
+        """
+        Requests a new token from the Dedupe login API.
         """
         payload = {
             "userId": settings.DEDUPE_USERID,
             "password": settings.DEDUPE_PASSWORD
         }
         try:
-            resp = requests.post(self.GENERATE_TOKEN_URL, data=payload, proxies=self.proxy,
-                                  timeout=self.REQUEST_TIMEOUT)
+            resp = sessions.post(self.GENERATE_TOKEN_URL, data=payload, proxies=self.proxy,
+                                  timeout=self.REQUEST_TIMEOUT, service=self.TOKEN_SERVICE_NAME)
             resp.raise_for_status()
+        except GenericException:
+            raise
         except Exception as exc:
             raise APIException("Error fetching data from external API") from exc
         if resp.status_code != status.HTTP_200_OK:
             raise APIException(settings.ERROR_FETCH)
-        token = resp.json()["data"]["token"]
-        self._store_token(token)
-        return token
+        return resp.json()["data"]["token"]
 
     def _refresh_token(self):
         """
         Refreshes the token for accessing the Dedupe API.
         """
-        if self.TOKEN_CACHE_KEY not in self.cache:
-            self._generate_token()
-        token = self.cache.get(self.TOKEN_CACHE_KEY)
+        token = self._get_token()
         headers = {
             "Authorization": settings.BEARER_VALUE % token
         }
@@ -60,9 +97,12 @@ class DedupeService:
             "projectCode": "customer_app"
         }
         try:
-            resp = requests.post(self.REFRESH_TOKEN_URL, headers=headers, data=payload,
-                                 proxies=self.proxy, timeout=self.REQUEST_TIMEOUT)
+            resp = sessions.post(self.REFRESH_TOKEN_URL, headers=headers, data=payload,
+                                 proxies=self.proxy, timeout=self.REQUEST_TIMEOUT,
+                                 service=self.TOKEN_SERVICE_NAME)
             resp.raise_for_status()
+        except GenericException:
+            raise
         except Exception as exc:
             raise APIException("Error fetching data from external API") from exc
         if resp.status_code != status.HTTP_200_OK:
@@ -75,21 +115,47 @@ class DedupeService:
         """
         Stores the token in the cache with a timeout.
         """
-        self.cache.set(self.TOKEN_CACHE_KEY, token, timeout=self.TOKEN_CACHE_TIMEOUT)
+        tokens.token_manager.store_token(self.token_source, token)
 
     def _get_token(self):
         """
-        Retrieves the token from the cache, generating a new one if necessary.
+        Retrieves the token from the token manager, generating a new one if necessary.
         """
-        if self.TOKEN_CACHE_KEY in self.cache:
-            token = self.cache.get(self.TOKEN_CACHE_KEY)
-        else:
-            token = self._generate_token()
-        return token
+        return tokens.token_manager.get_token(self.token_source)
+
+    def _customer_cache_key(self, user):
+        """
+        Builds the response cache key from a hash of the user's phone, email and fields.
+        """
+        identity = "|".join([str(user.phone), str(user.email), self.CUSTOMER_FIELDS])
+        return "DEDUPE_CUSTOMER_" + hashlib.sha256(identity.encode("utf-8")).hexdigest()
 
     def fetch_customer_data_from_dedupe(self, user):
         """
         Fetches customer data from the Dedupe API.
+
+        Responses are memoized for the enclosing ``memo_scope`` and shared through
+        the cache for RESPONSE_CACHE_TIMEOUT seconds, so one login flow makes at
+        most one call.
+        """
+        cache_key = self._customer_cache_key(user)
+        memo = _response_memo.get()
+        if memo is not None and cache_key in memo:
+            return memo[cache_key]
+        data = None
+        if self.RESPONSE_CACHE_TIMEOUT:
+            data = self.cache.get(cache_key)
+        if data is None:
+            data = self._request_customer_data(user)
+            if self.RESPONSE_CACHE_TIMEOUT:
+                self.cache.set(cache_key, data, timeout=self.RESPONSE_CACHE_TIMEOUT)
+        if memo is not None:
+            memo[cache_key] = data
+        return data
+
+    def _request_customer_data(self, user):
+        """
+        Requests customer data from the Dedupe API.
         """
         token = self._get_token()
         headers = {
@@ -99,12 +165,15 @@ class DedupeService:
             "projectCode": "customer_app",
             "phone-no": user.phone,
             "email-id": user.email,
-            "fields": "policy,profile"
+            "fields": self.CUSTOMER_FIELDS
         }
         try:
-            resp = requests.post(self.DEDUPE_API_URL, headers=headers, data=payload,
-                                 proxies=self.proxy, timeout=self.REQUEST_TIMEOUT)
+            resp = sessions.post(self.DEDUPE_API_URL, headers=headers, data=payload,
+                                 proxies=self.proxy, timeout=self.REQUEST_TIMEOUT,
+                                 service=self.SERVICE_NAME)
             resp.raise_for_status()
+        except GenericException:
+            raise
         except Exception as exc:
             raise APIException("Something went wrong") from exc
         if resp.status_code != status.HTTP_200_OK:
@@ -184,10 +253,12 @@ class DedupeService:
             "fields": "policy,profile"
         }
         try:
-            resp = requests.post(self.DEDUPE_API_URL, headers=headers, data=payload,
+            resp = sessions.post(self.DEDUPE_API_URL, headers=headers, data=payload,
                                  proxies=self.proxy,
-                                 timeout=self.REQUEST_TIMEOUT)
+                                 timeout=self.REQUEST_TIMEOUT, service=self.SERVICE_NAME)
             resp.raise_for_status()
+        except GenericException:
+            raise
         except Exception as exc:
             raise APIException("Something went wrong") from exc
         if resp.status_code != status.HTTP_200_OK:
@@ -0,0 +1,123 @@
+"""
+Module providing a cache of JSON Web Key Sets with pre-parsed public keys.
+
+Keys are fetched once, converted to public key objects and stored by ``kid``.
+The set is kept for the ``max-age`` sent by the key endpoint and refetched
+early only when a token carries an unknown ``kid``, at most once every
+``JWKS_MIN_REFRESH_INTERVAL`` seconds, so verifying a token is normally a
+local decode.
+
+When a fetch fails, the endpoint is not called again for
+``JWKS_RETRY_INTERVAL`` seconds, and the keys already held keep being
+served for up to ``JWKS_STALE_TTL`` seconds past their expiry, so an outage
+of the key endpoint does not make every login refetch.
+
+Classes:
+- JwksCache: Caches the public keys published at a JWKS endpoint.
+"""
+
+import json
+import re
+import threading
+import time
+from jwt.algorithms import RSAAlgorithm
+from shared_config import constants
+from shared_config.logging import custom_log
+from . import constants as config
+from . import sessions
+
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+
+class JwksCache:
+    """
+    Caches the public keys published at a JWKS endpoint, keyed by ``kid``.
+    """
+
+    def __init__(self, url, service, validate_key=None):
+        """
+        Args:
+            url (str): URL of the JWKS endpoint.
+            service (str): Service name the key fetches are tracked under.
+            validate_key (callable): Optional, called with each fetched key and the
+                request and expected to raise for keys that must be rejected.
+        """
+        self.url = url
+        self.service = service
+        self.validate_key = validate_key
+        self._keys = {}
+        self._expires_at = 0
+        self._fetched_at = 0
+        self._retry_at = 0
+        self._error = None
+        self._lock = threading.Lock()
+
+    def get_key(self, kid, request=None):
+        """
+        Returns the public key for ``kid``, or None if the endpoint does not publish it.
+        """
+        now = time.time()
+        if now < self._expires_at and kid in self._keys:
+            return self._keys[kid]
+        with self._lock:
+            now = time.time()
+            expired = now >= self._expires_at
+            missing = kid not in self._keys
+            if expired or (missing and
+                           now - self._fetched_at >= config.JWKS_MIN_REFRESH_INTERVAL):
+                self._refresh(request, now)
+        return self._keys.get(kid)
+
+    def _refresh(self, request, now):
+        """
+        Refetches the key set, keeping the cached keys while the endpoint fails.
+
+        Raises the fetch error when no key is left to serve.
+        """
+        if now < self._retry_at:
+            if not self._usable(now):
+                raise self._error
+            return
+        try:
+            self._fetch(request)
+        except Exception as e:
+            self._retry_at = now + config.JWKS_RETRY_INTERVAL
+            self._error = e
+            if not self._usable(now):
+                raise
+            custom_log(level='error', request=request,
+                       params={'detail': 'JWKS fetch failed, serving the cached keys.',
+                               'body': {'url': self.url, 'error_msg': repr(e)}})
+
+    def _usable(self, now):
+        """
+        Returns whether the cached keys may still be served after a failed fetch.
+        """
+        return bool(self._keys) and now < self._expires_at + config.JWKS_STALE_TTL
+
+    def _fetch(self, request):
+        """
+        Fetches the key set and replaces the cached keys.
+        """
+        response = sessions.get(self.url, timeout=constants.DEFAULT_TIMEOUT,
+                                service=self.service)
+        response.raise_for_status()
+        keys = {}
+        for data in json.loads(response.text)["keys"]:
+            if self.validate_key is not None:
+                self.validate_key(data, request)
+            keys[data.get('kid')] = RSAAlgorithm.from_jwk(json.dumps(data))
+        now = time.time()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + self._max_age(response)
+
+    @staticmethod
+    def _max_age(response):
+        """
+        Returns the lifetime of the key set from its Cache-Control header.
+        """
+        match = MAX_AGE_PATTERN.search(response.headers.get('Cache-Control', ''))
+        if match:
+            return int(match.group(1))
+        return config.JWKS_DEFAULT_TTL
@@ -0,0 +1,174 @@
+"""
+Module deriving per-service timeouts from observed latency.
+
+Every service (an adapter class, or a name given by the caller) has a
+rolling latency histogram with geometric buckets, so percentiles are read
+in constant memory with a bounded relative error. Two histogram
+generations of ``LATENCY_WINDOW`` seconds are kept; the oldest is dropped on
+rotation, so the percentiles follow the upstream as it speeds up or slows
+down. Calls timing out are recorded at their read timeout, so when more than
+``100 - LATENCY_PERCENTILE`` percent of calls time out the timeout grows back
+towards the ceiling.
+
+Once a service has ``LATENCY_MIN_SAMPLES`` samples, its read timeout is the
+``LATENCY_PERCENTILE`` latency times ``LATENCY_TIMEOUT_FACTOR``, bounded by
+``LATENCY_READ_TIMEOUT_MIN`` and by the timeout the caller configured, which
+becomes a ceiling. Until then the configured timeout is used unchanged.
+
+Classes:
+- LatencyTracker: Rolling latency histogram of one service.
+
+Functions:
+- get_tracker(service): Returns the tracker of a service.
+- record(service, seconds): Records the latency of a call.
+- adaptive_timeout(service, ceiling): Returns the (connect, read) timeout of a service.
+- latency_stats(): Returns latency percentiles and timeouts per service.
+"""
+
+import math
+import threading
+import time
+from . import constants as config
+
+_LOG_RATIO = math.log(config.LATENCY_BUCKET_RATIO)
+_MIN_SECONDS = 0.001
+_BUCKETS = int(math.log(config.LATENCY_MAX_SECONDS / _MIN_SECONDS) / _LOG_RATIO) + 2
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def _bucket(seconds):
+    """
+    Returns the histogram bucket of a latency.
+    """
+    if seconds <= _MIN_SECONDS:
+        return 0
+    return min(int(math.log(seconds / _MIN_SECONDS) / _LOG_RATIO) + 1, _BUCKETS - 1)
+
+
+def _bucket_upper(index):
+    """
+    Returns the upper bound in seconds of a histogram bucket.
+    """
+    return _MIN_SECONDS * config.LATENCY_BUCKET_RATIO ** index
+
+
+class LatencyTracker:
+    """
+    Rolling latency histogram of one service.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self._current = [0] * _BUCKETS
+        self._previous = [0] * _BUCKETS
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Records one latency sample.
+        """
+        with self._lock:
+            self._rotate(time.monotonic())
+            self._current[_bucket(seconds)] += 1
+
+    def _rotate(self, now):
+        """
+        Starts a new histogram generation once the current one is ``LATENCY_WINDOW`` old.
+        """
+        elapsed = now - self._rotated_at
+        if elapsed < config.LATENCY_WINDOW:
+            return
+        if elapsed < 2 * config.LATENCY_WINDOW:
+            self._previous = self._current
+        else:
+            self._previous = [0] * _BUCKETS
+        self._current = [0] * _BUCKETS
+        self._rotated_at = now
+
+    def percentile(self, percent):
+        """
+        Returns the latency in seconds below which ``percent`` of the samples fall.
+
+        Returns None when there are fewer than ``LATENCY_MIN_SAMPLES`` samples.
+        """
+        with self._lock:
+            self._rotate(time.monotonic())
+            counts = [current + previous
+                      for current, previous in zip(self._current, self._previous)]
+        total = sum(counts)
+        if total < config.LATENCY_MIN_SAMPLES:
+            return None
+        rank = math.ceil(total * percent / 100)
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return _bucket_upper(index)
+        return _bucket_upper(_BUCKETS - 1)
+
+    def samples(self):
+        """
+        Returns the number of samples in the rolling window.
+        """
+        with self._lock:
+            return sum(self._current) + sum(self._previous)
+
+    def timeout(self, ceiling):
+        """
+        Returns the (connect, read) timeout for the service, bounded by ``ceiling``.
+        """
+        if isinstance(ceiling, tuple):
+            ceiling = ceiling[1]
+        if ceiling is None:
+            return None
+        latency = self.percentile(config.LATENCY_PERCENTILE)
+        read = ceiling
+        if latency is not None:
+            read = min(max(latency * config.LATENCY_TIMEOUT_FACTOR,
+                           config.LATENCY_READ_TIMEOUT_MIN), ceiling)
+        return (min(config.LATENCY_CONNECT_TIMEOUT, read), read)
+
+
+def get_tracker(service):
+    """
+    Returns the latency tracker of the service, creating it on first use.
+    """
+    tracker = _trackers.get(service)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.setdefault(service, LatencyTracker(service))
+    return tracker
+
+
+def record(service, seconds):
+    """
+    Records the latency of a successful call to the service, or the timeout a call hit.
+    """
+    get_tracker(service).record(seconds)
+
+
+def adaptive_timeout(service, ceiling):
+    """
+    Returns the (connect, read) timeout of the service, never above ``ceiling``.
+
+    Returns ``ceiling`` unchanged while adaptive timeouts are disabled.
+    """
+    if not config.ADAPTIVE_TIMEOUTS_ENABLED:
+        return ceiling
+    return get_tracker(service).timeout(ceiling)
+
+
+def latency_stats():
+    """
+    Returns the p50/p95/p99 latency and sample count of every service.
+    """
+    stats = {}
+    for service, tracker in list(_trackers.items()):
+        stats[service] = {'samples': tracker.samples(),
+                          'p50': tracker.percentile(50),
+                          'p95': tracker.percentile(95),
+                          'p99': tracker.percentile(99)}
+    return stats
@@ -0,0 +1,411 @@
+"""
+Module providing a write-behind queue for CRM leads.
+
+Leads are persisted to a local SQLite spool and the caller returns at once;
+a daemon thread drains the spool and submits the leads to Dynamics in
+OData ``$batch`` requests of up to ``CRM_LEAD_BATCH_SIZE`` leads, so lead
+capture latency does not depend on CRM latency.
+
+Every lead has a dedupe key (a hash of its kind and payload); enqueueing a
+lead identical to one still pending, or submitted within
+``CRM_LEAD_DEDUPE_WINDOW``, is a no-op, while enqueueing one identical to a
+failed lead spools it again. Leads rejected with a 5xx or 429 status, or
+lost to a transport error, are retried with exponential backoff up to
+``CRM_LEAD_MAX_ATTEMPTS`` times; leads rejected with another 4xx status are
+marked failed at once and kept for ``CRM_LEAD_FAILED_RETENTION``. Workers of
+several processes may share the spool: leads are claimed in a write
+transaction before submission, and claims of a worker that died are released
+after ``CRM_LEAD_CLAIM_TIMEOUT``.
+
+Classes:
+- LeadSpool: Durable SQLite store of the leads to submit.
+- LeadQueue: Enqueues leads and submits them in batches from a daemon thread.
+
+Functions:
+- build_batch(boundary, entity_path, payloads): Builds an OData $batch body.
+- parse_batch_statuses(response): Reads the status of each request in a $batch reply.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+from shared_config.logging import custom_log
+from . import constants as config
+from . import sessions
+from . import tokens
+from .concurrency import PRIORITY_BULK, priority_scope
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crm_lead (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS crm_lead_due ON crm_lead (status, next_attempt_at);
+"""
+
+STATUS_LINE_PATTERN = re.compile(rb'^HTTP/\d\.\d (\d{3})', re.MULTILINE)
+BOUNDARY_PATTERN = re.compile(r'boundary=("?)([^";]+)\1')
+
+
+def build_batch(boundary, entity_path, payloads):
+    """
+    Builds an OData $batch body posting each payload to the entity set as its own request.
+
+    The requests are not grouped in a change set, so one rejected lead does not
+    roll back the others.
+    """
+    parts = []
+    for payload in payloads:
+        parts.append(f"--{boundary}\r\n"
+                     "Content-Type: application/http\r\n"
+                     "Content-Transfer-Encoding: binary\r\n\r\n"
+                     f"POST {entity_path} HTTP/1.1\r\n"
+                     "Content-Type: application/json; charset=utf-8\r\n\r\n"
+                     f"{payload}\r\n")
+    parts.append(f"--{boundary}--\r\n")
+    return ''.join(parts).encode('utf-8')
+
+
+def parse_batch_statuses(response):
+    """
+    Returns the status code of every request in a $batch reply, in request order.
+    """
+    match = BOUNDARY_PATTERN.search(response.headers.get('Content-Type', ''))
+    if match is None:
+        return []
+    delimiter = b'--' + match.group(2).encode('ascii')
+    statuses = []
+    for part in response.content.split(delimiter)[1:]:
+        status = STATUS_LINE_PATTERN.search(part)
+        if status is not None:
+            statuses.append(int(status.group(1)))
+    return statuses
+
+
+def _is_retryable(status_code):
+    """
+    Returns whether a lead rejected with the status code may succeed later.
+    """
+    return status_code == 429 or status_code >= 500
+
+
+class LeadSpool:
+    """
+    Durable SQLite store of the leads to submit, shared by every worker on the host.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        """
+        Opens a connection in autocommit mode, creating the directory and schema on first use.
+        """
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=config.CRM_LEAD_SPOOL_BUSY_TIMEOUT,
+                                     isolation_level=None)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    connection.execute('PRAGMA journal_mode=WAL')
+                    connection.executescript(SCHEMA)
+                    self._initialized = True
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    @staticmethod
+    def dedupe_key(kind, payload):
+        """
+        Returns the dedupe key of a lead.
+        """
+        return hashlib.sha256(f"{kind}|{payload}".encode('utf-8')).hexdigest()
+
+    def put(self, kind, payload):
+        """
+        Stores a lead, returning False when an identical lead is pending or was
+        submitted within the dedupe window.
+
+        An identical lead that failed, or was submitted before the window, is
+        reset to pending with its attempts cleared.
+        """
+        payload = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        now = time.time()
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                'INSERT INTO crm_lead (kind, dedupe_key, payload, created_at, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (dedupe_key) DO UPDATE SET status = ?, attempts = 0,'
+                ' next_attempt_at = 0, claimed_until = 0, last_error = NULL,'
+                ' created_at = excluded.created_at, updated_at = excluded.updated_at'
+                ' WHERE crm_lead.status = ? OR (crm_lead.status = ? AND crm_lead.updated_at < ?)',
+                (kind, self.dedupe_key(kind, payload), payload, now, now,
+                 PENDING, FAILED, DONE, now - config.CRM_LEAD_DEDUPE_WINDOW))
+            return cursor.rowcount == 1
+        finally:
+            connection.close()
+
+    def claim(self, limit):
+        """
+        Claims up to ``limit`` due leads of one kind for submission.
+
+        Returns the kind and a list of (id, payload, attempts) tuples.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT kind FROM crm_lead WHERE status = ? AND next_attempt_at <= ?'
+                ' AND claimed_until <= ? ORDER BY id LIMIT 1',
+                (PENDING, now, now)).fetchone()
+            if row is None:
+                connection.execute('COMMIT')
+                return None, []
+            kind = row[0]
+            leads = connection.execute(
+                'SELECT id, payload, attempts FROM crm_lead WHERE status = ? AND kind = ?'
+                ' AND next_attempt_at <= ? AND claimed_until <= ? ORDER BY id LIMIT ?',
+                (PENDING, kind, now, now, limit)).fetchall()
+            connection.executemany(
+                'UPDATE crm_lead SET claimed_until = ? WHERE id = ?',
+                [(now + config.CRM_LEAD_CLAIM_TIMEOUT, lead[0]) for lead in leads])
+            connection.execute('COMMIT')
+            return kind, leads
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+    def complete(self, lead_ids):
+        """
+        Marks leads as submitted, keeping them until the dedupe window ends.
+        """
+        self._update([(DONE, 0, None, time.time(), lead_id) for lead_id in lead_ids])
+
+    def reject(self, leads, error):
+        """
+        Schedules a retry of the leads, or marks them failed once out of attempts.
+        """
+        now = time.time()
+        updates = []
+        for lead_id, _, attempts in leads:
+            attempts += 1
+            delay = min(config.CRM_LEAD_RETRY_BASE * 2 ** (attempts - 1),
+                        config.CRM_LEAD_RETRY_MAX)
+            status = FAILED if attempts >= config.CRM_LEAD_MAX_ATTEMPTS else PENDING
+            updates.append((status, attempts, now + delay, error, now, lead_id))
+        connection = self._connect()
+        try:
+            connection.executemany(
+                'UPDATE crm_lead SET status = ?, attempts = ?, next_attempt_at = ?,'
+                ' claimed_until = 0, last_error = ?, updated_at = ? WHERE id = ?', updates)
+        finally:
+            connection.close()
+
+    def fail(self, lead_ids, error):
+        """
+        Marks leads as failed for good.
+        """
+        self._update([(FAILED, 0, error, time.time(), lead_id) for lead_id in lead_ids])
+
+    def _update(self, updates):
+        """
+        Sets the status, claim and last error of leads.
+        """
+        connection = self._connect()
+        try:
+            connection.executemany(
+                'UPDATE crm_lead SET status = ?, claimed_until = ?, last_error = ?,'
+                ' updated_at = ? WHERE id = ?', updates)
+        finally:
+            connection.close()
+
+    def purge(self):
+        """
+        Deletes submitted leads older than the dedupe window and failed leads
+        older than their retention.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute(
+                'DELETE FROM crm_lead WHERE (status = ? AND updated_at < ?)'
+                ' OR (status = ? AND updated_at < ?)',
+                (DONE, now - config.CRM_LEAD_DEDUPE_WINDOW,
+                 FAILED, now - config.CRM_LEAD_FAILED_RETENTION))
+        finally:
+            connection.close()
+
+    def stats(self):
+        """
+        Returns the number of leads per status.
+        """
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                'SELECT status, COUNT(*) FROM crm_lead GROUP BY status').fetchall()
+        finally:
+            connection.close()
+        stats = dict.fromkeys((PENDING, DONE, FAILED), 0)
+        stats.update(rows)
+        return stats
+
+
+class LeadQueue:
+    """
+    Enqueues leads to the spool and submits them in OData $batch requests.
+
+    ``kinds`` maps each lead kind to the entity set URL it is posted to and
+    the ``TokenSource`` of the bearer token used for it.
+    """
+
+    def __init__(self, kinds, spool=None):
+        self.kinds = kinds
+        self.spool = spool or LeadSpool(config.CRM_LEAD_SPOOL_PATH)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def enqueue(self, kind, payload):
+        """
+        Spools a lead for submission and returns at once.
+
+        Returns False when an identical lead is pending or was recently submitted.
+        """
+        if kind not in self.kinds:
+            raise ValueError(f"Unsupported lead kind: {kind}")
+        stored = self.spool.put(kind, payload)
+        self._ensure_started()
+        self._wakeup.set()
+        return stored
+
+    def _ensure_started(self):
+        """
+        Starts the worker thread on first use.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="crm-lead-queue",
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """
+        Drains the spool until the process exits.
+        """
+        while True:
+            try:
+                submitted = self.drain()
+            except Exception as e:  # pylint: disable=broad-except
+                submitted = 0
+                custom_log(level='error', request=None,
+                           params={'detail': 'CRM lead queue iteration failed.',
+                                   'body': {'error_msg': repr(e)}})
+            if not submitted:
+                self._wakeup.wait(config.CRM_LEAD_POLL_INTERVAL)
+                self._wakeup.clear()
+
+    def drain(self, max_batches=None):
+        """
+        Submits due leads batch by batch until none is left or ``max_batches`` were sent.
+
+        Returns the number of leads submitted. Can be called from a scheduled job
+        to flush leads spooled by processes that have since exited.
+        """
+        submitted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            kind, leads = self.spool.claim(config.CRM_LEAD_BATCH_SIZE)
+            if not leads:
+                break
+            submitted += self._submit(kind, leads)
+            batches += 1
+        self.spool.purge()
+        return submitted
+
+    def _submit(self, kind, leads):
+        """
+        Posts one $batch of leads and records the outcome of each.
+
+        Returns the number of leads accepted by the CRM.
+        """
+        url, token_source = self.kinds[kind]
+        parts = urlsplit(url)
+        batch_url = url.rsplit('/', 1)[0] + '/$batch'
+        boundary = 'batch_' + uuid.uuid4().hex
+        try:
+            token = tokens.token_manager.get_token(token_source).json()['access_token']
+            headers = {'Authorization': f'Bearer {token}',
+                       'Content-Type': f'multipart/mixed; boundary={boundary}',
+                       'Accept': 'application/json',
+                       'OData-Version': '4.0', 'OData-MaxVersion': '4.0',
+                       'Prefer': 'odata.continue-on-error'}
+            body = build_batch(boundary, parts.path, [lead[1] for lead in leads])
+            with priority_scope(PRIORITY_BULK):
+                response = sessions.post(batch_url, data=body, headers=headers,
+                                         timeout=config.CRM_LEAD_BATCH_TIMEOUT,
+                                         service='CrmLeadBatch')
+        except Exception as e:  # pylint: disable=broad-except
+            self.spool.reject(leads, repr(e))
+            return 0
+        if response.status_code != 200:
+            if response.status_code == 401:
+                tokens.token_manager.invalidate(token_source)
+            if _is_retryable(response.status_code) or response.status_code == 401:
+                self.spool.reject(leads, f'Batch rejected with {response.status_code}')
+            else:
+                self.spool.fail([lead[0] for lead in leads],
+                                f'Batch rejected with {response.status_code}')
+            return 0
+        statuses = parse_batch_statuses(response)
+        accepted, retry, failed = [], [], []
+        for index, lead in enumerate(leads):
+            status = statuses[index] if index < len(statuses) else None
+            if status is None or _is_retryable(status):
+                retry.append(lead)
+            elif status < 300:
+                accepted.append(lead[0])
+            else:
+                failed.append(lead[0])
+        if accepted:
+            self.spool.complete(accepted)
+        if retry:
+            self.spool.reject(retry, 'Lead not accepted in batch')
+        if failed:
+            self.spool.fail(failed, 'Lead rejected by CRM')
+            custom_log(level='error', request=None,
+                       params={'detail': f'{len(failed)} {kind} leads rejected by CRM.',
+                               'body': {'lead_ids': failed}})
+        return len(accepted)
+
+    def stats(self):
+        """
+        Returns the number of spooled leads per status.
+        """
+        return self.spool.stats()
@@ -0,0 +1,162 @@
+"""
+Module providing a background writer for external API log rows.
+
+Adapters enqueue unsaved ``ApiRequestLog`` / ``ApiExternalLog`` instances
+instead of saving them on the request path. A daemon thread collects them
+and writes them with ``bulk_create`` once ``LOG_WRITER_BATCH_SIZE`` rows are
+waiting or ``LOG_WRITER_FLUSH_INTERVAL`` seconds have passed. The queue is
+bounded; when it is full new rows are dropped or the caller waits for room,
+depending on ``LOG_WRITER_OVERFLOW``. At exit the thread finishes the batch
+it holds, then every row still queued is written.
+
+Rows are written later, so they have no primary key when enqueued; code that
+returns a log row to its callers for further updates must save it itself.
+
+Classes:
+- LogWriter: Buffers model instances and writes them in batches.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from django.db import close_old_connections
+from shared_config.logging import custom_log
+from .models import ApiRequestLog, ApiExternalLog
+from . import constants as config
+
+# Parents are written before the rows referencing them.
+WRITE_ORDER = (ApiRequestLog, ApiExternalLog)
+
+
+class LogWriter:
+    """
+    Buffers model instances in a bounded queue and writes them with bulk_create.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_queue=None, overflow=None):
+        self.batch_size = batch_size or config.LOG_WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or config.LOG_WRITER_FLUSH_INTERVAL
+        self.overflow = overflow or config.LOG_WRITER_OVERFLOW
+        self._queue = queue.Queue(maxsize=max_queue or config.LOG_WRITER_MAX_QUEUE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def enqueue(self, instance):
+        """
+        Queues an unsaved model instance for writing.
+
+        Returns False when the instance was dropped because the queue is full.
+        """
+        self._ensure_started()
+        try:
+            if self.overflow == "block":
+                self._queue.put(instance, timeout=config.LOG_WRITER_BLOCK_TIMEOUT)
+            else:
+                self._queue.put_nowait(instance)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """
+        Writes every queued instance from the calling thread.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """
+        Stops the writer thread once its batch is written, then writes every queued instance.
+        """
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(config.LOG_WRITER_SHUTDOWN_TIMEOUT)
+        self.flush()
+
+    def stats(self):
+        """
+        Returns the queue depth and the number of rows written, dropped and failed.
+        """
+        return {'queued': self._queue.qsize(), 'written': self.written,
+                'dropped': self.dropped, 'failed': self.failed}
+
+    def _ensure_started(self):
+        """
+        Starts the writer thread on first use.
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="api-log-writer",
+                                                daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        """
+        Writes batches until the writer is closed.
+        """
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _next_batch(self):
+        """
+        Waits for the first row, then collects more until the batch is full or the interval ends.
+
+        Returns an empty batch when no row arrives within the interval, and
+        stops collecting once the writer is closing.
+        """
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stopping.is_set():
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """
+        Writes a batch with one bulk_create per model.
+        """
+        close_old_connections()
+        by_model = {}
+        for instance in batch:
+            by_model.setdefault(type(instance), []).append(instance)
+        models = [model for model in WRITE_ORDER if model in by_model]
+        models += [model for model in by_model if model not in WRITE_ORDER]
+        for model in models:
+            instances = by_model[model]
+            try:
+                model.objects.bulk_create(instances)
+                self.written += len(instances)
+            except Exception as e:  # pylint: disable=broad-except
+                self.failed += len(instances)
+                custom_log(level='error', request=None,
+                           params={'detail': f'Writing {len(instances)} {model.__name__} rows failed.',
+                                   'body': {'error_msg': repr(e)}})
+
+
+log_writer = LogWriter()
@@ -4,9 +4,25 @@ Module for fetching various policy related data through API calls.
 
 import json
 from datetime import datetime
-import requests
 from shared_config import constants
 from . import constants as config
+from . import sessions
+from . import tokens
+from .base import RequestAdapter
+from .response_cache import CachedRequestAdapter
+from .streaming import StreamingMixin
+
+def vendor_reply_succeeded(response):
+    """
+    Returns whether a receipt or statement reply is a 200 whose ``head.status`` is success.
+    """
+    if response.status_code != 200:
+        return False
+    try:
+        head = json.loads(response.content).get("head") or {}
+    except (ValueError, AttributeError):
+        return False
+    return str(head.get("status", "")).lower() == "success"
 
 class ReceiptAccessToken:
     """
@@ -15,28 +31,52 @@ class ReceiptAccessToken:
     def fetch_data(self):
         """
         Fetches data using receipt access token.
+        The JSON body of the response is cached by the token manager until shortly
+        before it expires; every call returns a new response rebuilt from it.
         """
-        url = config.RECEIPT_ACCESS_TOKEN_URL
-        headers = {'x-api-key': config.RECEIPT_X_API_KEY, 'Content-Type': 'application/json'}
-        request_data = {
-            "head": {
-                "userid": config.RECEIPT_TXN_ID_PREFIX,
-                "source": config.RECEIPT_TXN_ID_PREFIX,
-                "txnid": config.RECEIPT_TXN_ID_PREFIX + datetime.now().strftime("%Y%m%d%H%M%S0")
-            }
+        return tokens.token_manager.get_token(RECEIPT_ACCESS_TOKEN)
+
+def _request_receipt_access_token():
+    """
+    Requests a new receipt access token.
+    """
+    url = config.RECEIPT_ACCESS_TOKEN_URL
+    headers = {'x-api-key': config.RECEIPT_X_API_KEY, 'Content-Type': 'application/json'}
+    request_data = {
+        "head": {
+            "userid": config.RECEIPT_TXN_ID_PREFIX,
+            "source": config.RECEIPT_TXN_ID_PREFIX,
+            "txnid": config.RECEIPT_TXN_ID_PREFIX + datetime.now().strftime("%Y%m%d%H%M%S0")
         }
-        payload = json.dumps(request_data, separators=(',', ':'))
-        response = requests.post(url, payload.encode('utf-8'), headers=headers,
-                                 timeout=constants.DEFAULT_TIMEOUT)
-        return response
+    }
+    payload = json.dumps(request_data, separators=(',', ':'))
+    response = sessions.post(url, payload.encode('utf-8'), headers=headers,
+                             timeout=constants.DEFAULT_TIMEOUT, service='ReceiptAccessToken')
+    return response
 
-class ReceiptDetails:
+RECEIPT_ACCESS_TOKEN = tokens.TokenSource('RECEIPT_ACCESS_TOKEN', _request_receipt_access_token,
+                                          expires_in=tokens.response_expires_in,
+                                          is_valid=tokens.response_is_valid,
+                                          serialize=tokens.response_json,
+                                          restore=tokens.json_response,
+                                          cache_alias=config.TOKEN_CACHE_ALIAS)
+
+class ReceiptDetails(CachedRequestAdapter):
     """
     Fetches detailed receipt information.
     """
-    def fetch_data(self, payload, headers):
+    cache_name = 'RECIEPT_DETAILS_URL'
+    cache_key_fields = ('policy_no', 'client_id')
+
+    def is_valid_response(self, response):
+        """
+        Only cache replies whose head reports success; the vendor sends errors with a 200.
+        """
+        return vendor_reply_succeeded(response)
+
+    def build_request(self, payload, headers):
         """
-        Fetches receipt details using provided payload and headers.
+        Builds the receipt details request using provided payload and headers.
         """
         url = config.RECIEPT_DETAILS_URL
         policy_no = payload["policy_no"]
@@ -55,17 +95,17 @@ class ReceiptDetails:
             }
         }
         payload = json.dumps(request_data, separators=(',', ':'))
-        response = requests.post(url, payload.encode('utf-8'), headers=headers,
-                                 timeout=constants.DEFAULT_TIMEOUT)
-        return response
+        return {'method': 'POST', 'url': url, 'data': payload.encode('utf-8'),
+                'headers': headers, 'timeout': constants.DEFAULT_TIMEOUT}
 
-class ReceiptDetailsPdf:
+class ReceiptDetailsPdf(StreamingMixin, RequestAdapter):
     """
     Fetches PDF receipt details.
+    Use fetch_stream() to stream large documents instead of buffering them.
     """
-    def fetch_data(self, payload, headers):
+    def build_request(self, payload, headers):
         """
-        Fetches PDF receipt details using provided payload and headers.
+        Builds the PDF receipt details request using provided payload and headers.
         """
         url = config.RECIEPT_PDF_URL
         request_data = {
@@ -84,17 +124,33 @@ class ReceiptDetailsPdf:
             }
         }
         payload = json.dumps(request_data, separators=(',', ':'))
-        response = requests.post(url, payload.encode('utf-8'), headers=headers,
-                                 timeout=constants.DEFAULT_TIMEOUT)
-        return response
+        return {'method': 'POST', 'url': url, 'data': payload.encode('utf-8'),
+                'headers': headers, 'timeout': constants.DEFAULT_TIMEOUT}
 
-class AnnualPremiumStatement:
+class AnnualPremiumStatement(StreamingMixin, CachedRequestAdapter):
     """
     Fetches annual premium statement.
+    Use fetch_stream() to stream large documents instead of buffering them.
     """
-    def fetch_data(self, payload, headers):
+    cache_name = 'ANNUAL_PREMIUM_STATEMENT_URL'
+    cache_key_fields = ('policy_no', 'client_id', 'year', 'mode_of_comm')
+
+    def is_valid_response(self, response):
+        """
+        Only cache replies whose head reports success; the vendor sends errors with a 200.
+        """
+        return vendor_reply_succeeded(response)
+
+    def is_cacheable(self, payload):
+        """
+        Only statements viewed in the app are cached; other modes must reach the vendor.
+        """
+        return super().is_cacheable(payload) and \
+            str(payload.get("mode_of_comm", "")).lower() == "view"
+
+    def build_request(self, payload, headers):
         """
-        Fetches annual premium statement using provided payload and headers.
+        Builds the annual premium statement request using provided payload and headers.
         """
         url = config.ANNUAL_PREMIUM_STATEMENT_URL
         request_data = {
@@ -116,17 +172,33 @@ class AnnualPremiumStatement:
             }
         }
         payload = json.dumps(request_data, separators=(',', ':'))
-        response = requests.post(url, payload.encode('utf-8'), headers=headers,
-                                 timeout=constants.DEFAULT_TIMEOUT)
-        return response
+        return {'method': 'POST', 'url': url, 'data': payload.encode('utf-8'),
+                'headers': headers, 'timeout': constants.DEFAULT_TIMEOUT}
 
-class UnitStatement:
+class UnitStatement(StreamingMixin, CachedRequestAdapter):
     """
     Fetches unit statement.
+    Use fetch_stream() to stream large documents instead of buffering them.
     """
-    def fetch_data(self, payload, headers):
+    cache_name = 'UNIT_STATEMENT_URL'
+    cache_key_fields = ('policy_no', 'from_date', 'to_date', 'mode_of_comm')
+
+    def is_valid_response(self, response):
+        """
+        Only cache replies whose head reports success; the vendor sends errors with a 200.
+        """
+        return vendor_reply_succeeded(response)
+
+    def is_cacheable(self, payload):
+        """
+        Only statements viewed in the app are cached; other modes must reach the vendor.
+        """
+        return super().is_cacheable(payload) and \
+            str(payload.get("mode_of_comm", "")).lower() == "view"
+
+    def build_request(self, payload, headers):
         """
-        Fetches unit statement using provided payload and headers.
+        Builds the unit statement request using provided payload and headers.
         """
         url = config.UNIT_STATEMENT_URL
         request_data = {
@@ -147,6 +219,5 @@ class UnitStatement:
             }
         }
         payload = json.dumps(request_data, separators=(',', ':'))
-        response = requests.post(url, payload.encode('utf-8'), headers=headers,
-                                 timeout=constants.DEFAULT_TIMEOUT)
-        return response
+        return {'method': 'POST', 'url': url, 'data': payload.encode('utf-8'),
+                'headers': headers, 'timeout': constants.DEFAULT_TIMEOUT}
@@ -0,0 +1,75 @@
+"""
+Module providing a store of credit bureau reports shared across nodes.
+
+Reports are kept in the Django cache under a hash of (bureau, name, mobile)
+for ``EXPERIAN_REPORT_VALIDITY`` days, so a report pulled once is reused
+instead of being pulled (and billed) again while it is still valid. Only the
+report body is stored, never the response object with the request and its
+credentials; callers store a body only once the bureau's own status in it
+says the report is complete.
+
+Classes:
+- CreditReportStore: Stores bureau reports and returns them with their age.
+"""
+
+import hashlib
+import re
+import time
+from django.core.cache import caches
+from . import constants as config
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class CreditReportStore:
+    """
+    Stores bureau reports keyed by a hash of the bureau and the applicant's details.
+    """
+
+    def __init__(self, cache_alias=None, validity_days=None):
+        self.cache_alias = cache_alias or config.CREDIT_REPORT_CACHE_ALIAS
+        self.validity = (validity_days or config.EXPERIAN_REPORT_VALIDITY) * SECONDS_PER_DAY
+
+    @property
+    def cache(self):
+        """
+        Returns the Django cache holding the reports.
+        """
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def key(bureau, name, mobile):
+        """
+        Returns the cache key for the normalized bureau, name and mobile number.
+        """
+        identity = "|".join([bureau.upper(), " ".join(str(name).lower().split()),
+                             re.sub(r'\D', '', str(mobile))])
+        return "CREDIT_REPORT_" + hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def get(self, bureau, name, mobile):
+        """
+        Returns ``(report_body, age_in_seconds)`` for a still-valid report, or None.
+        """
+        entry = self.cache.get(self.key(bureau, name, mobile))
+        if entry is None:
+            return None
+        age = time.time() - entry['fetched_at']
+        if age >= self.validity:
+            return None
+        return entry['report'], age
+
+    def put(self, bureau, name, mobile, report):
+        """
+        Stores the body (str) of a freshly pulled, validated report.
+        """
+        entry = {'report': report, 'fetched_at': time.time()}
+        self.cache.set(self.key(bureau, name, mobile), entry, timeout=self.validity)
+
+    def invalidate(self, bureau, name, mobile):
+        """
+        Removes the stored report so the next call pulls a new one.
+        """
+        self.cache.delete(self.key(bureau, name, mobile))
+
+
+report_store = CreditReportStore()
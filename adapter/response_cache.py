@@ -0,0 +1,159 @@
+"""
+Module providing an opt-in response cache for read-only adapters.
+
+Adapters deriving from ``CachedRequestAdapter`` name the payload fields that
+identify the business request; responses are cached under a hash of those
+fields for the service's ``RESPONSE_CACHE_TTLS`` entry. Once that expires the
+stale response is still served for ``RESPONSE_CACHE_STALE_TTL`` seconds while
+one worker refetches it in the background.
+
+Only replies passing ``is_valid_response`` are cached, and only their status,
+headers and body, never the request with its auth headers. Every hit gets a
+new response of the caller's type: ``requests.Response`` from ``fetch_data``
+and ``httpx.Response`` from ``afetch_data``.
+
+On every hit the ``log_obj`` passed in the payload, if any, gets its
+``cached`` flag set, so the ``ApiRequestLog`` saved by the caller records it.
+
+Classes:
+- CachedRequestAdapter: RequestAdapter serving successful responses from the cache.
+"""
+
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from django.core.cache import caches
+from shared_config.logging import custom_log
+from .base import RequestAdapter
+from . import constants as config
+from . import responses
+
+
+class CachedRequestAdapter(RequestAdapter):
+    """
+    RequestAdapter whose successful responses are cached by business payload.
+
+    Subclasses set ``cache_name`` to their service type key in
+    ``RESPONSE_CACHE_TTLS`` and ``cache_key_fields`` to the payload fields
+    identifying the request. A TTL of 0 disables caching for the service.
+    """
+
+    cache_name = None
+    cache_key_fields = ()
+
+    @property
+    def cache_ttl(self):
+        """
+        Returns the number of seconds a response is served as fresh.
+        """
+        return config.RESPONSE_CACHE_TTLS.get(self.cache_name, 0)
+
+    def response_cache_key(self, payload):
+        """
+        Returns the cache key built from the normalized business fields of the payload.
+        """
+        values = [str(payload.get(field, '')).strip() for field in self.cache_key_fields]
+        digest = hashlib.sha256(json.dumps(values).encode('utf-8')).hexdigest()
+        return f"RESPONSE_{self.cache_name}_{digest}"
+
+    def is_cacheable(self, payload):
+        """
+        Returns whether the response to this payload may be cached.
+        """
+        return bool(self.cache_ttl)
+
+    def is_valid_response(self, response):
+        """
+        Returns whether a response may be cached: a 200 reply with a JSON body.
+
+        Services reporting errors inside a 200 body override this to check them.
+        """
+        if response.status_code != 200:
+            return False
+        try:
+            json.loads(response.content)
+        except ValueError:
+            return False
+        return True
+
+    def fetch_data(self, payload, *args):
+        """
+        Returns the cached response for the payload, sending the request on a miss.
+        """
+        if not self.is_cacheable(payload):
+            return super().fetch_data(payload, *args)
+        key = self.response_cache_key(payload)
+        response = self._cached_response(key, payload, args, responses.to_requests)
+        if response is None:
+            response = super().fetch_data(payload, *args)
+            self._store(key, response)
+        return response
+
+    async def afetch_data(self, payload, *args):
+        """
+        Returns the cached response for the payload, awaiting the request on a miss.
+        """
+        if not self.is_cacheable(payload):
+            return await super().afetch_data(payload, *args)
+        key = self.response_cache_key(payload)
+        response = self._cached_response(key, payload, args, responses.to_httpx)
+        if response is None:
+            response = await super().afetch_data(payload, *args)
+            self._store(key, response)
+        return response
+
+    def _cached_response(self, key, payload, args, rebuild):
+        """
+        Returns a new response built by ``rebuild`` from the cached one, starting a
+        background refetch if it is stale.
+        """
+        entry = caches[config.RESPONSE_CACHE_ALIAS].get(key)
+        if entry is None or 'snapshot' not in entry:
+            return None
+        log_obj = payload.get("log_obj")
+        if log_obj is not None:
+            log_obj.cached = True
+        if time.time() >= entry['fresh_until']:
+            self._revalidate(key, payload, args)
+        return rebuild(entry['snapshot'])
+
+    def _store(self, key, response):
+        """
+        Caches the status, headers and body of a valid response.
+        """
+        if not self.is_valid_response(response):
+            return
+        entry = {'snapshot': responses.snapshot(response),
+                 'fresh_until': time.time() + self.cache_ttl}
+        caches[config.RESPONSE_CACHE_ALIAS].set(
+            key, entry, timeout=self.cache_ttl + config.RESPONSE_CACHE_STALE_TTL)
+
+    def _revalidate(self, key, payload, args):
+        """
+        Refetches a stale response in the background unless another worker already is.
+
+        The refetch runs in a copy of the caller's context, keeping its priority.
+        """
+        cache = caches[config.RESPONSE_CACHE_ALIAS]
+        lock_key = key + ':revalidate'
+        if not cache.add(lock_key, 1, timeout=config.RESPONSE_CACHE_REVALIDATE_LOCK):
+            return
+        thread = threading.Thread(target=contextvars.copy_context().run,
+                                  args=(self._refetch, key, lock_key, payload, args),
+                                  name=f"revalidate-{self.cache_name}", daemon=True)
+        thread.start()
+
+    def _refetch(self, key, lock_key, payload, args):
+        """
+        Sends the request and replaces the cached response.
+        """
+        try:
+            self._store(key, RequestAdapter.fetch_data(self, payload, *args))
+        except Exception as e:  # pylint: disable=broad-except
+            custom_log(level='error', request=None,
+                       params={'detail': f'Revalidating {self.cache_name} response failed.',
+                               'body': {'error_msg': repr(e)}})
+        finally:
+            caches[config.RESPONSE_CACHE_ALIAS].delete(lock_key)
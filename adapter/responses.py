@@ -0,0 +1,94 @@
+"""
+Module converting HTTP responses to and from plain, cacheable snapshots.
+
+A snapshot keeps only the status code, headers and body of a response, never
+the request that produced it, whose headers and body may carry credentials.
+Responses rebuilt from a snapshot are new objects of the type the caller
+expects: ``requests.Response`` on the blocking path and ``httpx.Response``
+on the asyncio path.
+
+Functions:
+- snapshot(response): Returns the cacheable snapshot of a response.
+- json_snapshot(data): Returns the snapshot of a successful JSON reply carrying ``data``.
+- to_requests(snapshot_data): Rebuilds a ``requests.Response`` from a snapshot.
+- to_httpx(snapshot_data): Rebuilds an ``httpx.Response`` from a snapshot.
+- as_requests(response): Converts an ``httpx.Response`` into a ``requests.Response``.
+- is_xml_response(response): Checks whether a response declares an XML body.
+- is_soap_fault(content): Checks whether a SOAP reply body is a fault.
+"""
+
+import json
+import re
+import requests
+
+# The snapshot body is already decoded and complete, so these no longer apply.
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+FAULT_PATTERN = re.compile(rb'<(?:[\w.-]+:)?Fault[\s/>]')
+
+
+def snapshot(response):
+    """
+    Returns the status code, headers and body of a ``requests`` or ``httpx`` response.
+    """
+    headers = {name: value for name, value in response.headers.items()
+               if name.lower() not in DROPPED_HEADERS}
+    return {'status_code': response.status_code, 'headers': headers,
+            'content': response.content}
+
+
+def json_snapshot(data):
+    """
+    Returns the snapshot of a 200 reply with ``data`` as its JSON body.
+    """
+    return {'status_code': 200, 'headers': {'Content-Type': 'application/json'},
+            'content': json.dumps(data).encode('utf-8')}
+
+
+def to_requests(snapshot_data, url=None):
+    """
+    Builds a new ``requests.Response`` from a snapshot.
+    """
+    response = requests.Response()
+    response.status_code = snapshot_data['status_code']
+    response.headers.update(snapshot_data['headers'])
+    response._content = snapshot_data['content']  # pylint: disable=protected-access
+    response.url = url
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    return response
+
+
+def to_httpx(snapshot_data, method='GET', url=''):
+    """
+    Builds a new ``httpx.Response`` from a snapshot.
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    return httpx.Response(snapshot_data['status_code'], headers=snapshot_data['headers'],
+                          content=snapshot_data['content'], request=httpx.Request(method, url))
+
+
+def as_requests(response):
+    """
+    Returns an ``httpx.Response`` as a new ``requests.Response``, and any other value unchanged.
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    if not isinstance(response, httpx.Response):
+        return response
+    return to_requests(snapshot(response), url=str(response.url) or None)
+
+
+def is_xml_response(response):
+    """
+    Returns whether a response declares an XML body, as SOAP 1.1 and 1.2 replies do.
+    """
+    content_type = response.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+    return content_type.endswith('/xml') or content_type.endswith('+xml')
+
+
+def is_soap_fault(content):
+    """
+    Returns whether a SOAP reply body carries a ``Fault`` element.
+    """
+    return FAULT_PATTERN.search(content) is not None
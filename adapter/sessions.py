@@ -0,0 +1,414 @@
+"""
+Module providing pooled HTTP sessions shared by every adapter.
+
+Each upstream host (scheme + netloc) gets one ``requests.Session`` whose
+connection pool is kept alive between calls, so repeated requests to the
+same host reuse the TCP/TLS connection instead of handshaking every time.
+
+The asyncio path keeps one ``httpx.AsyncClient`` per host and event loop.
+httpx is an optional dependency (``pip install adapter[async]``) and is
+imported only when an async request is first made.
+
+Both paths go through the host's circuit breaker (see ``circuit_breaker``),
+so calls to an upstream that keeps failing fail fast instead of waiting
+for a timeout. Calls naming a ``service`` get a timeout adapted to that
+service's observed latency (see ``latency``), with the timeout passed by
+the caller as a ceiling. The calls in flight to each host are bounded
+by an adaptive concurrency limit (see ``concurrency``), part of which is
+reserved for interactive calls over bulk ones. Only transport errors,
+timeouts and 5xx replies count against an upstream; a 500 carrying a SOAP
+fault is a business error, such as an unknown policy number, and counts as
+a healthy reply.
+
+Pooled sessions and clients are shared by every user, so they never store
+cookies: a ``Set-Cookie`` from an upstream is not replayed on later calls.
+
+Functions:
+- get_session(url): Returns the pooled session for the host of the given URL.
+- request(method, url, **kwargs): Sends a request through the pooled session.
+- is_failure(response): Checks whether a reply counts against the upstream.
+- record_stream_outcome(response, outcome): Records how reading a streamed body ended.
+- get(url, **kwargs) / post(url, data=None, **kwargs): Shortcuts mirroring ``requests``.
+- pool_stats(): Returns connection pool statistics per host for monitoring.
+- close_all(): Closes every pooled session.
+- arequest(method, url, **kwargs): Sends a request through the pooled async client.
+- aclose_all(): Closes the async clients of the running event loop.
+- concurrency_stats(): Returns the concurrency limit and queue depth per host.
+"""
+
+import asyncio
+import http.cookiejar
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from . import constants as config
+from . import latency
+from . import responses
+from .circuit_breaker import get_breaker
+from .concurrency import get_limiter, limiter_stats
+
+_sessions = {}
+_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+# How reading a streamed body ended; a response closed with neither was abandoned.
+STREAM_COMPLETED = 'completed'
+STREAM_FAILED = 'failed'
+
+
+def _host_key(url):
+    """
+    Returns the registry key (scheme://netloc) for the given URL.
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _no_cookies_policy():
+    """
+    Returns a cookie policy accepting no cookie from any domain.
+    """
+    return http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
+
+def _build_session():
+    """
+    Builds a session with a keep-alive connection pool, retries disabled and no cookie jar.
+    """
+    session = requests.Session()
+    session.cookies.set_policy(_no_cookies_policy())
+    adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_CONNECTIONS,
+                          pool_maxsize=config.HTTP_POOL_MAXSIZE,
+                          max_retries=config.HTTP_MAX_RETRIES,
+                          pool_block=config.HTTP_POOL_BLOCK)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(url):
+    """
+    Returns the pooled session for the host of the given URL, creating it on first use.
+    """
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session()
+                _sessions[key] = session
+    return session
+
+
+class _Call:
+    """
+    Guards one upstream call with the host's concurrency limiter and circuit breaker.
+    """
+
+    def __init__(self, url, service, timeout=None):
+        host = _host_key(url)
+        self.url = url
+        self.service = service
+        self.read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        self.limiter = get_limiter(host) if config.CONCURRENCY_LIMIT_ENABLED else None
+        self.breaker = get_breaker(host) if config.CIRCUIT_BREAKER_ENABLED else None
+        self.ticket = None
+        self.probe = False
+        self.started = None
+
+    def start(self):
+        """
+        Waits for a concurrency slot, then checks the circuit.
+        """
+        if self.limiter is not None:
+            self.ticket = self.limiter.acquire(self.url)
+        self._check_circuit()
+
+    async def astart(self):
+        """
+        Waits for a concurrency slot without blocking the event loop, then checks the circuit.
+        """
+        if self.limiter is not None:
+            self.ticket = await self.limiter.aacquire(self.url)
+        self._check_circuit()
+
+    def _check_circuit(self):
+        """
+        Raises while the circuit is open, giving the slot back first.
+        """
+        try:
+            if self.breaker is not None:
+                self.probe = self.breaker.before_call(self.url)
+        except Exception:
+            if self.limiter is not None:
+                self.limiter.release(self.ticket)
+            raise
+        self.started = time.monotonic()
+
+    def abandoned(self):
+        """
+        Frees the slot of a call cancelled before it completed, without judging the upstream.
+        """
+        if self.breaker is not None and self.probe:
+            self.breaker.cancel_probe()
+        if self.limiter is not None:
+            self.limiter.release(self.ticket)
+
+    def failed(self, timed_out=False):
+        """
+        Reports a call that raised.
+
+        A call that ``timed_out`` reading the reply is recorded as a latency sample
+        at its read timeout, so a service that keeps timing out gets a longer timeout.
+        """
+        if self.breaker is not None:
+            self.breaker.record(False, self.probe)
+        if self.limiter is not None:
+            self.limiter.release(self.ticket, False, self.service)
+        if timed_out and self.service is not None and self.read_timeout is not None:
+            latency.record(self.service, self.read_timeout)
+
+    def finished(self, status_code, failure):
+        """
+        Reports a completed call to the breaker, the limiter and the latency tracker.
+
+        ``failure`` tells whether the reply shows the upstream failing (see ``is_failure``).
+        """
+        elapsed = time.monotonic() - self.started
+        success = not failure
+        if self.breaker is not None:
+            self.breaker.record(success and elapsed < config.CIRCUIT_SLOW_CALL_SECONDS,
+                                self.probe)
+        if self.limiter is not None:
+            self.limiter.release(self.ticket, success, self.service, status_code)
+        if success and self.service is not None:
+            latency.record(self.service, elapsed)
+
+
+def is_failure(response, stream=False):
+    """
+    Returns whether a reply shows the upstream failing rather than answering.
+
+    SOAP services answer business faults with a 500 and a ``Fault`` body,
+    which is a healthy reply. The body of a streamed reply is not read yet,
+    so a 500 with an XML content type is trusted to be such a fault.
+    """
+    if response.status_code < 500:
+        return False
+    if response.status_code != 500 or not responses.is_xml_response(response):
+        return True
+    return not stream and not responses.is_soap_fault(response.content)
+
+
+def request(method, url, service=None, **kwargs):
+    """
+    Sends a request through the pooled session of the URL's host.
+
+    Accepts the same keyword arguments as ``requests.request``. When
+    ``service`` is given, the timeout adapts to the latency of that service
+    and the call's latency is recorded. Raises GenericException
+    without sending anything while the host's circuit is open or no
+    concurrency slot frees up in time.
+
+    With ``stream=True`` the call holds its concurrency slot, and its latency
+    runs, until the response is closed; the caller must close it, after
+    reporting how the read ended with ``record_stream_outcome``.
+    """
+    if service is not None:
+        kwargs['timeout'] = latency.adaptive_timeout(service, kwargs.get('timeout'))
+    call = _Call(url, service, kwargs.get('timeout'))
+    call.start()
+    try:
+        response = get_session(url).request(method, url, **kwargs)
+    except Exception as e:
+        call.failed(timed_out=isinstance(e, requests.ReadTimeout))
+        raise
+    except BaseException:
+        call.abandoned()
+        raise
+    if kwargs.get('stream'):
+        _finish_on_close(response, call)
+    else:
+        call.finished(response.status_code, is_failure(response))
+    return response
+
+
+def record_stream_outcome(response, outcome):
+    """
+    Records whether the body of a streamed response was read in full
+    (``STREAM_COMPLETED``) or the read raised (``STREAM_FAILED``).
+    """
+    response._stream_outcome = outcome  # pylint: disable=protected-access
+
+
+def _finish_on_close(response, call):
+    """
+    Reports a streamed call once its response is closed, as recorded by
+    ``record_stream_outcome``.
+
+    A response closed with no outcome was given up by its reader and frees the
+    slot only. An error reply is judged on its status line alone, so it counts
+    as completed even when its body is never read.
+    """
+    close = response.close
+    reported = []
+    if response.status_code >= 400:
+        record_stream_outcome(response, STREAM_COMPLETED)
+
+    def close_and_report():
+        try:
+            close()
+        finally:
+            if not reported:
+                reported.append(True)
+                outcome = getattr(response, '_stream_outcome', None)
+                if outcome == STREAM_COMPLETED:
+                    call.finished(response.status_code, is_failure(response, stream=True))
+                elif outcome == STREAM_FAILED:
+                    call.failed()
+                else:
+                    call.abandoned()
+
+    response.close = close_and_report
+
+
+def get(url, **kwargs):
+    """
+    Sends a GET request through the pooled session.
+    """
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    """
+    Sends a POST request through the pooled session.
+    """
+    return request('POST', url, data=data, **kwargs)
+
+
+def pool_stats():
+    """
+    Returns connection pool statistics for every registered host.
+
+    Returns:
+        dict: Mapping of host to a dict with the pool size, the number of
+        connections opened, the number of requests sent and the number of
+        idle connections currently held in the pool.
+    """
+    stats = {}
+    for key, session in list(_sessions.items()):
+        host_stats = {'pool_maxsize': config.HTTP_POOL_MAXSIZE, 'connections': 0,
+                      'requests': 0, 'idle': 0}
+        adapter = session.get_adapter(key + '/')
+        pools = adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            host_stats['connections'] += pool.num_connections
+            host_stats['requests'] += pool.num_requests
+            if pool.pool is not None:
+                host_stats['idle'] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        stats[key] = host_stats
+    return stats
+
+
+def close_all():
+    """
+    Closes every pooled session and clears the registry.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _get_async_client(url, verify):
+    """
+    Returns the pooled async client for the URL's host on the running event loop.
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    key = (_host_key(url), verify)
+    client = clients.get(key)
+    if client is None:
+        limits = httpx.Limits(max_connections=config.HTTP_POOL_MAXSIZE,
+                              max_keepalive_connections=config.HTTP_POOL_MAXSIZE)
+        client = httpx.AsyncClient(limits=limits, verify=verify)
+        client.cookies.jar.set_policy(_no_cookies_policy())
+        clients[key] = client
+    return client
+
+
+def _async_timeout(timeout):
+    """
+    Converts a ``requests`` style timeout into an httpx timeout.
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+async def arequest(method, url, data=None, json=None, headers=None, timeout=None,
+                   verify=True, service=None):
+    """
+    Sends a request through the pooled async client of the URL's host.
+
+    Accepts the ``requests`` keyword arguments used by the adapters and
+    returns an ``httpx.Response``. Transport errors are re-raised as the
+    matching ``requests`` exceptions so callers handle both paths alike.
+    ``service`` adapts the timeout as in ``request``.
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    if service is not None:
+        timeout = latency.adaptive_timeout(service, timeout)
+    kwargs = {'headers': headers, 'timeout': _async_timeout(timeout), 'json': json}
+    if isinstance(data, (str, bytes)):
+        kwargs['content'] = data
+    elif data:
+        kwargs['data'] = data
+    client = _get_async_client(url, verify)
+    call = _Call(url, service, timeout)
+    await call.astart()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except Exception as e:
+        call.failed(timed_out=isinstance(e, httpx.ReadTimeout))
+        if isinstance(e, httpx.TimeoutException):
+            raise requests.Timeout(str(e)) from e
+        if isinstance(e, httpx.TransportError):
+            raise requests.ConnectionError(str(e)) from e
+        if isinstance(e, httpx.RequestError):
+            raise requests.RequestException(str(e)) from e
+        raise
+    except BaseException:
+        call.abandoned()
+        raise
+    call.finished(response.status_code, is_failure(response))
+    return response
+
+
+async def aclose_all():
+    """
+    Closes every async client created on the running event loop.
+    """
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def concurrency_stats():
+    """
+    Returns the adaptive concurrency limit, calls in flight and queue depth per host.
+    """
+    return limiter_stats()
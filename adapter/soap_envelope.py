@@ -0,0 +1,35 @@
+"""
+Module locating the SOAP envelope inside a raw reply without decoding it.
+
+TEBT replies may carry transport framing around the envelope. The envelope
+is found with ``bytes.find`` on the raw reply and sliced out once; a reply
+that is exactly the envelope is returned as is.
+
+Functions:
+- extract_envelope(reply): Returns the SOAP envelope contained in a reply.
+"""
+
+ENVELOPE_TAGS = (
+    (b'<soapenv:Envelope', b'</soapenv:Envelope>'),
+    (b'<soap:Envelope', b'</soap:Envelope>'),
+)
+
+
+def extract_envelope(reply):
+    """
+    Returns the bytes from the first envelope start tag through its end tag.
+
+    A missing end tag is appended, and a reply without any envelope is returned unchanged.
+    """
+    for start_tag, end_tag in ENVELOPE_TAGS:
+        start = reply.find(start_tag)
+        if start == -1:
+            continue
+        end = reply.find(end_tag, start)
+        if end == -1:
+            return reply[start:] + end_tag
+        end += len(end_tag)
+        if start == 0 and end == len(reply):
+            return reply
+        return reply[start:end]
+    return reply
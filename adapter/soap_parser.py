@@ -0,0 +1,129 @@
+"""
+Module providing incremental extraction of fields from SOAP replies.
+
+The reply is fed to an ``XMLPullParser`` chunk by chunk as it is read from
+the socket. Only elements whose local tag name is configured are kept;
+every other element is removed from its parent as soon as it ends, so
+neither the reply text nor a full tree is held in memory.
+
+Classes:
+- SoapFieldsMixin: Adds ``fetch_fields`` to a RequestAdapter.
+
+Functions:
+- parse_fields(chunks, fields): Extracts the configured fields from XML chunks.
+"""
+
+from xml.etree.ElementTree import ParseError, XMLPullParser
+from . import sessions
+from .responses import is_xml_response
+from .streaming import iter_response
+
+FAULT_FIELDS = ('faultcode', 'faultstring')
+
+
+def local_name(tag):
+    """
+    Returns the tag name without its namespace.
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def element_value(element):
+    """
+    Returns the text of a leaf element, or a dict of its children otherwise.
+    """
+    if len(element) == 0:
+        return element.text
+    value = {}
+    for child in element:
+        add_value(value, local_name(child.tag), element_value(child))
+    return value
+
+
+def add_value(result, name, value):
+    """
+    Adds a value under name, turning repeated names into lists.
+    """
+    if name not in result:
+        result[name] = value
+    elif isinstance(result[name], list):
+        result[name].append(value)
+    else:
+        result[name] = [result[name], value]
+
+
+def parse_fields(chunks, fields):
+    """
+    Extracts the elements named in fields from a stream of XML chunks.
+
+    Returns a dict keyed by local tag name; leaf elements map to their text,
+    elements with children to a dict, and repeated elements to a list.
+    """
+    wanted = set(fields)
+    parser = XMLPullParser(events=('start', 'end'))
+    result = {}
+    depth = 0
+    # Open elements; the parent of an ended element is the last one left.
+    open_elements = []
+    started = False
+    for chunk in chunks:
+        if not started:
+            # Skip anything sent before the XML itself, such as a BOM or blank lines.
+            start = chunk.find(b'<')
+            if start == -1:
+                continue
+            chunk = chunk[start:]
+            started = True
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            name = local_name(element.tag)
+            if event == 'start':
+                open_elements.append(element)
+                if name in wanted:
+                    depth += 1
+                continue
+            open_elements.pop()
+            if name in wanted:
+                add_value(result, name, element_value(element))
+                depth -= 1
+            if depth == 0:
+                if open_elements:
+                    open_elements[-1].remove(element)
+                else:
+                    element.clear()
+    parser.close()
+    return result
+
+
+class SoapFieldsMixin:
+    """
+    Adds a parsed-response mode to a RequestAdapter sending SOAP requests.
+
+    Subclasses set ``response_fields`` to the local tag names to extract.
+    """
+
+    response_fields = ()
+
+    def fetch_fields(self, *args, fields=None):
+        """
+        Sends the request and returns only the configured fields of the SOAP reply.
+
+        SOAP faults come back as a 500 with an XML body; those are parsed too,
+        with ``faultcode`` and ``faultstring`` added to the fields. Raises
+        ``requests.HTTPError`` for other unsuccessful replies, and ``ParseError``
+        for malformed XML, which counts as a failed call.
+        """
+        response = sessions.request(stream=True, **self.prepare_request(*args))
+        fields = tuple(fields or self.response_fields)
+        if response.status_code == 500 and is_xml_response(response):
+            fields += FAULT_FIELDS
+        elif response.status_code >= 400:
+            response.close()
+            response.raise_for_status()
+        try:
+            return parse_fields(iter_response(response), fields)
+        except ParseError:
+            sessions.record_stream_outcome(response, sessions.STREAM_FAILED)
+            raise
+        finally:
+            response.close()
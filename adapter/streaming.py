@@ -0,0 +1,174 @@
+"""
+Module providing streaming downloads for document adapters.
+
+Responses are read in ``STREAM_CHUNK_SIZE`` chunks instead of being buffered,
+and documents embedded as a base64 string in a JSON reply are decoded as the
+chunks arrive, so memory use stays flat whatever the document size. A
+download holds its host's concurrency slot until the body is read and the
+response closed, so callers must exhaust or close the returned generator.
+
+Classes:
+- StreamingMixin: Adds ``fetch_stream`` to a RequestAdapter.
+- Base64FieldDecoder: Incrementally decodes a base64 string field of a JSON stream.
+
+Functions:
+- iter_response(response, chunk_size): Yields the raw body of a streamed response.
+- iter_base64_field(chunks, field): Yields the decoded bytes of a base64 JSON field.
+- stream_to_file(chunks, destination): Writes chunks to a path or file object.
+"""
+
+import base64
+import re
+from . import constants as config
+from . import sessions
+
+
+def iter_response(response, chunk_size=None):
+    """
+    Yields the body of a streamed response in chunks and releases the connection at the end.
+
+    Whether the body was read in full or the read failed is recorded on the
+    response before it is closed; a generator closed early records neither.
+    """
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size or config.STREAM_CHUNK_SIZE):
+            if chunk:
+                yield chunk
+    except Exception:
+        sessions.record_stream_outcome(response, sessions.STREAM_FAILED)
+        raise
+    else:
+        sessions.record_stream_outcome(response, sessions.STREAM_COMPLETED)
+    finally:
+        response.close()
+
+
+class Base64FieldDecoder:
+    """
+    Incrementally decodes the base64 string value of one field in a JSON stream.
+
+    Feed the JSON body chunk by chunk; each call returns the bytes decoded so
+    far. Text before the field is skipped and text after its closing quote is
+    ignored. JSON escapes found in base64 payloads (``\\/``, ``\\n``, ``\\r``)
+    are handled.
+    """
+
+    ESCAPES = {b'/': b'/', b'n': b'', b'r': b''}
+
+    def __init__(self, field):
+        self._start = re.compile(rb'"' + re.escape(field.encode('utf-8')) + rb'"\s*:\s*"')
+        self._buffer = b''
+        self._pending = b''
+        self._state = 'search'
+
+    def feed(self, chunk):
+        """
+        Consumes a chunk of the JSON body and returns the newly decoded bytes.
+        """
+        if self._state == 'done':
+            return b''
+        data = self._buffer + chunk
+        self._buffer = b''
+        if self._state == 'search':
+            match = self._start.search(data)
+            if match is None:
+                # Keep enough of the tail to match a field name split across chunks.
+                self._buffer = data[-(len(self._start.pattern) + 16):]
+                return b''
+            self._state = 'value'
+            data = data[match.end():]
+        end = data.find(b'"')
+        if end != -1:
+            data = data[:end]
+            self._state = 'done'
+        elif data.endswith(b'\\'):
+            self._buffer = b'\\'
+            data = data[:-1]
+        return self._decode(self._unescape(data), final=self._state == 'done')
+
+    def close(self):
+        """
+        Raises ValueError if the field was not found or never closed.
+        """
+        if self._state != 'done':
+            raise ValueError("Base64 field not found or truncated in the response")
+
+    def _unescape(self, data):
+        """
+        Removes the JSON escapes that may appear inside a base64 string.
+        """
+        if b'\\' not in data:
+            return data
+        parts = data.split(b'\\')
+        return parts[0] + b''.join(self.ESCAPES.get(part[:1], part[:1]) + part[1:]
+                                   for part in parts[1:])
+
+    def _decode(self, data, final):
+        """
+        Decodes whole base64 quanta, carrying the remainder over to the next chunk.
+        """
+        data = self._pending + data
+        if final:
+            self._pending = b''
+            return base64.b64decode(data) if data else b''
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return base64.b64decode(data[:usable]) if usable else b''
+
+
+def iter_base64_field(chunks, field):
+    """
+    Yields the decoded bytes of the base64 string field ``field`` of a JSON stream.
+    """
+    decoder = Base64FieldDecoder(field)
+    for chunk in chunks:
+        decoded = decoder.feed(chunk)
+        if decoded:
+            yield decoded
+    decoder.close()
+
+
+def stream_to_file(chunks, destination):
+    """
+    Writes chunks to a file path or a binary file object and returns the number of bytes written.
+    """
+    if hasattr(destination, 'write'):
+        return _write_chunks(chunks, destination)
+    with open(destination, 'wb') as file_obj:
+        return _write_chunks(chunks, file_obj)
+
+
+def _write_chunks(chunks, file_obj):
+    """
+    Writes chunks to an open binary file object.
+    """
+    written = 0
+    for chunk in chunks:
+        file_obj.write(chunk)
+        written += len(chunk)
+    return written
+
+
+class StreamingMixin:
+    """
+    Adds a streaming mode to a RequestAdapter.
+    """
+
+    def fetch_stream(self, *args, base64_field=None, chunk_size=None):
+        """
+        Sends the request and yields the response body in chunks.
+
+        When ``base64_field`` is given, the reply is treated as JSON and the
+        decoded content of that base64 field is yielded instead. The generator
+        can be passed to ``stream_to_file`` or to a ``StreamingHttpResponse``;
+        it holds the host's concurrency slot until exhausted or closed.
+        Raises ``requests.HTTPError`` for unsuccessful replies.
+        """
+        response = sessions.request(stream=True, **self.prepare_request(*args))
+        if response.status_code >= 400:
+            response.close()
+            response.raise_for_status()
+        chunks = iter_response(response, chunk_size)
+        if base64_field:
+            return iter_base64_field(chunks, base64_field)
+        return chunks
@@ -13,17 +13,27 @@ Classes:
 
 Functions:
 - get_wsdl_endpoint_url(wsdl_url, request): Retrieves the endpoint URL for a given WSDL URL.
+- get_suds_client(wsdl_url, request, proxy): Returns a suds client cloned from a cached prototype.
+- get_wsdl_cache(): Returns the on-disk WSDL cache, creating it on first use.
 
 Constants:
 - Various constants imported from the config module for configuration purposes.
 
 Exceptions:
 - GenericException: Custom exception for handling API errors specific to TEBT services.
+
+Logging:
+- SOAP envelopes are serialized into the TEBT request/response log lines only
+  while the ``adapter.tebt_services`` logger is enabled for DEBUG.
 """
 
+import contextvars
 import json
+import logging
 import sys
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from shared_config import constants
 from shared_config.logging import custom_log
 from shared_config.exceptions import GenericException
@@ -33,6 +43,14 @@ from custom_suds.client import Client as suds_client
 from custom_suds.plugin import MessagePlugin
 from custom_suds.cache import ObjectCache
 from . import constants as config
+from . import latency
+from . import sessions
+from . import tokens
+from .base import BatchResult, RequestAdapter
+from .soap_envelope import extract_envelope
+
+soap_body_logger = logging.getLogger(__name__)
+from .soap_parser import SoapFieldsMixin
 
 class TokenUrl:
     """Handles fetching of token from a specified URL."""
@@ -40,45 +58,73 @@ class TokenUrl:
     def fetch_data(self):
         """Fetches token from the generate token URL.
 
+        The JSON body of the response is cached by the token manager until shortly
+        before it expires; every call returns a new response rebuilt from it.
+
         Returns:
             requests.Response: Response object from the API call.
         """
-        url = config.GENERATE_TOKEN_URL
-        headers = {'Content-type': 'application/json',
-                   'Authorization': config.AUTH_TOKEN_FOR_GENERATE_TOKEN}
-        response = requests.get(url, headers=headers, timeout=config.REQUEST_TIMEOUT)
-        return response
+        return tokens.token_manager.get_token(GENERATE_TOKEN)
 
-class AppLogin:
+def _request_generate_token():
+    """Requests a new token from the generate token URL.
+
+    Returns:
+        requests.Response: Response object from the API call.
+    """
+    url = config.GENERATE_TOKEN_URL
+    headers = {'Content-type': 'application/json',
+               'Authorization': config.AUTH_TOKEN_FOR_GENERATE_TOKEN}
+    response = sessions.get(url, headers=headers, timeout=config.REQUEST_TIMEOUT,
+                            service='TokenUrl')
+    return response
+
+GENERATE_TOKEN = tokens.TokenSource('GENERATE_TOKEN', _request_generate_token,
+                                    expires_in=tokens.response_expires_in,
+                                    is_valid=tokens.response_is_valid,
+                                    serialize=tokens.response_json, restore=tokens.json_response,
+                                    cache_alias=config.TOKEN_CACHE_ALIAS)
+
+class AppLogin(RequestAdapter):
     """Handles login to the application."""
 
-    def fetch_data(self, payload, headers):
-        """Performs application login.
+    def build_request(self, payload, headers):
+        """Builds the application login request.
 
         Args:
             payload (dict): Login payload.
             headers (dict): Headers for the request.
 
         Returns:
-            requests.Response: Response object from the API call.
+            dict: Request passed to the pooled session.
         """
         url = config.CP_APP_LOGIN_URL
         params_str = json.dumps(payload)
-        response = requests.post(url=url, data=params_str.encode('utf-8'), headers=headers,
-                                 timeout=constants.DEFAULT_TIMEOUT)
-        return response
+        return {'method': 'POST', 'url': url, 'data': params_str.encode('utf-8'),
+                'headers': headers, 'timeout': constants.DEFAULT_TIMEOUT}
 
-class TebtPanValidate:
+class TebtPanValidate(RequestAdapter):
     """Handles validation of PAN numbers with TEBT service."""
 
-    def fetch_data(self, payload):
-        """Validates PAN number with TEBT service.
+    def build_request(self, payload):
+        """Builds the PAN validation request for the TEBT service.
 
         Args:
             payload (dict): Payload containing PAN number.
 
         Returns:
-            requests.Response: Response object from the API call.
+            dict: Request passed to the pooled session.
+        """
+        return self.build_batch_request([payload['pan_no']])
+
+    def build_batch_request(self, pan_numbers):
+        """Builds a PAN validation request carrying several PAN numbers.
+
+        Args:
+            pan_numbers (list): PAN numbers to validate.
+
+        Returns:
+            dict: Request passed to the pooled session.
         """
         url = config.TEBT_PAN_VALIDATION
         request_data = {
@@ -94,17 +140,75 @@ class TebtPanValidate:
             "panreq": {
                 "pandetails": [
                     {
-                        "pannumber": payload['pan_no'],
+                        "pannumber": pan_number,
                         "partyrk": ""
                     }
+                    for pan_number in pan_numbers
                 ]
             }
         }
-        response = requests.get(url, data=json.dumps(request_data), timeout=config.REQUEST_TIMEOUT)
-        return response
+        return {'method': 'GET', 'url': url, 'data': json.dumps(request_data),
+                'timeout': config.REQUEST_TIMEOUT}
+
+    def fetch_batch(self, pan_numbers):
+        """Validates many PAN numbers with as few TEBT calls as possible.
+
+        PAN numbers are de-duplicated, split into chunks of ``TEBT_PAN_BATCH_SIZE``
+        and validated with up to ``TEBT_PAN_BATCH_CONCURRENCY`` requests in flight,
+        each with the caller's context, so a ``priority_scope`` applies to them.
+
+        Args:
+            pan_numbers (list): PAN numbers to validate.
+
+        Returns:
+            dict: ``BatchResult(result, error)`` per upper-cased PAN number, where
+            result is the PAN's entry of the ``panresp.pandetails`` reply.
+        """
+        unique_pans = list(dict.fromkeys(str(pan).upper() for pan in pan_numbers))
+        size = config.TEBT_PAN_BATCH_SIZE
+        chunks = [unique_pans[i:i + size] for i in range(0, len(unique_pans), size)]
+        results = {}
+        if not chunks:
+            return results
+        workers = min(config.TEBT_PAN_BATCH_CONCURRENCY, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pan-batch') as executor:
+            futures = {executor.submit(contextvars.copy_context().run, self._validate_chunk, chunk):
+                       chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    details = future.result()
+                except Exception as e:  # pylint: disable=broad-except
+                    results.update((pan, BatchResult(None, e)) for pan in chunk)
+                    continue
+                for pan in chunk:
+                    if pan in details:
+                        results[pan] = BatchResult(details[pan], None)
+                    else:
+                        results[pan] = BatchResult(None, LookupError(f"No result for PAN {pan}"))
+        return results
+
+    def _validate_chunk(self, pan_numbers):
+        """Validates one chunk of PAN numbers.
+
+        Args:
+            pan_numbers (list): PAN numbers to validate.
+
+        Returns:
+            dict: Entries of the ``panresp.pandetails`` reply keyed by PAN number.
+        """
+        response = sessions.request(service='TebtPanValidateBatch',
+                                    **self.build_batch_request(pan_numbers))
+        response.raise_for_status()
+        pan_details = (response.json().get("panresp") or {}).get("pandetails") or []
+        return {str(detail.get("pannumber", "")).upper(): detail for detail in pan_details}
 
 class ValidSoapResponse(MessagePlugin):
-    """Handles SOAP message plugin for validating SOAP responses."""
+    """Handles SOAP message plugin for validating SOAP responses.
+
+    When created with a ``service`` keyword, the latency of each call is
+    recorded for that service's adaptive timeout.
+    """
 
     def __init__(self, *args, **kwargs):
         """Initializes the ValidSoapResponse plugin.
@@ -114,6 +218,7 @@ class ValidSoapResponse(MessagePlugin):
             **kwargs: Additional keyword arguments.
         """
         self.kwargs = kwargs
+        self.sent_at = None
 
     def sending(self, context):
         """Handles sending SOAP requests.
@@ -121,10 +226,12 @@ class ValidSoapResponse(MessagePlugin):
         Args:
             context (object): Context object for SOAP request.
         """
-        xml_req = str(context.envelope)
-        params = {'body': str(xml_req), 'detail': "Request successfully sent to TEBT server"}
+        params = {'detail': "Request successfully sent to TEBT server"}
+        if soap_body_logger.isEnabledFor(logging.DEBUG):
+            params['body'] = str(context.envelope)
         custom_log('info', request=self.kwargs['request'], params=params)
         sys.stdout.flush()
+        self.sent_at = time.monotonic()
 
     def received(self, context):
         """Handles receiving SOAP responses.
@@ -133,29 +240,20 @@ class ValidSoapResponse(MessagePlugin):
             context (object): Context object for SOAP response.
         """
         xml_res = context.reply
-        params = {'body': str(xml_res), 'detail': "Response obtained from TEBT server"}
+        if self.sent_at is not None and self.kwargs.get('service'):
+            latency.record(self.kwargs['service'], time.monotonic() - self.sent_at)
+        params = {'detail': "Response obtained from TEBT server"}
+        if soap_body_logger.isEnabledFor(logging.DEBUG):
+            params['body'] = str(xml_res)
         custom_log('info', request=self.kwargs['request'], params=params)
         sys.stdout.flush()
 
-        answer_decoded = xml_res.decode()
-        if config.SOAP_URL_START in answer_decoded:
-            header_split = answer_decoded.split(config.SOAP_URL_START)
-            header_split_msg = config.SOAP_URL_START + header_split[1]
-
-            footer_split = header_split_msg.split('</soapenv:Envelope>')
-            reply_final = footer_split[0] + '</soapenv:Envelope>'
-        else:
-            header_split = answer_decoded.split('<soap:Envelope')
-            header_split_msg = '<soap:Envelope' + header_split[1]
-
-            footer_split = header_split_msg.split('</soap:Envelope>')
-            reply_final = footer_split[0] + '</soap:Envelope>'
+        context.reply = extract_envelope(xml_res)
 
-        reply_final_decoded = reply_final.encode()
-        context.reply = reply_final_decoded
-
-cache = ObjectCache()
-cache.setduration(seconds=config.CACHE_DURATION)
+_wsdl_cache = None
+_endpoint_urls = {}
+_suds_clients = {}
+_suds_clients_lock = threading.Lock()
 
 class TebtQuote:
     """Handles fetching quotes from TEBT service."""
@@ -169,24 +267,66 @@ class TebtQuote:
         Returns:
             suds_client: SOAP client object.
         """
-        plugin = ValidSoapResponse(request=request)
+        plugin = ValidSoapResponse(request=request, service='TebtQuote')
         proxy = api_utils.get_proxy(request=request)
         url = config.TEBT_GET_QUOTE_URL
         try:
-            client = suds_client(get_wsdl_endpoint_url(url, request), plugins=[plugin], cache=cache,
-                                 cachingpolicy=config.WSDL_CACHE_POLICY_VALUE, proxy=proxy)
+            client = get_suds_client(url, request, proxy)
         except Exception as e:
             raise GenericException(status_type=STATUS_TYPE['TEBT'],
                                    exception_code=RETRYABLE_CODE['API_UNREACHABLE'],
                                    detail=f'TEBT services down. {repr(e)}',
                                    response_msg=config.WEBSITE_ERROR,
                                    body=None, url=url) from e
-        client.set_options(timeout=config.REQUEST_TIMEOUT)
+        timeout = latency.adaptive_timeout('TebtQuote', config.REQUEST_TIMEOUT)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        client.set_options(plugins=[plugin], proxy=proxy, timeout=read_timeout)
         return client
 
+def get_suds_client(wsdl_url, request, proxy):
+    """Gets a suds client for the given WSDL URL.
+
+    A prototype client is built once per endpoint URL and process; callers get
+    a clone of it, which shares the parsed WSDL but has its own options, so
+    setting plugins or timeouts on it does not affect other callers.
+
+    Args:
+        wsdl_url (str): WSDL URL of the service.
+        request: Request object.
+        proxy (dict): Proxy used to load the WSDL when building the prototype.
+
+    Returns:
+        suds_client: SOAP client object.
+    """
+    endpoint_url = get_wsdl_endpoint_url(wsdl_url, request)
+    prototype = _suds_clients.get(endpoint_url)
+    if prototype is None:
+        with _suds_clients_lock:
+            prototype = _suds_clients.get(endpoint_url)
+            if prototype is None:
+                prototype = suds_client(endpoint_url, cache=get_wsdl_cache(),
+                                        cachingpolicy=config.WSDL_CACHE_POLICY_VALUE, proxy=proxy)
+                _suds_clients[endpoint_url] = prototype
+    return prototype.clone()
+
+def get_wsdl_cache():
+    """Gets the on-disk WSDL cache, creating it on first use.
+
+    Returns:
+        ObjectCache: Cache of parsed WSDL documents.
+    """
+    global _wsdl_cache  # pylint: disable=global-statement
+    if _wsdl_cache is None:
+        wsdl_cache = ObjectCache()
+        wsdl_cache.setduration(seconds=config.CACHE_DURATION)
+        _wsdl_cache = wsdl_cache
+    return _wsdl_cache
+
 def get_wsdl_endpoint_url(wsdl_url, request):
     """Gets the endpoint URL for the given WSDL URL.
 
+    The resolved URL is cached per process for ``CACHE_DURATION`` seconds.
+
     Args:
         wsdl_url (str): WSDL URL of the service.
         request: Request object.
@@ -194,11 +334,14 @@ def get_wsdl_endpoint_url(wsdl_url, request):
     Returns:
         str: Endpoint URL.
     """
+    cached = _endpoint_urls.get(wsdl_url)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
     custom_log('info', request,
                {'detail': 'In get_wsdl_endpoint_url function. Fetching endpoint url.',
                                  'body': {'params': {}}})
     try:
-        response = requests.get(wsdl_url, timeout=config.REQUEST_TIMEOUT)
+        response = sessions.get(wsdl_url, timeout=config.REQUEST_TIMEOUT, service='TebtWsdl')
     except Exception as e:
         custom_log(level='info', request=request,
                    params={'detail': 'Error from tebt.', 'body': {'error_msg': repr(e)}})
@@ -211,6 +354,7 @@ def get_wsdl_endpoint_url(wsdl_url, request):
                                  'body': {'params': {}}})
     if response.status_code == config.WSDL_SUCCESS_STATUS_CODE:
         custom_log('info', request, {'detail': 'Endpoint url fetched.', 'body': {'params': {}}})
+        _endpoint_urls[wsdl_url] = (response.url, time.time() + config.CACHE_DURATION)
         return response.url
     raise GenericException(status_type=STATUS_TYPE['TEBT'],
                     exception_code=RETRYABLE_CODE['API_UNREACHABLE'],
@@ -218,18 +362,23 @@ def get_wsdl_endpoint_url(wsdl_url, request):
                     response_msg=config.WEBSITE_ERROR,
                     request=request, url=wsdl_url)
 
-class TebtPayment:
-    """Handles posting payments to TEBT service."""
+class TebtPayment(SoapFieldsMixin, RequestAdapter):
+    """Handles posting payments to TEBT service.
+
+    Use fetch_fields() to get only the configured status fields of the reply.
+    """
+
+    response_fields = config.TEBT_PAYMENT_RESPONSE_FIELDS
 
-    def fetch_data(self, payload):
-        """Posts payment data to TEBT service.
+    def build_request(self, payload):
+        """Builds the payment posting request for the TEBT service.
 
         Args:
             payload (dict): Payment payload.
 
         Returns:
-            requests.Response: Response object from the API call.
+            dict: Request passed to the pooled session.
         """
         url = config.TEBT_PAYMENT_RECEPT_POSTING_URL
-        response = requests.post(url=url, data=payload, timeout=config.CUSTOMER_PORTAL_API_TIME_OUT)
-        return response
+        return {'method': 'POST', 'url': url, 'data': payload,
+                'timeout': config.CUSTOMER_PORTAL_API_TIME_OUT}
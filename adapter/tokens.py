@@ -0,0 +1,328 @@
+"""
+Module providing a central token manager for upstream auth tokens.
+
+Tokens are cached until shortly before they expire. Once a token has lived
+past ``TOKEN_REFRESH_RATIO`` of its lifetime, the next caller still receives
+the cached token while a background thread fetches its replacement, so
+business calls do not wait on an auth round-trip in steady state.
+
+Token fetches are single-flight: concurrent callers in a process share one
+in-flight fetch, and sources backed by a Django cache take a cache lock so
+only one worker across all nodes calls the auth endpoint while the others
+wait for the token it stores. When that worker fails, one waiter takes the
+lock over and fetches while the rest keep waiting; nobody waits longer than
+the source's ``wait_timeout``, after which the call fails fast.
+
+Sources whose auth call returns a response cache only the parsed JSON body
+of that response, never the response object with its request and
+credentials; every caller gets a fresh response rebuilt from that body.
+
+Classes:
+- TokenSource: Describes how to fetch a token and how long it stays valid.
+- TokenManager: Caches tokens per source and refreshes them ahead of expiry.
+
+Functions:
+- response_is_valid(response): Checks whether an auth response can be cached.
+- response_expires_in(response): Reads ``expires_in`` from a JSON auth response.
+- response_json(response): Returns the JSON body of an auth response, for caching.
+- json_response(payload): Rebuilds a response carrying a cached JSON auth body.
+"""
+
+import json
+import threading
+import time
+import uuid
+import requests
+from django.core.cache import caches
+from shared_config.exceptions import GenericException
+from shared_config.exception_constants import RETRYABLE_CODE, STATUS_TYPE
+from shared_config.logging import custom_log
+from . import constants as config
+
+
+def response_is_valid(response):
+    """
+    Returns True for a successful auth response with a JSON body.
+    """
+    if response.status_code != 200:
+        return False
+    try:
+        response.json()
+    except ValueError:
+        return False
+    return True
+
+
+def response_expires_in(response):
+    """
+    Returns the ``expires_in`` value of a JSON auth response, or None if absent.
+    """
+    try:
+        return int(response.json().get('expires_in'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def response_json(response):
+    """
+    Returns the JSON body of a successful auth response, the form in which it is cached.
+    """
+    return response.json()
+
+
+def json_response(payload):
+    """
+    Builds a new ``requests.Response`` carrying a cached JSON auth body.
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json'
+    response.encoding = 'utf-8'
+    response._content = json.dumps(payload).encode('utf-8')  # pylint: disable=protected-access
+    return response
+
+
+class TokenSource:
+    """
+    Describes an upstream token.
+
+    Attributes:
+        name (str): Unique name of the token.
+        fetch (callable): Performs the auth call and returns the token value.
+        ttl (int): Lifetime in seconds used when ``expires_in`` gives none.
+        expires_in (callable): Optional, returns the lifetime of a fetched value.
+        is_valid (callable): Optional, returns False for values that must not be cached.
+        cache_alias (str): Optional Django cache alias used to share the token across workers.
+        cache_key (str): Key of the token in the Django cache, defaults to ``name``.
+        serialize (callable): Optional, converts a fetched value into the form cached.
+        restore (callable): Optional, converts a cached value into the one returned.
+        wait_timeout (float): Longest wait in seconds for a token fetched by another
+            worker, at most the timeout of the call needing the token.
+    """
+
+    def __init__(self, name, fetch, ttl=None, expires_in=None, is_valid=None,
+                 cache_alias=None, cache_key=None, serialize=None, restore=None,
+                 wait_timeout=None):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl or config.TOKEN_DEFAULT_TTL
+        self.expires_in = expires_in
+        self.is_valid = is_valid
+        self.cache_alias = cache_alias
+        self.cache_key = cache_key or name
+        self.serialize = serialize
+        self.restore = restore
+        self.wait_timeout = wait_timeout or config.TOKEN_WAIT_TIMEOUT
+
+    def returned(self, cached):
+        """
+        Returns the value handed to callers for a cached value.
+        """
+        return self.restore(cached) if self.restore is not None else cached
+
+    @property
+    def cache(self):
+        """
+        Returns the Django cache backing this token, if any.
+        """
+        if self.cache_alias is None:
+            return None
+        return caches[self.cache_alias]
+
+
+class _Flight:
+    """
+    An in-flight token fetch shared by concurrent callers.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        """
+        Waits for the fetch to finish and returns its value, re-raising its error.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class TokenManager:
+    """
+    Caches tokens per source and refreshes them in the background before they lapse.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._refreshing = set()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, source):
+        """
+        Returns a valid token for the source, fetching it only when none is cached.
+        """
+        now = time.time()
+        entry = self._entries.get(source.name)
+        if entry is None or now >= entry['expires_at']:
+            entry = self._load_shared(source)
+        if entry is not None and now < entry['expires_at']:
+            if now >= entry['refresh_at']:
+                self._schedule_refresh(source)
+            return source.returned(entry['value'])
+        return self.fetch_token(source)
+
+    def fetch_token(self, source):
+        """
+        Fetches a new token for the source, sharing the fetch with concurrent callers.
+        """
+        with self._lock:
+            flight = self._flights.get(source.name)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[source.name] = flight
+        if leader:
+            try:
+                flight.value = self._fetch_locked(source)
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._flights.pop(source.name, None)
+                flight.done.set()
+        value, stored = flight.wait()
+        return source.returned(value) if stored else value
+
+    def _fetch_locked(self, source):
+        """
+        Fetches the token holding the source's cache lock, or waits for the worker that holds it.
+
+        A lock released without a new token is taken over by the first waiter
+        to add it again. Returns the value and whether it is in its cached form.
+        """
+        cache = source.cache
+        if cache is None:
+            return self._fetch(source)
+        started = time.time()
+        deadline = started + source.wait_timeout
+        lock_key = source.cache_key + ':lock'
+        owner = uuid.uuid4().hex
+        while not cache.add(lock_key, owner, timeout=config.TOKEN_LOCK_TIMEOUT):
+            entry = self._wait_shared(source, lock_key, started, deadline)
+            if entry is not None:
+                return entry['value'], True
+        try:
+            entry = self._load_shared(source)
+            if entry is not None and entry['refresh_at'] > started:
+                return entry['value'], True
+            return self._fetch(source)
+        finally:
+            if cache.get(lock_key) == owner:
+                cache.delete(lock_key)
+
+    def _wait_shared(self, source, lock_key, started, deadline):
+        """
+        Polls the Django cache until another worker stores a token newer than ``started``.
+
+        Returns None once the lock is released without a new token, and raises
+        GenericException when ``deadline`` passes first.
+        """
+        cache = source.cache
+        while time.time() < deadline:
+            time.sleep(config.TOKEN_LOCK_POLL_INTERVAL)
+            lock_held = cache.get(lock_key) is not None
+            entry = self._load_shared(source)
+            if entry is not None and entry['refresh_at'] > started:
+                return entry
+            if not lock_held:
+                return None
+        raise GenericException(status_type=STATUS_TYPE['APP'],
+                               exception_code=RETRYABLE_CODE['API_UNREACHABLE'],
+                               detail=f'Timed out waiting for the {source.name} token.',
+                               response_msg=config.WEBSITE_ERROR, request=None)
+
+    def _fetch(self, source):
+        """
+        Calls the auth endpoint of the source and caches the token when valid.
+
+        Returns the value and whether it is in its cached form.
+        """
+        value = source.fetch()
+        if source.is_valid is not None and not source.is_valid(value):
+            return value, False
+        ttl = source.expires_in(value) if source.expires_in is not None else None
+        if source.serialize is not None:
+            value = source.serialize(value)
+        self.store_token(source, value, ttl)
+        return value, True
+
+    def store_token(self, source, value, ttl=None):
+        """
+        Stores a token obtained for the source, in its cached form, optionally with
+        its lifetime in seconds.
+        """
+        ttl = ttl or source.ttl
+        now = time.time()
+        skew = min(config.TOKEN_EXPIRY_SKEW, ttl * (1 - config.TOKEN_REFRESH_RATIO) / 2)
+        entry = {
+            'value': value,
+            'expires_at': now + ttl - skew,
+            'refresh_at': now + ttl * config.TOKEN_REFRESH_RATIO,
+        }
+        self._entries[source.name] = entry
+        if source.cache is not None:
+            source.cache.set(source.cache_key, entry, timeout=ttl)
+
+    def invalidate(self, source):
+        """
+        Drops the cached token of the source.
+        """
+        self._entries.pop(source.name, None)
+        if source.cache is not None:
+            source.cache.delete(source.cache_key)
+
+    def _load_shared(self, source):
+        """
+        Loads the token shared by other workers through the Django cache.
+        """
+        if source.cache is None:
+            return None
+        entry = source.cache.get(source.cache_key)
+        if not isinstance(entry, dict):
+            return None
+        self._entries[source.name] = entry
+        return entry
+
+    def _schedule_refresh(self, source):
+        """
+        Starts a background refresh of the source unless one is already running.
+        """
+        with self._lock:
+            if source.name in self._refreshing:
+                return
+            self._refreshing.add(source.name)
+        thread = threading.Thread(target=self._refresh, args=(source,),
+                                  name=f"token-refresh-{source.name}", daemon=True)
+        thread.start()
+
+    def _refresh(self, source):
+        """
+        Refreshes the token of the source, keeping the current one on failure.
+        """
+        try:
+            self.fetch_token(source)
+        except Exception as e:  # pylint: disable=broad-except
+            custom_log(level='error', request=None,
+                       params={'detail': f'Background refresh of {source.name} token failed.',
+                               'body': {'error_msg': repr(e)}})
+        finally:
+            with self._lock:
+                self._refreshing.discard(source.name)
+
+
+token_manager = TokenManager()
@@ -10,6 +10,7 @@ Classes:
 - GetTokenUrl: Retrieves tokens from an external service.
 - GoogleRecaptcha: Validates Google reCAPTCHA responses.
 - CloudFlare: Interacts with CloudFlare services.
+- CloudFlarePurge: Queues CloudFlare purges for batched, deduplicated sending.
 - GoogleAuth: Authenticates using Google OAuth.
 - FacebookAuth: Authenticates using Facebook OAuth.
 - AppleAuth: Authenticates using Apple OAuth.
@@ -22,35 +23,59 @@ Constants:
 - Various constants imported from shared_config.
 
 """
+import hashlib
 import json
 import re
 import jwt
-from jwt.algorithms import RSAAlgorithm
-import requests
 from shared_config.exceptions import GenericException
 from shared_config.logging import custom_log
 from shared_config.exception_constants import NONRETRYABLE_CODE, STATUS_TYPE
 from shared_config import constants
 from . import constants as config
+from . import responses
+from . import sessions
+from .base import RequestAdapter
+from .cf_purge import PurgeCoalescer
+from .jwks import JwksCache
+from .lru import LRUCache
+from .response_cache import CachedRequestAdapter
+from .soap_parser import SoapFieldsMixin
+from .xml_templates import XmlTemplate
 
-class CscWebUrl:
+class CscWebUrl(SoapFieldsMixin, CachedRequestAdapter):
     """
     Class for fetching data from CSC web service.
+    Use fetch_fields() to get only the premium details instead of the whole reply.
     """
-    def fetch_data(self, payload):
+    response_fields = config.CSC_RESPONSE_FIELDS
+    cache_name = 'CSC_WEB_SERVICE_URL'
+    # The BillJunction reference changes with every transaction, so it is not part of the key.
+    cache_key_fields = ('bj_user_id', 'policy_no', 'str_dob')
+    REQUEST_TEMPLATE = XmlTemplate.from_printf(
+        config.POLICY_PREMIUM_DETAILS_INPUT,
+        ('user_id', 'bj_ref_no', 'policy_no', 'app_no', 'dob')
+    ).bind(app_no='NA')
+
+    def is_valid_response(self, response):
         """
-        Fetch data from CSC web service.
+        Only cache 200 replies that are not SOAP faults.
+        """
+        return response.status_code == 200 and not responses.is_soap_fault(response.content)
+
+    def build_request(self, payload):
+        """
+        Build the CSC web service request.
         """
         url = config.CSC_WEB_SERVICE_URL
-        payload = config.POLICY_PREMIUM_DETAILS_INPUT % (
-            payload.get('bj_user_id', ''),
-            payload.get('bj_ref_number', ''),
-            payload.get('policy_no', ''), 'NA',
-            payload.get('str_dob', '')
+        payload = self.REQUEST_TEMPLATE.render(
+            user_id=payload.get('bj_user_id', ''),
+            bj_ref_no=payload.get('bj_ref_number', ''),
+            policy_no=payload.get('policy_no', ''),
+            dob=payload.get('str_dob', '')
         )
-        response = requests.post(url=url, data=payload, timeout=config.CUSTOMER_PORTAL_API_TIME_OUT,
-                                 headers={"Content-Type": "text/plain"})
-        return response
+        return {'method': 'POST', 'url': url, 'data': payload,
+                'timeout': config.CUSTOMER_PORTAL_API_TIME_OUT,
+                'headers': {"Content-Type": "text/plain"}}
 
 class GetTokenUrl:
     """
@@ -75,8 +100,8 @@ class GetTokenUrl:
         }
         params_str = json.dumps(params)
         try:
-            resp = requests.post(url, data=params_str.encode('utf-8'), headers=headers,
-                                 timeout=constants.DEFAULT_TIMEOUT)
+            resp = sessions.post(url, data=params_str.encode('utf-8'), headers=headers,
+                                 timeout=constants.DEFAULT_TIMEOUT, service='GetTokenUrl')
         except Exception as e:
             custom_log(level='error', request=request, params={'body': {'request': params},
                                                                 'detail': str(e)})
@@ -113,8 +138,9 @@ class GoogleRecaptcha:
             secret_key = config.GOOGLE_RECAPTCHA_V3_SECRET_KEY
         values = '?secret=' + str(secret_key) + '&response=' + str(recaptcha_response)
         try:
-            response = requests.post(config.GOOGLE_RECAPTCHA_VERIFY_URL + values, {}, verify=False,
-                                     timeout=config.GOOGLE_RECAPTCHA_TIMEOUT).json()
+            response = sessions.post(config.GOOGLE_RECAPTCHA_VERIFY_URL + values, {}, verify=False,
+                                     timeout=config.GOOGLE_RECAPTCHA_TIMEOUT,
+                                     service='GoogleRecaptcha').json()
         except Exception as e:
             custom_log(level="info", request=None, params=
                        {"detail": "Error while captcha validation", "message": repr(e)})
@@ -126,55 +152,147 @@ class GoogleRecaptcha:
                                    request=None, detail='Recaptcha validation failed.',
                                    response_msg='Recaptcha validation failed.')
 
-class CloudFlare:
+class CloudFlare(RequestAdapter):
     """
     Class for interacting with CloudFlare service.
     """
+    def build_request(self, payload):
+        """
+        Build the CloudFlare purge request.
+        """
+        return {'method': 'POST', 'url': config.CF_BASE_URL, 'json': payload,
+                'headers': {"X-Auth-Email": config.AUTH_EMAIL,
+                            "X-Auth-Key": config.GLOBAL_API_KEY},
+                'timeout': constants.DEFAULT_TIMEOUT}
+
+purge_coalescer = PurgeCoalescer(CloudFlare().fetch_data)
+
+class CloudFlarePurge:
+    """
+    Class for queueing CloudFlare purges, sent in deduplicated batches.
+    """
     def fetch_data(self, payload):
         """
-        Fetch data from CloudFlare.
+        Queue the files, tags, hosts or prefixes of a purge request body.
         """
-        response = requests.post(config.CF_BASE_URL, json=payload,
-                                 headers={"X-Auth-Email": config.AUTH_EMAIL,
-                                  "X-Auth-Key": config.GLOBAL_API_KEY}, timeout=constants.DEFAULT_TIMEOUT)
-        return response
+        purge_coalescer.add(**payload)
+        return {'queued': True}
+
+identity_cache = LRUCache(maxsize=config.IDENTITY_CACHE_MAXSIZE, ttl=config.IDENTITY_CACHE_TTL)
 
-class GoogleAuth:
+def identity_cache_key(provider, access_token):
+    """
+    Build the identity cache key from a hash of the access token, never the token itself.
+    """
+    return provider + ":" + hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+def cache_identity(key, response):
+    """
+    Cache the verified profile of a successful user info response under the given key.
+    """
+    if response.status_code == 200:
+        try:
+            identity_cache.set(key, response.json())
+        except ValueError:
+            pass
+    return response
+
+def cached_identity(key, rebuild):
+    """
+    Return a new response carrying the cached profile for the key, built by
+    ``rebuild`` (``responses.to_requests`` or ``responses.to_httpx``), or None.
+    """
+    profile = identity_cache.get(key)
+    if profile is None:
+        return None
+    return rebuild(responses.json_snapshot(profile))
+
+class GoogleAuth(RequestAdapter):
     """
     Class for authenticating via Google OAuth.
+    Verified profiles are cached per access token for IDENTITY_CACHE_TTL seconds.
     """
-    def fetch_data(self, payload):
+    def build_request(self, payload):
         """
-        Authenticate using Google OAuth.
+        Build the Google OAuth userinfo request.
         """
         access_token = payload["access_token"]
         google_url = config.GOOGLE_AUTH_ENDPOINT + "?access_token=" + access_token
-        response = requests.get(google_url, timeout=constants.DEFAULT_TIMEOUT)
+        return {'method': 'GET', 'url': google_url, 'timeout': constants.DEFAULT_TIMEOUT}
+
+    def fetch_data(self, payload):
+        """
+        Authenticate using Google OAuth.
+        """
+        key = identity_cache_key("google", payload["access_token"])
+        response = cached_identity(key, responses.to_requests)
+        if response is None:
+            response = cache_identity(key, super().fetch_data(payload))
         return response
 
-class FacebookAuth:
+    async def afetch_data(self, payload):
+        """
+        Authenticate using Google OAuth without blocking the event loop.
+        """
+        key = identity_cache_key("google", payload["access_token"])
+        response = cached_identity(key, responses.to_httpx)
+        if response is None:
+            response = cache_identity(key, await super().afetch_data(payload))
+        return response
+
+class FacebookAuth(RequestAdapter):
     """
     Class for authenticating via Facebook OAuth.
+    Verified profiles are cached per access token for IDENTITY_CACHE_TTL seconds.
     """
+    def build_request(self, payload):
+        """
+        Build the Facebook Graph user info request.
+        """
+        access_token = payload["access_token"]
+        fb_url = (
+            config.FACEBOOK_AUTH_ENDPOINT +
+            "?fields=id,name,email,picture{url}&access_token=" +
+            access_token
+        )
+        return {'method': 'GET', 'url': fb_url, 'timeout': constants.DEFAULT_TIMEOUT,
+                'verify': False}
+
     def fetch_data(self, payload):
         """
         Authenticate using Facebook OAuth.
         """
-        access_token = payload["access_token"]
+        key = identity_cache_key("facebook", payload["access_token"])
+        response = cached_identity(key, responses.to_requests)
+        if response is not None:
+            return response
         try:
-            fb_url = (
-                config.FACEBOOK_AUTH_ENDPOINT +
-                "?fields=id,name,email,picture{url}&access_token=" +
-                access_token
-            )
-            response = requests.get(fb_url, timeout=constants.DEFAULT_TIMEOUT, verify=False)
+            return cache_identity(key, super().fetch_data(payload))
+        except Exception as e:
+            raise facebook_auth_error(payload, e) from e
+
+    async def afetch_data(self, payload):
+        """
+        Authenticate using Facebook OAuth without blocking the event loop.
+        """
+        key = identity_cache_key("facebook", payload["access_token"])
+        response = cached_identity(key, responses.to_httpx)
+        if response is not None:
             return response
+        try:
+            return cache_identity(key, await super().afetch_data(payload))
         except Exception as e:
-            raise GenericException(status_type=STATUS_TYPE["APP"],
-                                   exception_code=NONRETRYABLE_CODE["BAD_REQUEST"],
-                                   detail="Error while validating facebook user info " + repr(e),
-                                   response_msg='Error while validating facebook user info',
-                                   request=payload) from e
+            raise facebook_auth_error(payload, e) from e
+
+def facebook_auth_error(payload, error):
+    """
+    Build the exception raised when the Facebook user info call fails.
+    """
+    return GenericException(status_type=STATUS_TYPE["APP"],
+                            exception_code=NONRETRYABLE_CODE["BAD_REQUEST"],
+                            detail="Error while validating facebook user info " + repr(error),
+                            response_msg='Error while validating facebook user info',
+                            request=payload)
 
 class AppleAuth:
     """
@@ -187,16 +305,10 @@ class AppleAuth:
         access_token = payload["access_token"]
         request = payload
         try:
-            url = config.APPLE_KEY_ENDPOINT
             header_data = jwt.get_unverified_header(access_token)
-            response = requests.get(url, timeout=constants.DEFAULT_TIMEOUT)
-            res = json.loads(response.text)
-            key_data = {}
-            for data in res["keys"]:
-                apple_data_sanitization(data, request)
-                if data.get('kid') == header_data.get("kid"):
-                    key_data = data
-            public_key = RSAAlgorithm.from_jwk(json.dumps(key_data))
+            public_key = apple_keys.get_key(header_data.get("kid"), request)
+            if public_key is None:
+                raise ValueError("Unknown apple key id")
             result = jwt.decode(access_token, public_key, audience=config.APPLE_AUDIENCE,
                                 algorithms=header_data.get("alg"))
             apple_data_sanitization(result, request)
@@ -221,6 +333,9 @@ def apple_data_sanitization(data_dict, request):
                                        response_msg='Error while validating apple user info',
                                        request=request)
 
+apple_keys = JwksCache(config.APPLE_KEY_ENDPOINT, 'AppleAuth',
+                       validate_key=apple_data_sanitization)
+
 class SsoToken:
     """
     Class for handling SSO token.
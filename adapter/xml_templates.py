@@ -0,0 +1,110 @@
+"""
+Module providing precompiled XML/SOAP envelope templates.
+
+A template is compiled once into static UTF-8 byte segments and named slots.
+Rendering escapes each value and joins the segments, so envelopes are built
+without re-parsing the template and without unescaped user input. Slots
+inside a CDATA section are entity-escaped as well: such a section carries a
+document the receiver parses in turn (Experian's ``INProfileRequest``), and
+an escaped value can no longer contain ``]]>``.
+
+Classes:
+- XmlTemplate: A compiled envelope template.
+
+Functions:
+- escape_text(value): Escapes a value for XML text or attribute content.
+"""
+
+import re
+from xml.sax.saxutils import escape
+
+SLOT_PATTERN = re.compile(r'\{(\w+)\}')
+PRINTF_PATTERN = re.compile(r'%s')
+
+
+def escape_text(value):
+    """
+    Escapes a value for XML text or attribute content.
+    """
+    return escape(value, {'"': '&quot;', "'": '&apos;'})
+
+
+class XmlTemplate:
+    """
+    An XML template with ``{name}`` slots, compiled into byte segments.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.slot_names = set()
+        self._parts = []
+        position = 0
+        for match in SLOT_PATTERN.finditer(text):
+            self._add_static(text[position:match.start()])
+            self._parts.append((match.group(1), escape_text))
+            self.slot_names.add(match.group(1))
+            position = match.end()
+        self._add_static(text[position:])
+
+    @classmethod
+    def from_printf(cls, text, names):
+        """
+        Compiles a template written with positional ``%s`` placeholders, naming them in order.
+        """
+        names = iter(names)
+        return cls(PRINTF_PATTERN.sub(lambda match: '{%s}' % next(names), text))
+
+    def _add_static(self, text):
+        """
+        Appends static text, merging it with a preceding static segment.
+        """
+        if text:
+            self._add_static_bytes(text.encode('utf-8'))
+
+    def bind(self, **values):
+        """
+        Returns a new template with the given slots filled in once and for all.
+        """
+        bound = XmlTemplate.__new__(XmlTemplate)
+        bound.text = self.text
+        bound.slot_names = self.slot_names - set(values)
+        bound._parts = []
+        for part in self._parts:
+            if isinstance(part, bytes):
+                bound._add_static_bytes(part)
+            elif part[0] in values:
+                bound._add_static_bytes(self._escape(part, values[part[0]]))
+            else:
+                bound._parts.append(part)
+        return bound
+
+    def _add_static_bytes(self, data):
+        """
+        Appends static bytes, merging them with a preceding static segment.
+        """
+        if self._parts and isinstance(self._parts[-1], bytes):
+            self._parts[-1] += data
+        else:
+            self._parts.append(data)
+
+    @staticmethod
+    def _escape(part, value):
+        """
+        Escapes a slot value and encodes it to bytes; None renders as empty.
+        """
+        if value is None:
+            return b''
+        return part[1](str(value)).encode('utf-8')
+
+    def render(self, **values):
+        """
+        Renders the template to bytes, escaping every value. Raises KeyError for a missing slot.
+        """
+        return b''.join(part if isinstance(part, bytes) else self._escape(part, values[part[0]])
+                        for part in self._parts)
+
+    def render_text(self, **values):
+        """
+        Renders the template to a string.
+        """
+        return self.render(**values).decode('utf-8')
@@ -0,0 +1,357 @@
+"""
+End-to-end benchmark of every APIManager service against local stub upstreams.
+
+Starts benchmarks/stub_server.py in a subprocess, points every URL of
+adapter/constants.py at it, and drives each service type of the adapter
+registry, DedupeService and the TEBT quote SOAP call included, from a thread
+pool. Prints req/s, p50/p95/p99 latency and errors per service, then
+optionally the memory allocated per call (traced sequentially, so it is not
+skewed by concurrency) and the pool, circuit, latency and concurrency stats.
+
+It runs inside the host project: DJANGO_SETTINGS_MODULE must name its
+settings (with the "default", "api_v1" and token caches and a database for
+the API logs), and django, requests, shared_config, custom_suds and PyJWT
+must be installed. The Apple sign-in service also needs cryptography, and is
+skipped without it. CF_PURGE_CALL is turned on and the CRM lead spool is
+kept in a temporary directory. Leads queued by the *_QUEUE services are
+submitted to the stub by the lead queue worker while the benchmark runs.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=project.settings python benchmarks/end_to_end.py
+        [--concurrency 16] [--requests 200] [--only SERVICE_TYPE ...]
+        [--latency-ms 20] [--jitter-ms 5] [--error-rate 0]
+        [--route NAME=LATENCY_MS[:ERROR_RATE]] [--pdf-kb 256]
+        [--allocations 50] [--stats]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import stub_server  # pylint: disable=wrong-import-position
+from adapter import constants as config  # pylint: disable=wrong-import-position
+
+APPLE_KEY_ID = 'stub-key'
+JSON_HEADERS = {'Content-Type': 'application/json', 'Authorization': 'Bearer stub-access-token'}
+TEBT_PAYMENT_XML = ('<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+                    '<soapenv:Body><PostPayment><ReceiptNo>R00001</ReceiptNo></PostPayment>'
+                    '</soapenv:Body></soapenv:Envelope>')
+
+
+def start_stub(args, apple_jwks_path):
+    """
+    Starts the stub server subprocess and returns it with its upstream to local URL map.
+    """
+    command = [sys.executable, os.path.join(BENCHMARKS_DIR, 'stub_server.py'),
+               '--port', str(args.port), '--latency-ms', str(args.latency_ms),
+               '--jitter-ms', str(args.jitter_ms), '--error-rate', str(args.error_rate),
+               '--pdf-kb', str(args.pdf_kb)]
+    for route in args.route:
+        command += ['--route', route]
+    if apple_jwks_path:
+        command += ['--apple-jwks', apple_jwks_path]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('READY '):
+        process.kill()
+        raise RuntimeError(f'Stub server failed to start: {line!r}')
+    return process, json.loads(line[len('READY '):])
+
+
+def point_at_stub(mapping, spool_dir):
+    """
+    Rewrites every upstream URL constant to its stub; must run before the adapters are imported.
+    """
+    for name, url in stub_server.upstream_urls().items():
+        host = stub_server.base_url(url)
+        setattr(config, name, mapping[host] + url[len(host):])
+    config.CF_PURGE_CALL = True
+    config.CRM_LEAD_SPOOL_PATH = os.path.join(spool_dir, 'crm_lead_spool.sqlite3')
+
+
+def make_apple_key():
+    """
+    Returns an RSA private key and the JWKS publishing it, or (None, None) without cryptography.
+    """
+    try:
+        from cryptography.hazmat.primitives.asymmetric import rsa  # pylint: disable=import-outside-toplevel
+        from jwt.algorithms import RSAAlgorithm  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None, None
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({'kid': APPLE_KEY_ID, 'alg': 'RS256', 'use': 'sig'})
+    return private_key, {'keys': [jwk]}
+
+
+def apple_token(private_key, index):
+    """
+    Returns an Apple identity token signed with the stub key.
+    """
+    import jwt  # pylint: disable=import-outside-toplevel
+    claims = {'iss': 'https://appleid.apple.com', 'aud': config.APPLE_AUDIENCE,
+              'sub': f'stub{index}', 'exp': int(time.time()) + 3600}
+    return jwt.encode(claims, private_key, algorithm='RS256', headers={'kid': APPLE_KEY_ID})
+
+
+def build_scenarios(apple_key):
+    """
+    Returns one call per service, keyed by service type, taking the request index.
+
+    Payloads vary with the index wherever a response or identity cache would
+    otherwise answer every call after the first.
+    """
+    # pylint: disable=import-outside-toplevel
+    from adapter.adapters import APIManager
+
+    def manager(service_type, payload=None, headers=None):
+        def call(index):
+            data = payload(index) if callable(payload) else payload
+            return APIManager(service_type, data, headers).get_data()
+        return call
+
+    def lead(index):
+        return {'firstname': 'Stub', 'lastname': f'Lead{index}',
+                'mobilephone': f'9{index % 10 ** 9:09d}', 'hdfc_source': 'benchmark'}
+
+    def credit(index):
+        return {'name': 'Stub User', 'mobile': f'9{index % 10 ** 9:09d}', 'log_obj': None,
+                'force_refresh': True}
+
+    def customer(index):
+        return SimpleNamespace(phone=f'9{index % 10 ** 9:09d}', email=f'stub{index}@example.com',
+                               country_code='+91')
+
+    def tebt_quote(index):
+        client = APIManager('TEBT_GET_QUOTE_URL').adapter.fetch_data(None)
+        return client.service.getQuote(request=f'Q{index}')
+
+    scenarios = {
+        'CRM_MS_TOKEN_GEN_URL': manager('CRM_MS_TOKEN_GEN_URL', 'CRMLead'),
+        'CRM_LEADS_API_URL': manager('CRM_LEADS_API_URL', lead, JSON_HEADERS),
+        'MOBILE_CRM_LEADS_API_URL': manager('MOBILE_CRM_LEADS_API_URL', lead, JSON_HEADERS),
+        'CRM_LEADS_QUEUE': manager('CRM_LEADS_QUEUE', lead, JSON_HEADERS),
+        'MOBILE_CRM_LEADS_QUEUE': manager('MOBILE_CRM_LEADS_QUEUE', lead, JSON_HEADERS),
+        'CSC_WEB_SERVICE_URL': manager('CSC_WEB_SERVICE_URL', lambda index: {
+            'bj_user_id': 'stub', 'bj_ref_number': f'R{index}', 'policy_no': '21000001',
+            'str_dob': '01/01/1990'}),
+        'GENERATE_TOKEN_URL': manager('GENERATE_TOKEN_URL'),
+        'CP_APP_LOGIN_URL': manager('CP_APP_LOGIN_URL', lambda index: {
+            'head': {'apiname': 'login'}, 'body': {'clientId': f'C{index}'}}, JSON_HEADERS),
+        'RECEIPT_ACCESS_TOKEN_URL': manager('RECEIPT_ACCESS_TOKEN_URL'),
+        'RECIEPT_DETAILS_URL': manager('RECIEPT_DETAILS_URL', lambda index: {
+            'policy_no': '21000001', 'client_id': f'C{index}'}, JSON_HEADERS),
+        'RECIEPT_PDF_URL': manager('RECIEPT_PDF_URL', lambda index: {
+            'policy_no': '21000001', 'client_id': f'C{index}', 'receipt_no': 'R00001'},
+                                   JSON_HEADERS),
+        'ANNUAL_PREMIUM_STATEMENT_URL': manager('ANNUAL_PREMIUM_STATEMENT_URL', lambda index: {
+            'policy_no': '21000001', 'client_id': f'C{index}', 'year': '2024',
+            'mode_of_comm': 'View'}, JSON_HEADERS),
+        'UNIT_STATEMENT_URL': manager('UNIT_STATEMENT_URL', lambda index: {
+            'policy_no': f'2{index % 10 ** 7:07d}', 'from_date': '01/04/2023',
+            'to_date': '31/03/2024', 'mode_of_comm': 'View'}, JSON_HEADERS),
+        'CRIF_URL': manager('CRIF_URL', credit),
+        'TEBT_PAN_VALIDATION': manager('TEBT_PAN_VALIDATION', {'pan_no': 'ABCDE1234F'}),
+        'GET_TOKEN_URL': manager('GET_TOKEN_URL', {'client_id': 'C0001'}),
+        'GOOGLE_RECAPTCHA_VERIFY_URL': manager('GOOGLE_RECAPTCHA_VERIFY_URL', lambda index: {
+            'recaptcha_response': f'stub{index}', 'recaptcha_version': 'v2'}),
+        'SSO_VALIDATE_TOKEN_URL': manager('SSO_VALIDATE_TOKEN_URL', 'stub-portal-token'),
+        'EXPERIAN_URL': manager('EXPERIAN_URL', credit),
+        'CF_BASE_URL': manager('CF_BASE_URL', lambda index: {
+            'files': [f'https://www.hdfclife.com/stub/{index}']}),
+        'CF_PURGE_QUEUE': manager('CF_PURGE_QUEUE', lambda index: {
+            'files': [f'https://www.hdfclife.com/stub/{index}']}),
+        'GOOGLE_AUTH_ENDPOINT': manager('GOOGLE_AUTH_ENDPOINT', lambda index: {
+            'access_token': f'stub-google-{index}'}),
+        'FACEBOOK_AUTH_ENDPOINT': manager('FACEBOOK_AUTH_ENDPOINT', lambda index: {
+            'access_token': f'stub-facebook-{index}'}),
+        'TEBT_GET_QUOTE_URL': tebt_quote,
+        'TEBT_PAYMENT_RECEPT_POSTING_URL': manager('TEBT_PAYMENT_RECEPT_POSTING_URL',
+                                                   TEBT_PAYMENT_XML),
+        'BANKCLOUD_FETCH_URL': manager('BANKCLOUD_FETCH_URL', lambda index: {
+            'orderid': f'O{index}'}),
+        'DedupeService': manager('DedupeService', customer),
+    }
+    if apple_key is not None:
+        scenarios['APPLE_KEY_ENDPOINT'] = manager('APPLE_KEY_ENDPOINT', lambda index: {
+            'access_token': apple_token(apple_key, index)})
+    return scenarios
+
+
+def is_error(result):
+    """
+    Returns whether a service result reports a failure.
+    """
+    status_code = getattr(result, 'status_code', None)
+    if status_code is not None:
+        return status_code >= 400
+    if isinstance(result, dict):
+        response = result.get('response')
+        if response is not None and getattr(response, 'status_code', 200) >= 400:
+            return True
+        return 'error' in result
+    return False
+
+
+def percentile(sorted_values, percent):
+    """
+    Returns the nearest-rank percentile of sorted values.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def timed_call(call, index):
+    """
+    Runs one call and returns its duration in seconds and whether it failed.
+    """
+    start = time.perf_counter()
+    try:
+        failed = is_error(call(index))
+    except Exception:  # pylint: disable=broad-except
+        failed = True
+    return time.perf_counter() - start, failed
+
+
+def run_scenario(call, concurrency, requests):
+    """
+    Sends ``requests`` calls from ``concurrency`` threads and returns the throughput figures.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        outcomes = list(executor.map(lambda index: timed_call(call, index), range(requests)))
+        elapsed = time.perf_counter() - start
+    durations = sorted(duration for duration, _ in outcomes)
+    return {'rps': requests / elapsed if elapsed else 0.0,
+            'p50': percentile(durations, 50) * 1000,
+            'p95': percentile(durations, 95) * 1000,
+            'p99': percentile(durations, 99) * 1000,
+            'errors': sum(1 for _, failed in outcomes if failed)}
+
+
+def measure_allocations(call, count):
+    """
+    Runs ``count`` calls one after the other and returns the mean peak KiB
+    allocated per call and the KiB still held after all of them.
+    """
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    peaks = []
+    for index in range(count):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        timed_call(call, 10 ** 6 + index)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024, (retained - baseline) / 1024
+
+
+def main():
+    """
+    Starts the stub upstreams and prints the benchmark of every selected service.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[0])
+    parser.add_argument('--concurrency', type=int, default=16, help='threads sending calls')
+    parser.add_argument('--requests', type=int, default=200, help='calls per service')
+    parser.add_argument('--only', action='append', default=[], metavar='SERVICE_TYPE',
+                        help='benchmark only these service types')
+    parser.add_argument('--port', type=int, default=18000, help='first stub port')
+    parser.add_argument('--latency-ms', type=float, default=20, help='stub reply latency')
+    parser.add_argument('--jitter-ms', type=float, default=5, help='stub latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of stub replies failing with 503')
+    parser.add_argument('--route', action='append', default=[],
+                        help='per endpoint stub override, NAME=LATENCY_MS[:ERROR_RATE]')
+    parser.add_argument('--pdf-kb', type=int, default=256, help='size of the statement PDFs')
+    parser.add_argument('--allocations', type=int, default=0, metavar='CALLS',
+                        help='also trace the memory of this many sequential calls per service')
+    parser.add_argument('--stats', action='store_true',
+                        help='print pool, circuit, latency and concurrency stats at the end')
+    args = parser.parse_args()
+    if not os.environ.get('DJANGO_SETTINGS_MODULE'):
+        parser.error('DJANGO_SETTINGS_MODULE must name the settings of the host project')
+
+    apple_key, apple_jwks = make_apple_key()
+    with tempfile.TemporaryDirectory() as work_dir:
+        apple_jwks_path = None
+        if apple_jwks is not None:
+            apple_jwks_path = os.path.join(work_dir, 'apple_jwks.json')
+            with open(apple_jwks_path, 'w', encoding='utf-8') as jwks_file:
+                json.dump(apple_jwks, jwks_file)
+        stub, mapping = start_stub(args, apple_jwks_path)
+        try:
+            point_at_stub(mapping, work_dir)
+            import django  # pylint: disable=import-outside-toplevel
+            django.setup()
+            run_benchmarks(args, build_scenarios(apple_key))
+        finally:
+            stub.terminate()
+            stub.wait()
+
+
+def run_benchmarks(args, scenarios):
+    """
+    Benchmarks the selected scenarios and prints the results.
+    """
+    # pylint: disable=import-outside-toplevel
+    from adapter.adapters import APIManager
+    from adapter.crm_services import lead_queue
+    from adapter.web_services import purge_coalescer
+
+    names = args.only or list(scenarios)
+    print(f"{args.requests} calls per service, {args.concurrency} threads, "
+          f"stub latency {args.latency_ms:g}+/-{args.jitter_ms:g} ms, "
+          f"error rate {args.error_rate:g}")
+    print(f"{'service':<32} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'errors':>7}")
+    for name in names:
+        call = scenarios.get(name)
+        if call is None:
+            print(f"{name:<32} skipped, no scenario")
+            continue
+        duration, failed = timed_call(call, -1)
+        if failed:
+            print(f"{name:<32} skipped, warm-up call failed after {duration * 1000:.1f} ms")
+            continue
+        result = run_scenario(call, args.concurrency, args.requests)
+        print(f"{name:<32} {result['rps']:>9.1f} {result['p50']:>9.1f} {result['p95']:>9.1f} "
+              f"{result['p99']:>9.1f} {result['errors']:>7}")
+
+    if args.allocations:
+        print(f"\nallocations over {args.allocations} sequential calls")
+        print(f"{'service':<32} {'peak KiB/call':>14} {'retained KiB':>13}")
+        for name in names:
+            if name in scenarios:
+                peak, retained = measure_allocations(scenarios[name], args.allocations)
+                print(f"{name:<32} {peak:>14.1f} {retained:>13.1f}")
+
+    purge_coalescer.flush()
+    lead_queue.drain()
+    print('\nCloudflare purges:', json.dumps(purge_coalescer.stats()))
+    print('CRM lead queue:', json.dumps(lead_queue.stats(), default=str))
+    if args.stats:
+        for title, stats in (('pools', APIManager.pool_stats()),
+                             ('circuits', APIManager.circuit_stats()),
+                             ('latency', APIManager.latency_stats()),
+                             ('concurrency', APIManager.concurrency_stats())):
+            print(f"\n{title}:")
+            print(json.dumps(stats, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
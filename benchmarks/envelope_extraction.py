@@ -0,0 +1,65 @@
+"""
+Microbenchmark of SOAP envelope extraction from a raw TEBT reply.
+
+Compares the former decode/split/concatenate/encode approach with
+adapter.soap_envelope.extract_envelope on replies of several sizes.
+
+Usage:
+    python benchmarks/envelope_extraction.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adapter.soap_envelope import extract_envelope  # pylint: disable=wrong-import-position
+
+SOAP_URL_START = "<soapenv:Envelope"
+
+
+def legacy_extract(xml_res):
+    """
+    The extraction previously done in ValidSoapResponse.received.
+    """
+    answer_decoded = xml_res.decode()
+    header_split = answer_decoded.split(SOAP_URL_START)
+    header_split_msg = SOAP_URL_START + header_split[1]
+    footer_split = header_split_msg.split('</soapenv:Envelope>')
+    reply_final = footer_split[0] + '</soapenv:Envelope>'
+    return reply_final.encode()
+
+
+def make_reply(body_size, framed):
+    """
+    Builds a reply with a body of roughly body_size bytes, optionally with MIME framing.
+    """
+    rows = b''.join(b'<Row><Premium>%d</Premium></Row>' % i for i in range(body_size // 32))
+    envelope = (b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+                b'<soapenv:Body><Result>' + rows + b'</Result></soapenv:Body></soapenv:Envelope>')
+    if framed:
+        return (b'--MIMEBoundary\r\nContent-Type: text/xml\r\n\r\n' + envelope +
+                b'\r\n--MIMEBoundary--\r\n')
+    return envelope
+
+
+def main():
+    """
+    Prints the per-reply cost of both implementations.
+    """
+    print(f"{'reply':>16} {'legacy us':>10} {'new us':>10} {'speedup':>8}")
+    for size in (2_000, 50_000, 1_000_000):
+        for framed in (False, True):
+            reply = make_reply(size, framed)
+            assert legacy_extract(reply) == extract_envelope(reply)
+            number = max(10, 2_000_000 // len(reply))
+            legacy = min(timeit.repeat(lambda: legacy_extract(reply), number=number, repeat=5))
+            new = min(timeit.repeat(lambda: extract_envelope(reply), number=number, repeat=5))
+            label = f"{len(reply)}B{' framed' if framed else ''}"
+            print(f"{label:>16} {legacy / number * 1e6:10.2f} {new / number * 1e6:10.2f} "
+                  f"{legacy / new:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""
+Local stand-in for every upstream in adapter/constants.py, for offline benchmarks.
+
+Each upstream host gets its own port on 127.0.0.1, so per-host connection
+pools, circuit breakers and concurrency limits behave as they do against
+the real hosts. Every endpoint answers with a canned reply of the shape the
+adapters parse: OAuth/TEBT/Dedupe tokens, JSON APIs, SOAP replies and a WSDL
+for the TEBT quote service, base64 PDF statements, a JWKS for Apple sign-in
+and OData $batch replies for the CRM.
+
+Latency and failures can be injected for all endpoints or per constant
+name, e.g. ``--route DEDUPE_API_URL=200:0.05`` answers the Dedupe API after
+about 200 ms and fails 5% of its calls with a 503.
+
+On start the server prints one line ``READY <json>`` mapping each upstream
+base URL (scheme://host) to its local base URL.
+
+Usage:
+    python benchmarks/stub_server.py [--port 18000] [--latency-ms 20] [--jitter-ms 5]
+        [--error-rate 0] [--route NAME=LATENCY_MS[:ERROR_RATE]] [--pdf-kb 256]
+        [--apple-jwks FILE]
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TEBT_BASE_URL', 'https://tebt.invalid/')
+
+from adapter import constants  # pylint: disable=wrong-import-position
+
+SOAP_ENVELOPE = ('<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+                 '<soapenv:Body>{}</soapenv:Body></soapenv:Envelope>')
+
+QUOTE_WSDL = """<?xml version="1.0" encoding="UTF-8"?>
+<definitions name="QuoteGeneration" targetNamespace="http://stub.local/quote"
+    xmlns="http://schemas.xmlsoap.org/wsdl/" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:tns="http://stub.local/quote" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+  <types>
+    <xsd:schema targetNamespace="http://stub.local/quote" elementFormDefault="qualified">
+      <xsd:element name="getQuote">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="request" type="xsd:string"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+      <xsd:element name="getQuoteResponse">
+        <xsd:complexType><xsd:sequence>
+          <xsd:element name="quoteId" type="xsd:string"/>
+          <xsd:element name="premium" type="xsd:string"/>
+        </xsd:sequence></xsd:complexType>
+      </xsd:element>
+    </xsd:schema>
+  </types>
+  <message name="getQuoteRequest"><part name="parameters" element="tns:getQuote"/></message>
+  <message name="getQuoteResponse"><part name="parameters" element="tns:getQuoteResponse"/></message>
+  <portType name="QuotePort">
+    <operation name="getQuote">
+      <input message="tns:getQuoteRequest"/><output message="tns:getQuoteResponse"/>
+    </operation>
+  </portType>
+  <binding name="QuoteBinding" type="tns:QuotePort">
+    <soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="getQuote">
+      <soap:operation soapAction="getQuote"/>
+      <input><soap:body use="literal"/></input><output><soap:body use="literal"/></output>
+    </operation>
+  </binding>
+  <service name="QuoteService">
+    <port name="QuotePort" binding="tns:QuoteBinding"><soap:address location="{location}"/></port>
+  </service>
+</definitions>
+"""
+
+PAN_PATTERN = re.compile(r'"pannumber"\s*:\s*"([^"]*)"')
+BATCH_PART_PATTERN = re.compile(rb'^POST ', re.MULTILINE)
+
+
+def upstream_urls():
+    """
+    Returns every upstream URL constant of adapter/constants.py keyed by its name.
+    """
+    return {name: value for name, value in sorted(vars(constants).items())
+            if name.isupper() and isinstance(value, str)
+            and value.startswith(('http://', 'https://'))}
+
+
+def base_url(url):
+    """
+    Returns the scheme://host part of a URL.
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def json_reply(data, status=200, headers=None):
+    """
+    Returns a JSON reply.
+    """
+    reply_headers = {'Content-Type': 'application/json'}
+    reply_headers.update(headers or {})
+    return status, reply_headers, json.dumps(data).encode('utf-8')
+
+
+def xml_reply(text, status=200):
+    """
+    Returns an XML reply.
+    """
+    return status, {'Content-Type': 'text/xml; charset=utf-8'}, text.encode('utf-8')
+
+
+def oauth_token(request):
+    """Azure AD and receipt API token."""
+    return json_reply({'access_token': 'stub-access-token', 'token_type': 'Bearer',
+                       'expires_in': '3599'})
+
+
+def tebt_token(request):
+    """TEBT ESB token."""
+    return json_reply({'token': 'stub-tebt-token', 'expires_in': 3600})
+
+
+def dedupe_token(request):
+    """Dedupe login and refresh token."""
+    return json_reply({'data': {'token': 'stub-dedupe-token'}})
+
+
+def dedupe_customer(request):
+    """Dedupe customer lookup."""
+    return json_reply({'data': [{'customer_id': f'C000{i}', 'customer_source': source,
+                                 'phone-no': '9000000000', 'customer_first_name': 'Stub',
+                                 'date_of_birth': '19900101'}
+                                for i, source in enumerate(('HDFC', 'Exide'))]})
+
+
+def crm_lead(request):
+    """Dynamics lead creation."""
+    return 204, {'OData-EntityId': 'stub'}, b''
+
+
+def crm_batch(request):
+    """Dynamics OData $batch, answering 204 to every request of the batch."""
+    boundary = 'batchresponse_stub'
+    parts = []
+    for _ in BATCH_PART_PATTERN.finditer(request['body']):
+        parts.append(f"--{boundary}\r\nContent-Type: application/http\r\n"
+                     "Content-Transfer-Encoding: binary\r\n\r\n"
+                     "HTTP/1.1 204 No Content\r\nOData-Version: 4.0\r\n\r\n\r\n")
+    parts.append(f"--{boundary}--\r\n")
+    return (200, {'Content-Type': f'multipart/mixed; boundary={boundary}'},
+            ''.join(parts).encode('utf-8'))
+
+
+def csc_soap(request):
+    """CSC bill junction and TEBT payment SOAP service."""
+    return xml_reply(SOAP_ENVELOPE.format(
+        '<GetPolicyPremiumDetails_HealthResponse xmlns="http://www.hdfcinsurance.com/">'
+        '<GetPolicyPremiumDetails_HealthResult>SUCCESS|21000001|12500.00'
+        '</GetPolicyPremiumDetails_HealthResult></GetPolicyPremiumDetails_HealthResponse>'))
+
+
+def tebt_quote(request):
+    """TEBT quote WSDL (GET ?wsdl) and quote operation (POST)."""
+    if request['method'] == 'GET':
+        location = f"http://{request['host']}{request['path']}"
+        return xml_reply(QUOTE_WSDL.format(location=location))
+    return xml_reply(SOAP_ENVELOPE.format(
+        '<tns:getQuoteResponse xmlns:tns="http://stub.local/quote">'
+        '<tns:quoteId>Q0001</tns:quoteId><tns:premium>12500.00</tns:premium>'
+        '</tns:getQuoteResponse>'))
+
+
+def pan_validation(request):
+    """TEBT PAN validation, echoing every PAN of the request as valid."""
+    pans = PAN_PATTERN.findall(request['body'].decode('utf-8', 'replace'))
+    return json_reply({'panresp': {'pandetails': [
+        {'pannumber': pan, 'panstatus': 'E', 'name': 'STUB USER'} for pan in pans]}})
+
+
+def app_login(request):
+    """Customer portal app login."""
+    return json_reply({'head': {'status': 'success'},
+                       'body': {'clientId': 'C0001', 'sessionId': 'stub-session'}})
+
+
+def receipt_details(request):
+    """Premium receipt details."""
+    return json_reply({'head': {'status': 'success'}, 'body': {'receipts': [
+        {'receiptno': f'R{i:05d}', 'amount': '12500.00', 'date': '2024-04-01'}
+        for i in range(10)]}})
+
+
+def pdf_document(request):
+    """Receipt PDF, annual premium and unit statements, base64 encoded in JSON."""
+    return 200, {'Content-Type': 'application/json'}, request['server'].pdf_reply
+
+
+def crif_report(request):
+    """CRIF credit report."""
+    return xml_reply('<?xml version="1.0" encoding="UTF-8"?><B2C-REPORT>'
+                     '<SCORES><SCORE><SCORE-VALUE>780</SCORE-VALUE></SCORE></SCORES>'
+                     + '<LOAN-DETAILS><ACCOUNT-STATUS>Active</ACCOUNT-STATUS>'
+                       '</LOAN-DETAILS>' * 20 + '</B2C-REPORT>')
+
+
+def experian_report(request):
+    """Experian credit report."""
+    return xml_reply('<?xml version="1.0" encoding="UTF-8"?><INProfileResponse>'
+                     '<Header><SystemCode>0</SystemCode></Header>'
+                     '<SCORE><BureauScore>780</BureauScore></SCORE>'
+                     + '<CAIS_Account_DETAILS><Account_Status>11</Account_Status>'
+                       '</CAIS_Account_DETAILS>' * 20 + '</INProfileResponse>')
+
+
+def portal_token(request):
+    """My Account portal token and SSO validation."""
+    return json_reply({'head': {'status': 'success'}, 'body': {'token': 'stub-portal-token'}})
+
+
+def recaptcha(request):
+    """Google reCAPTCHA verification."""
+    return json_reply({'success': True, 'score': 0.9, 'action': 'login',
+                       'hostname': 'www.hdfclife.com'})
+
+
+def google_userinfo(request):
+    """Google OAuth user info."""
+    return json_reply({'sub': '1000', 'email': 'stub.user@example.com', 'email_verified': True})
+
+
+def facebook_userinfo(request):
+    """Facebook Graph user info."""
+    return json_reply({'id': '1000', 'name': 'Stub User', 'email': 'stub.user@example.com'})
+
+
+def apple_keys(request):
+    """Apple sign-in JWKS."""
+    return json_reply(request['server'].apple_jwks, headers={'Cache-Control': 'max-age=86400'})
+
+
+def cloudflare_purge(request):
+    """Cloudflare cache purge."""
+    return json_reply({'success': True, 'errors': [], 'messages': [], 'result': {'id': 'stub'}})
+
+
+def bankcloud(request):
+    """BankCloud order creation and fetch."""
+    return json_reply({'status': 'success', 'data': {'orderid': 'O0001', 'amount': '12500.00'}})
+
+
+def generic_json(request):
+    """Any other endpoint of a known host."""
+    return json_reply({'status': 'success'})
+
+
+ENDPOINTS = {
+    'CRM_MS_TOKEN_GEN_URL': oauth_token,
+    'CRM_LEADS_API_URL': crm_lead,
+    'MOBILE_CRM_LEADS_API_URL': crm_lead,
+    'CSC_WEB_SERVICE_URL': csc_soap,
+    'TEBT_PAYMENT_RECEPT_POSTING_URL': csc_soap,
+    'GET_TOKEN_URL': portal_token,
+    'SSO_VALIDATE_TOKEN_URL': portal_token,
+    'GENERATE_TOKEN_URL': tebt_token,
+    'CP_APP_LOGIN_URL': app_login,
+    'RECEIPT_ACCESS_TOKEN_URL': oauth_token,
+    'RECIEPT_DETAILS_URL': receipt_details,
+    'RECIEPT_PDF_URL': pdf_document,
+    'ANNUAL_PREMIUM_STATEMENT_URL': pdf_document,
+    'UNIT_STATEMENT_URL': pdf_document,
+    'CRIF_URL': crif_report,
+    'EXPERIAN_URL': experian_report,
+    'DEDUPE_GENERATE_TOKEN_URL': dedupe_token,
+    'DEDUPE_REFRESH_TOKEN_URL': dedupe_token,
+    'DEDUPE_API_URL': dedupe_customer,
+    'GOOGLE_RECAPTCHA_VERIFY_URL': recaptcha,
+    'CF_BASE_URL': cloudflare_purge,
+    'TEBT_PAN_VALIDATION': pan_validation,
+    'TEBT_GET_QUOTE_URL': tebt_quote,
+    'BANKCLOUD_GENERATE_ORDER_URL': bankcloud,
+    'BANKCLOUD_FETCH_URL': bankcloud,
+    'GOOGLE_AUTH_ENDPOINT': google_userinfo,
+    'FACEBOOK_AUTH_ENDPOINT': facebook_userinfo,
+    'APPLE_KEY_ENDPOINT': apple_keys,
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request of one stub host from its route table.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles GET requests."""
+        self._handle('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handles POST requests."""
+        self._handle('POST')
+
+    def _handle(self, method):
+        """
+        Reads the request, applies the injected latency and failures, and replies.
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        path = urlsplit(self.path).path
+        server = self.server
+        name, endpoint = server.routes.get(path, (None, generic_json))
+        if path.endswith('/$batch'):
+            name, endpoint = 'CRM_BATCH', crm_batch
+        latency, error_rate = server.options.profile(name)
+        if latency > 0:
+            time.sleep(latency)
+        if error_rate and random.random() < error_rate:
+            status, headers, reply = json_reply({'error': 'injected failure'}, status=503)
+        else:
+            status, headers, reply = endpoint({
+                'method': method, 'path': path, 'body': body, 'server': server,
+                'host': self.headers.get('Host', '')})
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keeps the benchmark output clean."""
+
+
+class StubOptions:
+    """
+    Latency and failure profile of the stub endpoints.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, routes=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.routes = routes or {}
+
+    def profile(self, name):
+        """
+        Returns the latency in seconds and the failure rate of one call to an endpoint.
+        """
+        latency_ms, error_rate = self.routes.get(name, (self.latency_ms, self.error_rate))
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        return max(latency_ms + jitter, 0) / 1000, error_rate
+
+
+def parse_route(value):
+    """
+    Parses a ``NAME=LATENCY_MS[:ERROR_RATE]`` override.
+    """
+    name, _, profile = value.partition('=')
+    latency, _, error_rate = profile.partition(':')
+    return name, (float(latency or 0), float(error_rate or 0))
+
+
+def build_pdf_reply(size_kb):
+    """
+    Builds the JSON statement reply carrying a PDF of about ``size_kb`` KiB.
+    """
+    pdf = b'%PDF-1.4\n' + os.urandom(max(size_kb, 1) * 1024) + b'\n%%EOF\n'
+    return json.dumps({'head': {'status': 'success'},
+                       'body': {'pdfbytes': base64.b64encode(pdf).decode('ascii')}}).encode()
+
+
+def start(port=18000, options=None, pdf_kb=256, apple_jwks=None):
+    """
+    Starts one stub server per upstream host on consecutive ports from ``port``.
+
+    Returns the servers and the mapping of upstream base URL to local base URL.
+    """
+    options = options or StubOptions()
+    urls = upstream_urls()
+    hosts = sorted({base_url(url) for url in urls.values()})
+    pdf_reply = build_pdf_reply(pdf_kb)
+    servers, mapping = [], {}
+    for index, host in enumerate(hosts):
+        server = ThreadingHTTPServer(('127.0.0.1', port + index), StubHandler)
+        server.daemon_threads = True
+        server.options = options
+        server.pdf_reply = pdf_reply
+        server.apple_jwks = apple_jwks or {'keys': []}
+        server.routes = {urlsplit(url).path: (name, ENDPOINTS.get(name, generic_json))
+                         for name, url in urls.items() if base_url(url) == host}
+        threading.Thread(target=server.serve_forever, name=f'stub-{host}', daemon=True).start()
+        servers.append(server)
+        mapping[host] = f"http://127.0.0.1:{port + index}"
+    return servers, mapping
+
+
+def main():
+    """
+    Starts the stub servers and serves until interrupted.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[0])
+    parser.add_argument('--port', type=int, default=18000, help='first port to listen on')
+    parser.add_argument('--latency-ms', type=float, default=0, help='latency of every reply')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='random +/- latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of calls failing with 503')
+    parser.add_argument('--route', action='append', default=[], type=parse_route,
+                        help='per endpoint override, NAME=LATENCY_MS[:ERROR_RATE]')
+    parser.add_argument('--pdf-kb', type=int, default=256, help='size of the statement PDFs')
+    parser.add_argument('--apple-jwks', help='JSON file with the JWKS served for Apple sign-in')
+    args = parser.parse_args()
+    apple_jwks = None
+    if args.apple_jwks:
+        with open(args.apple_jwks, encoding='utf-8') as jwks_file:
+            apple_jwks = json.load(jwks_file)
+    options = StubOptions(args.latency_ms, args.jitter_ms, args.error_rate, dict(args.route))
+    _, mapping = start(args.port, options, args.pdf_kb, apple_jwks)
+    print('READY ' + json.dumps(mapping), flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
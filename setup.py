@@ -19,6 +19,10 @@ setup(
         'xmltodict',
         'suds',
         'PyJWT',
+        'asgiref',
         # Add any other dependencies as needed for the project
     ],
+    extras_require={
+        'async': ['httpx'],
+    },
 )
@@ -0,0 +1,14 @@
+"""
+Shared setup of the unit tests.
+
+The tests cover modules that can run without upstreams. adapter.constants
+reads TEBT_BASE_URL at import time, so a placeholder is set when the
+environment has none. Tests of modules importing Django or shared_config are
+skipped where those are not installed.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TEBT_BASE_URL', 'https://tebt.invalid/')
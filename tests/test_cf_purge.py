@@ -0,0 +1,144 @@
+"""
+Tests of the Cloudflare purge coalescer.
+"""
+
+import time
+
+import pytest
+
+pytest.importorskip('shared_config')
+
+from adapter import cf_purge  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import constants as config  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class Reply:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class Upstream:
+    """Records purge bodies and replies with the status chosen for each."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.bodies = []
+
+    def __call__(self, body):
+        self.bodies.append(body)
+        return self.reply(body)
+
+
+@pytest.fixture(autouse=True)
+def purge_config(monkeypatch):
+    monkeypatch.setattr(config, 'CF_PURGE_CALL', True)
+    monkeypatch.setattr(config, 'CF_PURGE_WINDOW', 60)
+    monkeypatch.setattr(config, 'CF_PURGE_MAX_BATCH', 4)
+
+
+@pytest.fixture
+def coalescers():
+    created = []
+    yield created
+    for coalescer in created:
+        with coalescer._lock:  # pylint: disable=protected-access
+            coalescer._take_batches()  # pylint: disable=protected-access
+
+
+def make(coalescers, reply):
+    upstream = Upstream(reply)
+    coalescer = cf_purge.PurgeCoalescer(upstream)
+    coalescers.append(coalescer)
+    return coalescer, upstream
+
+
+def test_duplicates_are_sent_once(coalescers):
+    coalescer, upstream = make(coalescers, lambda body: Reply(200))
+
+    coalescer.add(files=['https://a/x', 'https://a/y'])
+    coalescer.add(files=['https://a/x', {'url': 'https://a/z', 'headers': {'Origin': 'o'}}])
+    coalescer.flush()
+
+    assert len(upstream.bodies) == 1
+    assert len(upstream.bodies[0]['files']) == 3
+    assert coalescer.stats()['duplicates'] == 1
+
+
+def test_client_error_splits_the_batch_to_isolate_bad_items(coalescers):
+    def reply(body):
+        return Reply(400 if 'https://a/bad' in body['files'] else 200)
+
+    coalescer, upstream = make(coalescers, reply)
+    coalescer.add(files=['https://a/1', 'https://a/bad', 'https://a/2'])
+    coalescer.flush()
+
+    purged = sorted(file for body in upstream.bodies if reply(body).status_code == 200
+                    for file in body['files'])
+    assert purged == ['https://a/1', 'https://a/2']
+    assert {'files': ['https://a/bad']} in upstream.bodies
+    stats = coalescer.stats()
+    assert stats['failed'] == 1
+    assert stats['files'] == 0
+
+
+def test_auth_errors_fail_the_batch_without_splitting(coalescers):
+    coalescer, upstream = make(coalescers, lambda body: Reply(403))
+
+    coalescer.add(files=[f'https://a/{index}' for index in range(4)])
+    coalescer.flush()
+
+    assert len(upstream.bodies) == 1
+    assert coalescer.stats()['failed'] == 4
+
+
+def test_rate_limit_stops_the_flush_and_keeps_unsent_items(coalescers):
+    coalescer, upstream = make(coalescers, lambda body: Reply(429, {'Retry-After': '30'}))
+
+    coalescer.add(files=[f'https://a/{index}' for index in range(10)], tags=['product'])
+    coalescer.flush()
+
+    assert len(upstream.bodies) == 1
+    stats = coalescer.stats()
+    assert (stats['files'], stats['tags'], stats['failed']) == (10, 1, 0)
+    assert coalescer._due_at >= time.monotonic() + 29  # pylint: disable=protected-access
+    assert coalescer._attempts == dict.fromkeys(upstream.bodies[0]['files'], 1)  # pylint: disable=protected-access
+
+
+def test_retry_after_delays_a_sooner_flush(coalescers):
+    coalescer, upstream = make(coalescers, lambda body: Reply(429, {'Retry-After': '120'}))
+
+    coalescer.add(files=['https://a/1'])
+    coalescer.flush()
+    assert coalescer.stats()['files'] == 1
+
+    coalescer.add(files=[f'https://a/{index}' for index in range(2, 6)])
+
+    assert coalescer._due_at >= time.monotonic() + 119  # pylint: disable=protected-access
+    assert len(upstream.bodies) == 1
+
+
+def test_full_batch_is_sent_before_the_window_ends(coalescers):
+    coalescer, upstream = make(coalescers, lambda body: Reply(200))
+
+    coalescer.add(files=['https://a/1'])
+    due_at = coalescer._due_at  # pylint: disable=protected-access
+    coalescer.add(files=[f'https://a/{index}' for index in range(2, 5)])
+
+    assert coalescer._due_at < due_at  # pylint: disable=protected-access
+    deadline = time.monotonic() + 5
+    while not upstream.bodies and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(upstream.bodies[0]['files']) == 4
+
+
+def test_retryable_failures_give_up_after_max_attempts(coalescers):
+    coalescer, upstream = make(coalescers, lambda body: Reply(503))
+
+    coalescer.add(tags=['product'])
+    for _ in range(config.CF_PURGE_MAX_ATTEMPTS):
+        coalescer.flush()
+
+    assert len(upstream.bodies) == config.CF_PURGE_MAX_ATTEMPTS
+    assert coalescer.stats()['tags'] == 0
+    assert coalescer.stats()['failed'] == 1
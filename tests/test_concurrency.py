@@ -0,0 +1,83 @@
+"""
+Tests of the adaptive concurrency limiter.
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip('shared_config')
+
+from adapter import constants as config  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import concurrency  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class Clock:
+    """Monotonic clock advanced by the test."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_calls(limiter, clock, replies):
+    """Sends one call at a time, each taking its latency and ending with its status."""
+    for latency, status_code in replies:
+        ticket = limiter.try_acquire()
+        assert ticket is not None
+        clock.now += latency
+        limiter.release(ticket, status_code < 500, 'Service', status_code)
+        clock.now += 0.001
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(concurrency.time, 'monotonic', fake)
+    return fake
+
+
+def healthy_replies(rng, count):
+    """Replies of 250-350 ms, 2% of them fast 10 ms 4xx rejections."""
+    return [(0.01, 404) if rng.random() < 0.02 else (rng.uniform(0.25, 0.35), 200)
+            for _ in range(count)]
+
+
+def test_fast_client_errors_do_not_collapse_the_limit(clock):
+    limiter = concurrency.ConcurrencyLimiter('upstream.invalid')
+
+    run_calls(limiter, clock, healthy_replies(random.Random(1), 1000))
+
+    assert limiter.limit == config.CONCURRENCY_INITIAL_LIMIT
+
+
+def test_slowdown_after_baseline_decreases_the_limit(clock):
+    limiter = concurrency.ConcurrencyLimiter('upstream.invalid')
+    run_calls(limiter, clock, healthy_replies(random.Random(2), 200))
+
+    run_calls(limiter, clock, [(1.5, 200)])
+
+    assert limiter.limit == pytest.approx(
+        config.CONCURRENCY_INITIAL_LIMIT * config.CONCURRENCY_BACKOFF)
+
+
+def test_server_errors_decrease_the_limit_without_a_baseline(clock):
+    limiter = concurrency.ConcurrencyLimiter('upstream.invalid')
+
+    run_calls(limiter, clock, [(0.3, 503)])
+
+    assert limiter.limit == pytest.approx(
+        config.CONCURRENCY_INITIAL_LIMIT * config.CONCURRENCY_BACKOFF)
+
+
+def test_bulk_calls_leave_the_interactive_reserve(clock):
+    limiter = concurrency.ConcurrencyLimiter('upstream.invalid')
+    reserve = int(config.CONCURRENCY_INITIAL_LIMIT * config.CONCURRENCY_INTERACTIVE_RESERVE)
+
+    bulk = [limiter.try_acquire(concurrency.PRIORITY_BULK)
+            for _ in range(config.CONCURRENCY_INITIAL_LIMIT)]
+
+    assert bulk.count(None) == reserve
+    assert limiter.try_acquire(concurrency.PRIORITY_INTERACTIVE) is not None
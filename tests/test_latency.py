@@ -0,0 +1,62 @@
+"""
+Tests of the rolling latency histogram and adaptive timeouts.
+"""
+
+import pytest
+
+from adapter import constants as config
+from adapter import latency
+from adapter.latency import LatencyTracker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(latency.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_percentile_needs_min_samples(clock):
+    tracker = LatencyTracker('Service')
+    for _ in range(config.LATENCY_MIN_SAMPLES - 1):
+        tracker.record(0.2)
+    assert tracker.percentile(50) is None
+    tracker.record(0.2)
+    assert tracker.percentile(50) == pytest.approx(0.2, rel=config.LATENCY_BUCKET_RATIO - 1)
+
+
+def test_percentiles_follow_the_distribution(clock):
+    tracker = LatencyTracker('Service')
+    for index in range(1, 101):
+        tracker.record(index / 100)
+
+    for percent in (10, 50, 99):
+        assert tracker.percentile(percent) == pytest.approx(
+            percent / 100, rel=config.LATENCY_BUCKET_RATIO - 1)
+
+
+def test_old_generations_are_dropped(clock):
+    tracker = LatencyTracker('Service')
+    for _ in range(config.LATENCY_MIN_SAMPLES):
+        tracker.record(1.0)
+
+    clock[0] += config.LATENCY_WINDOW
+    assert tracker.percentile(50) is not None
+    clock[0] += config.LATENCY_WINDOW
+    assert tracker.percentile(50) is None
+
+
+def test_timeout_is_bounded_by_the_ceiling_and_minimum(clock):
+    tracker = LatencyTracker('Service')
+    assert tracker.timeout((3, 30)) == (config.LATENCY_CONNECT_TIMEOUT, 30)
+    assert tracker.timeout(None) is None
+
+    for _ in range(config.LATENCY_MIN_SAMPLES):
+        tracker.record(0.05)
+    connect, read = tracker.timeout(30)
+    assert read == config.LATENCY_READ_TIMEOUT_MIN
+    assert connect == min(config.LATENCY_CONNECT_TIMEOUT, read)
+
+    for _ in range(config.LATENCY_MIN_SAMPLES * 10):
+        tracker.record(20)
+    assert tracker.timeout(30) == (config.LATENCY_CONNECT_TIMEOUT, 30)
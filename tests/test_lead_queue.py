@@ -0,0 +1,138 @@
+"""
+Tests of the CRM lead spool and the OData $batch helpers.
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+for module in ('shared_config', 'requests', 'django'):
+    pytest.importorskip(module)
+
+from adapter import constants as config  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import lead_queue  # noqa: E402  pylint: disable=wrong-import-position
+from adapter.lead_queue import DONE, FAILED, PENDING, LeadSpool  # noqa: E402  pylint: disable=wrong-import-position
+
+LEAD = {'name': 'Asha', 'mobile': '9000000000'}
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return LeadSpool(str(tmp_path / 'spool' / 'leads.sqlite3'))
+
+
+def rows(spool):
+    connection = sqlite3.connect(spool.path)
+    try:
+        return connection.execute(
+            'SELECT status, attempts, claimed_until FROM crm_lead ORDER BY id').fetchall()
+    finally:
+        connection.close()
+
+
+def age(spool, seconds):
+    """Moves the last update of every lead ``seconds`` into the past."""
+    connection = sqlite3.connect(spool.path)
+    try:
+        connection.execute('UPDATE crm_lead SET updated_at = updated_at - ?', (seconds,))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def test_put_drops_duplicates_of_pending_leads(spool):
+    assert spool.put('crm', LEAD)
+    assert not spool.put('crm', dict(reversed(list(LEAD.items()))))
+    assert spool.put('mobile', LEAD)
+    assert spool.stats() == {PENDING: 2, DONE: 0, FAILED: 0}
+
+
+def test_claim_hides_leads_until_the_claim_times_out(spool):
+    spool.put('crm', LEAD)
+
+    kind, leads = spool.claim(10)
+    assert kind == 'crm' and len(leads) == 1
+    assert spool.claim(10) == (None, [])
+
+    connection = sqlite3.connect(spool.path)
+    connection.execute('UPDATE crm_lead SET claimed_until = ?', (time.time() - 1,))
+    connection.commit()
+    connection.close()
+    assert spool.claim(10)[1] == leads
+
+
+def test_submitted_leads_are_deduplicated_within_the_window(spool):
+    spool.put('crm', LEAD)
+    _, leads = spool.claim(10)
+    spool.complete([leads[0][0]])
+
+    assert not spool.put('crm', LEAD)
+    assert rows(spool) == [(DONE, 0, 0)]
+
+    age(spool, config.CRM_LEAD_DEDUPE_WINDOW + 1)
+    assert spool.put('crm', LEAD)
+    assert rows(spool) == [(PENDING, 0, 0)]
+
+
+def test_reject_retries_until_out_of_attempts(spool):
+    spool.put('crm', LEAD)
+    _, leads = spool.claim(10)
+
+    spool.reject(leads, 'Batch rejected with 503')
+    assert rows(spool) == [(PENDING, 1, 0)]
+    assert spool.claim(10) == (None, [])
+
+    lead_id, payload, _ = leads[0]
+    spool.reject([(lead_id, payload, config.CRM_LEAD_MAX_ATTEMPTS - 1)], 'Timed out')
+    assert rows(spool)[0][:2] == (FAILED, config.CRM_LEAD_MAX_ATTEMPTS)
+
+
+def test_failed_leads_can_be_enqueued_again(spool):
+    spool.put('crm', LEAD)
+    _, leads = spool.claim(10)
+    spool.fail([leads[0][0]], 'Lead rejected by CRM')
+
+    assert spool.put('crm', LEAD)
+    assert rows(spool) == [(PENDING, 0, 0)]
+    assert spool.claim(10)[1][0][0] == leads[0][0]
+
+
+def test_purge_removes_old_submitted_and_failed_leads(spool):
+    for index in range(3):
+        spool.put('crm', {'index': index})
+    _, leads = spool.claim(10)
+    spool.complete([leads[0][0]])
+    spool.fail([leads[1][0]], 'Lead rejected by CRM')
+
+    age(spool, config.CRM_LEAD_DEDUPE_WINDOW + 1)
+    spool.purge()
+    assert spool.stats() == {PENDING: 1, DONE: 0, FAILED: 1}
+
+    age(spool, config.CRM_LEAD_FAILED_RETENTION)
+    spool.purge()
+    assert spool.stats() == {PENDING: 1, DONE: 0, FAILED: 0}
+
+
+class BatchReply:
+    """$batch reply with a multipart body."""
+
+    def __init__(self, boundary, statuses):
+        self.headers = {'Content-Type': f'multipart/mixed; boundary={boundary}'}
+        parts = [f'--{boundary}\r\nContent-Type: application/http\r\n\r\n'
+                 f'HTTP/1.1 {status} Reason\r\n\r\n' for status in statuses]
+        self.content = (''.join(parts) + f'--{boundary}--\r\n').encode('ascii')
+
+
+def test_build_batch_posts_each_payload_separately():
+    body = lead_queue.build_batch('b1', '/api/data/v9.2/leads', ['{"a":1}', '{"b":2}'])
+
+    assert body.count(b'POST /api/data/v9.2/leads HTTP/1.1') == 2
+    assert b'changeset' not in body
+    assert body.endswith(b'--b1--\r\n')
+
+
+def test_parse_batch_statuses_reads_every_part_in_order():
+    reply = BatchReply('batchresponse_1', [204, 400, 503])
+
+    assert lead_queue.parse_batch_statuses(reply) == [204, 400, 503]
@@ -0,0 +1,43 @@
+"""
+Tests of the bounded in-process cache.
+"""
+
+from adapter import lru
+from adapter.lru import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c'), len(cache)) == (1, 3, 2)
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lru.time, 'time', lambda: now[0])
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set('default', 1)
+    cache.set('short', 2, ttl=5)
+
+    now[0] += 10
+    assert cache.get('short', 'missing') == 'missing'
+    assert cache.get('default') == 1
+    now[0] += 60
+    assert cache.get('default') is None
+    assert len(cache) == 0
+
+
+def test_delete_and_clear():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.delete('a')
+    cache.delete('missing')
+    assert cache.get('a') is None and len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,31 @@
+"""
+Tests of which receipt and statement replies may be cached.
+"""
+
+import json
+
+import pytest
+
+for module in ('shared_config', 'requests', 'django'):
+    pytest.importorskip(module)
+
+from adapter.policy_services import vendor_reply_succeeded  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class Reply:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+
+
+@pytest.mark.parametrize('reply, valid', [
+    (Reply(200, {'head': {'status': 'success'}, 'body': {}}), True),
+    (Reply(200, {'head': {'status': 'SUCCESS'}}), True),
+    (Reply(200, {'head': {'status': 'failure', 'message': 'Service unavailable'}}), False),
+    (Reply(200, {'body': {}}), False),
+    (Reply(200, [1, 2]), False),
+    (Reply(200, b'<html/>'), False),
+    (Reply(503, {'head': {'status': 'success'}}), False),
+])
+def test_only_successful_vendor_replies_are_cached(reply, valid):
+    assert vendor_reply_succeeded(reply) is valid
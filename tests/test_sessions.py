@@ -0,0 +1,124 @@
+"""
+Tests of how upstream replies are judged by the pooled sessions.
+"""
+
+import pytest
+
+for module in ('shared_config', 'requests', 'django'):
+    pytest.importorskip(module)
+
+from adapter import constants as config  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import latency  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import sessions  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import streaming  # noqa: E402  pylint: disable=wrong-import-position
+
+FAULT = (b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+         b'<soap:Fault><faultcode>soap:Client</faultcode>'
+         b'<faultstring>Invalid policy number</faultstring></soap:Fault>'
+         b'</soap:Body></soap:Envelope>')
+
+
+class Reply:
+    def __init__(self, status_code, content=b'', content_type='text/xml; charset=utf-8'):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'Content-Type': content_type}
+
+
+@pytest.mark.parametrize('reply, stream, failure', [
+    (Reply(200), False, False),
+    (Reply(404, b'<html/>', 'text/html'), False, False),
+    (Reply(500, FAULT), False, False),
+    (Reply(500, FAULT, 'application/soap+xml'), True, False),
+    (Reply(500, b'<html>Internal error</html>', 'text/html'), False, True),
+    (Reply(500, b'<error>Gateway</error>'), False, True),
+    (Reply(502, FAULT), False, True),
+    (Reply(503, b''), True, True),
+])
+def test_is_failure_treats_soap_faults_as_healthy(reply, stream, failure):
+    assert sessions.is_failure(reply, stream=stream) is failure
+
+
+def test_timeouts_are_recorded_at_the_read_timeout(monkeypatch):
+    monkeypatch.setattr(config, 'CONCURRENCY_LIMIT_ENABLED', False)
+    monkeypatch.setattr(config, 'CIRCUIT_BREAKER_ENABLED', False)
+    service = 'TimingOutService'
+    for _ in range(config.LATENCY_MIN_SAMPLES):
+        latency.record(service, 0.05)
+    _, read = latency.adaptive_timeout(service, 30)
+    assert read == config.LATENCY_READ_TIMEOUT_MIN
+
+    for timed_out in (True, True, False):
+        call = sessions._Call('https://upstream/x', service, (3, read))  # pylint: disable=protected-access
+        call.start()
+        call.failed(timed_out=timed_out)
+
+    tracker = latency.get_tracker(service)
+    assert tracker.samples() == config.LATENCY_MIN_SAMPLES + 2
+    assert latency.adaptive_timeout(service, 30)[1] > read
+
+
+class StreamedReply:
+    """Streamed reply yielding its chunks, then raising ``error`` if set."""
+
+    def __init__(self, status_code=200, error=None):
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json'}
+        self.error = error
+
+    def iter_content(self, chunk_size=None):
+        yield b'ab'
+        yield b'cd'
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        pass
+
+
+class Call:
+    def __init__(self):
+        self.outcome = None
+
+    def finished(self, status_code, failure):
+        self.outcome = ('finished', status_code, failure)
+
+    def failed(self):
+        self.outcome = ('failed',)
+
+    def abandoned(self):
+        self.outcome = ('abandoned',)
+
+
+def stream(reply):
+    call = Call()
+    sessions._finish_on_close(reply, call)  # pylint: disable=protected-access
+    return streaming.iter_response(reply), call
+
+
+def test_streamed_call_read_in_full_is_finished():
+    chunks, call = stream(StreamedReply())
+    assert b''.join(chunks) == b'abcd'
+    assert call.outcome == ('finished', 200, False)
+
+
+def test_streamed_call_whose_read_raises_is_failed():
+    chunks, call = stream(StreamedReply(error=OSError('reset')))
+    with pytest.raises(OSError):
+        list(chunks)
+    assert call.outcome == ('failed',)
+
+
+def test_streamed_call_given_up_early_is_abandoned():
+    chunks, call = stream(StreamedReply())
+    next(chunks)
+    chunks.close()
+    assert call.outcome == ('abandoned',)
+
+
+def test_error_reply_closed_unread_is_finished():
+    reply = StreamedReply(503)
+    call = Call()
+    sessions._finish_on_close(reply, call)  # pylint: disable=protected-access
+    reply.close()
+    assert call.outcome == ('finished', 503, True)
@@ -0,0 +1,26 @@
+"""
+Tests of SOAP envelope extraction.
+"""
+
+from adapter.soap_envelope import extract_envelope
+
+ENVELOPE = (b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+            b'<soapenv:Body><r>1</r></soapenv:Body></soapenv:Envelope>')
+
+
+def test_bare_envelope_is_returned_as_is():
+    assert extract_envelope(ENVELOPE) is ENVELOPE
+
+
+def test_transport_framing_is_sliced_off():
+    reply = b'--uuid:1\r\nContent-Type: text/xml\r\n\r\n' + ENVELOPE + b'\r\n--uuid:1--'
+    assert extract_envelope(reply) == ENVELOPE
+
+
+def test_soap_prefix_and_missing_end_tag():
+    assert extract_envelope(b'junk<soap:Envelope><soap:Body/>') == \
+        b'<soap:Envelope><soap:Body/></soap:Envelope>'
+
+
+def test_reply_without_envelope_is_unchanged():
+    assert extract_envelope(b'<html>Bad gateway</html>') == b'<html>Bad gateway</html>'
@@ -0,0 +1,107 @@
+"""
+Tests of the incremental SOAP reply parser.
+"""
+
+import pytest
+
+pytest.importorskip('requests')
+
+from adapter import responses, soap_parser  # noqa: E402  pylint: disable=wrong-import-position
+
+FAULT_REPLY = (
+    b'<?xml version="1.0"?>'
+    b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+    b'<soap:Fault><faultcode>soap:Server</faultcode>'
+    b'<faultstring>Policy not found</faultstring></soap:Fault>'
+    b'</soap:Body></soap:Envelope>'
+)
+
+
+REPLY = (
+    b'\xef\xbb\xbf\r\n<?xml version="1.0"?>'
+    b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"><s:Body>'
+    b'<GetPolicyPremiumDetails_HealthResponse xmlns="http://tempuri.org/">'
+    b'<Result><Premium>1200</Premium><Rider>A</Rider><Rider>B</Rider></Result>'
+    b'<Noise><Premium>0</Premium></Noise>'
+    b'</GetPolicyPremiumDetails_HealthResponse></s:Body></s:Envelope>'
+)
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 3, 16, 4096])
+def test_parse_fields_keeps_only_the_wanted_elements(size):
+    assert soap_parser.parse_fields(chunked(REPLY, size), ('Result',)) == {
+        'Result': {'Premium': '1200', 'Rider': ['A', 'B']}}
+
+
+def test_parse_fields_collects_repeated_leaves():
+    assert soap_parser.parse_fields([REPLY], ('Premium',)) == {'Premium': ['1200', '0']}
+
+
+@pytest.mark.parametrize('content, fault', [
+    (FAULT_REPLY, True),
+    (b'<Envelope><Body><Fault/></Body></Envelope>', True),
+    (REPLY, False),
+    (b'<Body><FaultCount>0</FaultCount></Body>', False),
+])
+def test_is_soap_fault(content, fault):
+    assert responses.is_soap_fault(content) is fault
+
+
+class FakeResponse:
+    """Streamed reply returning its body in small chunks."""
+
+    def __init__(self, status_code, content, content_type):
+        self.status_code = status_code
+        self.headers = {'Content-Type': content_type}
+        self.content = content
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        for start in range(0, len(self.content), 7):
+            yield self.content[start:start + 7]
+
+    def close(self):
+        self.closed = True
+
+    def raise_for_status(self):
+        raise RuntimeError(self.status_code)
+
+
+class FaultService(soap_parser.SoapFieldsMixin):
+    response_fields = ('Result',)
+
+    def prepare_request(self, *args):
+        return {'method': 'POST', 'url': 'https://soap.invalid/'}
+
+
+def test_fetch_fields_parses_soap_fault_of_500_reply(monkeypatch):
+    response = FakeResponse(500, FAULT_REPLY, 'text/xml; charset=utf-8')
+    monkeypatch.setattr(soap_parser.sessions, 'request', lambda **kwargs: response)
+
+    assert FaultService().fetch_fields() == {
+        'faultcode': 'soap:Server', 'faultstring': 'Policy not found'}
+    assert response.closed
+
+
+@pytest.mark.parametrize('status_code, content_type', [
+    (500, 'text/html'), (502, 'text/xml'), (404, 'application/soap+xml')])
+def test_fetch_fields_raises_for_other_errors(monkeypatch, status_code, content_type):
+    response = FakeResponse(status_code, b'<html/>', content_type)
+    monkeypatch.setattr(soap_parser.sessions, 'request', lambda **kwargs: response)
+
+    with pytest.raises(RuntimeError):
+        FaultService().fetch_fields()
+    assert response.closed
+
+
+def test_fetch_fields_closes_the_response_on_malformed_xml(monkeypatch):
+    response = FakeResponse(200, b'<Envelope><Body><Result>1</Body></Envelope>', 'text/xml')
+    monkeypatch.setattr(soap_parser.sessions, 'request', lambda **kwargs: response)
+
+    with pytest.raises(soap_parser.ParseError):
+        FaultService().fetch_fields()
+    assert response.closed
@@ -0,0 +1,60 @@
+"""
+Tests of incremental base64 decoding of streamed JSON replies.
+"""
+
+import base64
+import json
+
+import pytest
+
+pytest.importorskip('requests')
+
+from adapter.streaming import Base64FieldDecoder, iter_base64_field, stream_to_file  # noqa: E402  pylint: disable=wrong-import-position
+
+DOCUMENT = bytes(range(256)) * 3
+
+
+def reply_body(document=DOCUMENT):
+    """JSON reply escaping '/' as the .NET serializers do."""
+    encoded = base64.b64encode(document).decode('ascii')
+    body = json.dumps({'status': 'ok', 'PdfContent': encoded, 'trailer': 'x'})
+    return body.replace('/', '\\/').encode('ascii')
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 7, 64, 4096])
+def test_document_decodes_whatever_the_chunk_boundaries(size):
+    body = reply_body()
+    assert b'\\/' in body
+    assert b''.join(iter_base64_field(chunked(body, size), 'PdfContent')) == DOCUMENT
+
+
+def test_line_breaks_inside_the_value_are_skipped():
+    encoded = base64.encodebytes(DOCUMENT).decode('ascii')
+    body = json.dumps({'PdfContent': encoded}).encode('ascii')
+    assert b'\\n' in body
+    assert b''.join(iter_base64_field(chunked(body, 10), 'PdfContent')) == DOCUMENT
+
+
+def test_missing_or_truncated_field_raises():
+    with pytest.raises(ValueError):
+        list(iter_base64_field([b'{"other": "AAAA"}'], 'PdfContent'))
+    with pytest.raises(ValueError):
+        list(iter_base64_field([reply_body()[:60]], 'PdfContent'))
+
+
+def test_text_after_the_field_is_ignored():
+    decoder = Base64FieldDecoder('PdfContent')
+    decoded = decoder.feed(b'{"PdfContent": "YWJj"}')
+    assert decoded == b'abc'
+    assert decoder.feed(b'{"PdfContent": "ZGVm"}') == b''
+    decoder.close()
+
+
+def test_stream_to_file_writes_every_chunk(tmp_path):
+    destination = tmp_path / 'document.pdf'
+    assert stream_to_file([b'ab', b'', b'cd'], str(destination)) == 4
+    assert destination.read_bytes() == b'abcd'
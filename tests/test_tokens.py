@@ -0,0 +1,83 @@
+"""
+Tests of the cross-worker token fetch lock.
+"""
+
+import threading
+import time
+
+import pytest
+
+for module in ('shared_config', 'requests', 'django'):
+    pytest.importorskip(module)
+
+from shared_config.exceptions import GenericException  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import constants as config  # noqa: E402  pylint: disable=wrong-import-position
+from adapter import tokens  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class Cache:
+    """A shared in-memory stand-in for a Django cache, ignoring timeouts."""
+
+    def __init__(self):
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if key in self.values:
+                return False
+            self.values[key] = value
+            return True
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    shared = Cache()
+    monkeypatch.setattr(tokens, 'caches', {'tokens': shared})
+    monkeypatch.setattr(config, 'TOKEN_LOCK_POLL_INTERVAL', 0.01)
+    return shared
+
+
+def test_one_waiter_takes_over_a_released_lock(cache):
+    calls = []
+
+    def fetch():
+        calls.append(True)
+        time.sleep(0.1)
+        return 'token'
+
+    source = tokens.TokenSource('T', fetch, cache_alias='tokens')
+    cache.add('T:lock', 'failed-worker')
+    results = []
+    # One manager per thread, as each stands for a separate worker process.
+    workers = [threading.Thread(target=lambda: results.append(tokens.TokenManager().fetch_token(source)))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.05)
+    cache.delete('T:lock')
+    for worker in workers:
+        worker.join(5)
+
+    assert len(calls) == 1
+    assert results == ['token'] * 4
+
+
+def test_wait_is_capped_by_the_source_wait_timeout(cache):
+    source = tokens.TokenSource('T', lambda: 'token', cache_alias='tokens', wait_timeout=0.2)
+    cache.add('T:lock', 'stuck-worker')
+
+    started = time.monotonic()
+    with pytest.raises(GenericException):
+        tokens.TokenManager().fetch_token(source)
+
+    assert time.monotonic() - started < 1
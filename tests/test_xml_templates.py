@@ -0,0 +1,60 @@
+"""
+Tests of the precompiled XML envelope templates.
+"""
+
+import re
+from xml.etree import ElementTree
+
+from adapter import constants as config
+from adapter.xml_templates import XmlTemplate, escape_text
+
+UNSAFE_NAME = "A & <B> ]]> O'Neil \"Jr\""
+
+
+def test_escape_text_escapes_markup_and_quotes():
+    assert escape_text(UNSAFE_NAME) == \
+        "A &amp; &lt;B&gt; ]]&gt; O&apos;Neil &quot;Jr&quot;"
+
+
+def test_render_escapes_every_slot():
+    template = XmlTemplate('<a k="{attr}"><b>{text}</b></a>')
+    rendered = template.render(attr='"x" & y', text='<z>')
+    root = ElementTree.fromstring(rendered)
+    assert root.get('k') == '"x" & y'
+    assert root.find('b').text == '<z>'
+
+
+def test_render_none_as_empty_and_missing_slot_raises():
+    template = XmlTemplate('<a>{value}</a>')
+    assert template.render(value=None) == b'<a></a>'
+    try:
+        template.render()
+    except KeyError as e:
+        assert e.args == ('value',)
+    else:
+        raise AssertionError('missing slot did not raise')
+
+
+def test_bind_fills_slots_once():
+    template = XmlTemplate('<a><u>{user}</u><n>{name}</n></a>').bind(user='me & you')
+    assert template.slot_names == {'name'}
+    assert template.render_text(name='x') == '<a><u>me &amp; you</u><n>x</n></a>'
+
+
+def test_from_printf_names_placeholders_in_order():
+    template = XmlTemplate.from_printf('<a>%s</a><b>%s</b>', ('first', 'second'))
+    assert template.render_text(first=1, second='<2>') == '<a>1</a><b>&lt;2&gt;</b>'
+
+
+def test_experian_template_keeps_inner_request_well_formed():
+    template = XmlTemplate(config.EXPERIAN_REQUEST_XML).bind(user='user', password='p&ss')
+    rendered = template.render(name=UNSAFE_NAME, mobile='9000000000')
+
+    envelope = ElementTree.fromstring(rendered)
+    cbv2 = envelope.find('.//{http://nextgenws.ngwsconnect.experian.com}cbv2String')
+    inner = re.search(r'<INProfileRequest>.*</INProfileRequest>', cbv2.text, re.S).group(0)
+
+    request = ElementTree.fromstring(inner)
+    assert request.find('Applicant/FirstName').text == UNSAFE_NAME
+    assert request.find('Identification/XMLPassword').text == 'p&ss'
+    assert request.find('Applicant/MobilePhone').text == '9000000000'